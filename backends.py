@@ -0,0 +1,296 @@
+import functools
+import http.client
+import json
+import os
+import threading
+import urllib.parse
+
+import database
+import services
+import stock
+
+# Accès aux données pour l'interface : directement sur magasin.db (DirectBackend)
+# ou via le serveur HTTP/JSON de serveur.py (HttpBackend), selon la variable
+# d'environnement MAGASIN_SERVEUR (ex. http://192.168.1.10:8765).
+#
+# Les « requêtes » (search_request, history_request) sont soit un couple (sql, params),
+# exécuté sur le pool avec annulation possible, soit un appel sans argument.
+
+SERVER_ENV = "MAGASIN_SERVEUR"
+TOKEN_ENV = "MAGASIN_JETON"
+TOKEN_HEADER = "X-Jeton"
+DOWNLOAD_CHUNK = 64 * 1024
+RETRY_METHODS = ("GET", "HEAD")   # requêtes renvoyées sans risque après une coupure
+
+
+class ServerError(RuntimeError):
+    pass
+
+
+def execute_request(request):
+    """Exécute une requête de backend de façon synchrone et renvoie les lignes."""
+    if callable(request):
+        return request()
+    query, params = request
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+class DirectBackend:
+    """Accès direct à la base locale (ou partagée) : délègue à services."""
+    remote = False
+
+    init = staticmethod(database.init_db)
+    search_mode = staticmethod(services.search_mode)
+    search_products = staticmethod(services.search_products)
+    low_stock = staticmethod(services.low_stock)
+    has_products = staticmethod(services.has_products)
+    add_product = staticmethod(services.add_product)
+    update_product = staticmethod(services.update_product)
+    delete_product = staticmethod(services.delete_product)
+    stock_at = staticmethod(services.stock_at)
+    affecter = staticmethod(services.affecter)
+    affecter_lot = staticmethod(services.affecter_lot)
+    history_page = staticmethod(services.history_page)
+    history_exists = staticmethod(services.history_exists)
+    change_seq = staticmethod(services.change_seq)
+    changes_since = staticmethod(services.changes_since)
+    consumption = staticmethod(services.consumption)
+    rebuild_aggregates = staticmethod(services.rebuild_aggregates)
+    inventory_at = staticmethod(services.inventory_at)
+    import_file = staticmethod(services.import_file)
+    export = staticmethod(services.export)
+
+    @staticmethod
+    def search_request(text="", nature=None, mode=None):
+        import queries
+        return queries.product_search_query(text, nature, mode)
+
+    @staticmethod
+    def history_request(filters, start_key=None, limit=200):
+        import queries
+        return queries.history_page_query(services.history_filters(filters), start_key, limit)
+
+
+class HttpBackend:
+    """Client du serveur d'inventaire : une connexion HTTP persistante par thread."""
+    remote = True
+
+    def __init__(self, url, token=None, timeout=60):
+        parts = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+        self.url = f"{parts.scheme}://{parts.netloc}"
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # --- Transport ---
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _send(self, method, path, params=None, body=None, headers=None):
+        url = path
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = dict(headers or {})
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # Connexion persistante fermée par le serveur entre deux requêtes : une seule reprise,
+                # et seulement pour une lecture. Une écriture (affectation, import) a pu être
+                # appliquée avant la coupure : la renvoyer l'enregistrerait deux fois.
+                conn.close()
+                self._local.conn = None
+                if attempt or method not in RETRY_METHODS:
+                    raise ServerError(f"Connexion au serveur {self.url} interrompue.")
+            except OSError as e:
+                conn.close()
+                self._local.conn = None
+                raise ServerError(f"Serveur {self.url} injoignable : {e}")
+
+    def _call(self, method, path, params=None, body=None, headers=None):
+        resp = self._send(method, path, params, body, headers)
+        payload = resp.read()
+        data = json.loads(payload) if payload else None
+        if resp.status >= 400:
+            self._raise(resp.status, data)
+        return data
+
+    @staticmethod
+    def _raise(status, data):
+        data = data or {}
+        message = data.get("erreur") or f"Erreur serveur ({status})"
+        kind = data.get("type")
+        if kind == "StocksInsuffisants":
+            raise stock.StocksInsuffisants([stock.StockInsuffisant(*m) for m in data.get("manques") or []])
+        if kind == "StockInsuffisant":
+            raise stock.StockInsuffisant(data.get("produit_id"), data.get("disponible"), data.get("demande"))
+        if kind == "NotFound" or status == 404:
+            raise services.NotFound(message)
+        if status == 400:
+            raise ValueError(message)
+        raise ServerError(message)
+
+    @staticmethod
+    def _rows(rows):
+        return [tuple(r) for r in rows]
+
+    # --- Opérations ---
+    def init(self):
+        pass   # la base appartient au serveur
+
+    def search_mode(self):
+        return self._call("GET", "/api/recherche/mode")["mode"]
+
+    @staticmethod
+    def _ids(ids):
+        return None if ids is None else ",".join(str(int(i)) for i in ids)
+
+    def search_products(self, text="", nature=None, mode=None, ids=None):
+        return self._rows(self._call("GET", "/api/produits", {"q": text, "nature": nature, "mode": mode,
+                                                              "ids": self._ids(ids)}))
+
+    def search_request(self, text="", nature=None, mode=None):
+        return functools.partial(self.search_products, text, nature, mode)
+
+    def low_stock(self, limit=20):
+        data = self._call("GET", "/api/alertes", {"limit": limit})
+        return data["nombre"], self._rows(data["articles"])
+
+    def has_products(self):
+        return self._call("GET", "/api/produits/existe")
+
+    def add_product(self, values):
+        return self._call("POST", "/api/produits", body=values)["id"]
+
+    def update_product(self, produit_id, values, expected_qte):
+        return self._call("PUT", f"/api/produits/{int(produit_id)}",
+                          body={"valeurs": values, "quantite_attendue": expected_qte})["ok"]
+
+    def delete_product(self, produit_id):
+        self._call("DELETE", f"/api/produits/{int(produit_id)}")
+
+    def stock_at(self, produit_id, date=None):
+        return self._call("GET", f"/api/produits/{int(produit_id)}/stock", {"date": date})
+
+    def affecter(self, produit_id, quantite, destinataire, observation="", date_mvt=None):
+        data = self._call("POST", "/api/affectations", body={
+            "produit_id": produit_id, "quantite": quantite, "destinataire": destinataire,
+            "observation": observation, "date_mvt": date_mvt})
+        return data["id"], data["stock_apres"]
+
+    def affecter_lot(self, lignes, destinataire, observation="", date_mvt=None):
+        data = self._call("POST", "/api/affectations/lot", body={
+            "lignes": [list(l) for l in lignes], "destinataire": destinataire,
+            "observation": observation, "date_mvt": date_mvt})
+        return [tuple(m) for m in data["mouvements"]]
+
+    @staticmethod
+    def _history_params(filters, start_key=None, limit=None):
+        params = dict(services.history_filters(filters))
+        if start_key is not None:
+            params["apres_date"], params["apres_id"] = start_key
+        if limit is not None:
+            params["limit"] = limit
+        return params
+
+    def history_page(self, filters, start_key=None, limit=200, ids=None):
+        params = self._history_params(filters, start_key, limit)
+        params["ids"] = self._ids(ids)
+        return self._rows(self._call("GET", "/api/historique", params))
+
+    def history_request(self, filters, start_key=None, limit=200):
+        return functools.partial(self.history_page, dict(filters), start_key, limit)
+
+    def history_exists(self, filters):
+        return self._call("GET", "/api/historique/existe", self._history_params(filters))
+
+    def change_seq(self):
+        return self._call("GET", "/api/modifications/seq")
+
+    def changes_since(self, seq, limit=services.CHANGES_LIMIT):
+        return self._call("GET", "/api/modifications", {"depuis": seq, "limit": limit})
+
+    def consumption(self, axe, debut=None, fin=None):
+        return self._rows(self._call("GET", "/api/consommation", {"axe": axe, "debut": debut, "fin": fin}))
+
+    def rebuild_aggregates(self):
+        self._call("POST", "/api/consommation/recalcul")
+
+    def inventory_at(self, date=None, axe="produit", nature=None):
+        return self._rows(self._call("GET", "/api/inventaire", {"date": date, "axe": axe, "nature": nature}))
+
+    def import_file(self, kind, path):
+        import import_utils
+        with open(path, "rb") as f:
+            content = f.read()
+        data = self._call("POST", f"/api/import/{kind}", {"extension": os.path.splitext(path)[1].lower()},
+                          body=content, headers={"Content-Type": "application/octet-stream"})
+        report = import_utils.ImportReport()
+        report.inserted, report.updated = data["inserted"], data["updated"]
+        report.rejected = [tuple(r) for r in data["rejected"]]
+        return report
+
+    def download(self, kind, fmt, filters, save_path, progress=None, cancelled=None):
+        """Télécharge un export produit par le serveur ; renvoie le nombre de lignes exportées.
+
+        `progress(octets reçus, octets attendus)` est appelé à chaque bloc ; si `cancelled()`
+        devient vrai, le transfert est interrompu (InterruptedError) et la connexion fermée.
+        """
+        params = services.history_filters(filters) if kind == "historique" else dict(filters or {})
+        resp = self._send("GET", f"/api/export/{kind}.{fmt}", params)
+        if resp.status >= 400:
+            payload = resp.read()
+            self._raise(resp.status, json.loads(payload) if payload else None)
+        total = int(resp.getheader("Content-Length") or 0)
+        received = 0
+        try:
+            with open(save_path, "wb") as f:
+                while True:
+                    if cancelled is not None and cancelled():
+                        raise InterruptedError()
+                    chunk = resp.read(DOWNLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    received += len(chunk)
+                    if progress is not None:
+                        progress(received, total)
+        except BaseException:
+            self._connection().close()   # réponse non lue en entier : connexion inutilisable
+            self._local.conn = None
+            raise
+        return int(resp.getheader("X-Lignes") or 0)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend de l'application : serveur si MAGASIN_SERVEUR est défini, sinon base directe."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            url = os.environ.get(SERVER_ENV, "").strip()
+            _backend = HttpBackend(url, os.environ.get(TOKEN_ENV) or None) if url else DirectBackend()
+        return _backend
+
+
+def set_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,148 @@
+"""Génère une base magasin.db synthétique pour les benchmarks.
+
+    python benchmarks/generate_db.py bench.db --taille moyenne
+    python benchmarks/generate_db.py bench.db --articles 50000 --mouvements 2000000 --seed 7
+
+Le schéma est créé par database.init_db() (index, FTS, déclencheurs compris), puis
+les données sont écrites par lots comme le ferait l'application : les déclencheurs
+(alertes, agrégats de consommation, index plein texte) s'exécutent normalement.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import stock
+from constantes import CATEGORIES, DESTINATAIRES
+
+# Tailles prédéfinies : (articles, mouvements)
+TAILLES = {
+    "petite": (1_000, 10_000),
+    "moyenne": (100_000, 1_000_000),
+    "grande": (1_000_000, 10_000_000),
+}
+
+BATCH = 50_000
+JOURS = 5 * 365          # période couverte par l'historique
+
+NOMS = ["Ramette papier", "Stylo bille", "Classeur", "Chemise cartonnée", "Toner", "Cartouche",
+        "Clé USB", "Souris", "Clavier", "Écran", "Câble réseau", "Détergent", "Eau de javel",
+        "Serpillière", "Gants", "Blouse", "Chaise", "Armoire", "Bureau", "Pneu", "Filtre à huile",
+        "Registre", "Bloc-notes", "Agrafeuse", "Trombones", "Paracétamol", "Compresses",
+        "Bouteille d'eau", "Enveloppe", "Tampon encreur"]
+QUALIFICATIFS = ["A4", "A3", "bleu", "noir", "rouge", "HP 85A", "Canon 728", "32 Go", "64 Go",
+                 "sans fil", "24 pouces", "5 L", "1 L", "taille L", "taille XL", "métallique",
+                 "200 pages", "500 mg", "1,5 L", "kraft"]
+
+
+def _articles(rng, n, today):
+    for i in range(n):
+        nom = f"{rng.choice(NOMS)} {rng.choice(QUALIFICATIFS)} réf. {i + 1:07d}"
+        prix = round(rng.uniform(20, 50_000), 2)
+        seuil = rng.choice((0, 5, 10, 20, 50))
+        ajout = (today - timedelta(days=rng.randrange(JOURS))).strftime("%Y-%m-%d")
+        obs = "" if rng.random() < 0.8 else "Commande en cours"
+        yield (nom, rng.choice(CATEGORIES), 0, prix, seuil, ajout, obs)
+
+
+def _mouvements(rng, n_articles, n, start, stocks):
+    """Mouvements chronologiques cohérents : une SORTIE ne dépasse jamais le stock."""
+    step = JOURS * 86400 / max(n, 1)
+    for i in range(n):
+        # Distribution biaisée : quelques articles concentrent l'essentiel des mouvements
+        pid = 1 + int(n_articles * rng.random() ** 2)
+        qte = rng.randint(1, 20)
+        if stocks[pid] >= qte and rng.random() < 0.7:
+            type_mvt, service = "SORTIE", rng.choice(DESTINATAIRES)
+            stocks[pid] -= qte
+        else:
+            type_mvt, service = "ENTREE", ""
+            qte *= 5
+            stocks[pid] += qte
+        date_mvt = (start + timedelta(seconds=i * step)).strftime("%Y-%m-%d %H:%M:%S")
+        yield (pid, type_mvt, qte, date_mvt, service, "", stocks[pid])
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(path, articles, mouvements, seed=0, verbose=True):
+    rng = random.Random(seed)
+    database.set_db_path(path)
+    database.init_db()
+    today = datetime.now().replace(microsecond=0)
+    t0 = time.perf_counter()
+
+    for chunk in _chunks(_articles(rng, articles, today), BATCH):
+        with database.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, chunk)
+    if verbose:
+        print(f"{articles} article(s) en {time.perf_counter() - t0:.1f} s")
+
+    stocks = [0] * (articles + 1)
+    done = 0
+    for chunk in _chunks(_mouvements(rng, articles, mouvements, today - timedelta(days=JOURS), stocks), BATCH):
+        with database.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, chunk)
+        done += len(chunk)
+        if verbose and done % 1_000_000 < BATCH:
+            print(f"  {done} mouvement(s)… {time.perf_counter() - t0:.0f} s")
+
+    with database.transaction() as conn:
+        conn.executemany("UPDATE produits SET quantite = ? WHERE id = ? AND quantite != ?",
+                         ((q, pid, q) for pid, q in enumerate(stocks) if pid))
+    with database.transaction() as conn:
+        stock.prendre_instantanes(conn)
+    with database.read() as conn:
+        conn.execute("PRAGMA optimize")
+    database.get_manager().close()
+    if verbose:
+        print(f"{path} : {articles} article(s), {mouvements} mouvement(s) en {time.perf_counter() - t0:.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base synthétique pour les benchmarks")
+    parser.add_argument("fichier")
+    parser.add_argument("--taille", choices=sorted(TAILLES), default="petite")
+    parser.add_argument("--articles", type=int, help="remplace le nombre d'articles de --taille")
+    parser.add_argument("--mouvements", type=int, help="remplace le nombre de mouvements de --taille")
+    parser.add_argument("--seed", type=int, default=0, help="graine : même graine, même base")
+    parser.add_argument("--force", action="store_true", help="écraser le fichier existant")
+    args = parser.parse_args(argv)
+
+    articles, mouvements = TAILLES[args.taille]
+    articles = args.articles if args.articles is not None else articles
+    mouvements = args.mouvements if args.mouvements is not None else mouvements
+    if articles < 1:
+        parser.error("au moins un article est nécessaire")
+    path = os.path.abspath(args.fichier)
+    if os.path.exists(path):
+        if not args.force:
+            parser.error(f"{path} existe déjà (--force pour l'écraser)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    generate(path, articles, mouvements, args.seed)
+
+
+if __name__ == "__main__":
+    main()
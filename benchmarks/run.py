@@ -0,0 +1,478 @@
+"""Mesure les chemins critiques de l'application sur une base générée par generate_db.py.
+
+    python benchmarks/run.py bench.db
+    python benchmarks/run.py bench.db --only load_table historique --repeat 10
+    python benchmarks/run.py bench.db --compare benchmarks/results/ancien.json
+
+Chaque benchmark s'exécute dans un processus séparé (pic mémoire propre à la mesure),
+sur une copie de la base ; les widgets sont créés avec la plateforme Qt « offscreen ».
+Le résultat JSON (commit, versions, taille de la base, temps min/médian/max, pic RSS)
+est écrit dans benchmarks/results/ et peut être comparé à un résultat précédent.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+EXPORT_LIMIT = 50_000      # lignes exportées par les benchmarks d'export
+NOISE_S = 0.005            # écarts plus petits ignorés par --compare
+
+BENCHMARKS = {}            # nom -> (préparation, besoin de Qt, répétitions maximales)
+
+
+def benchmark(name, qt=False, max_repeat=None):
+    """Déclare un benchmark : la fonction prépare le contexte et renvoie l'appel à chronométrer."""
+    def register(func):
+        BENCHMARKS[name] = (func, qt, max_repeat)
+        return func
+    return register
+
+
+# === CONTEXTE (processus fils) ===
+
+class Context:
+    def __init__(self, db_path, workdir, export_limit):
+        self.db_path = db_path
+        self.workdir = workdir
+        self.export_limit = export_limit
+        self._app = None
+        self.history_model = None
+
+    def close(self):
+        # Attend les requêtes encore en vol (préchargements) avant la fin du processus
+        if self.history_model is not None:
+            self.history_model.pool.waitForDone()
+        if self._app is not None:
+            self._app.changes.stop()
+            self._app.changes.pool.waitForDone()
+            self._app.search_ctrl.pool.waitForDone()
+
+    @property
+    def app(self):
+        # Fenêtre principale construite une seule fois, recherche initiale terminée
+        if self._app is None:
+            from PyQt5.QtWidgets import QMessageBox
+            import magasin
+            # Les boîtes de dialogue modales bloqueraient la mesure
+            for name in ("information", "warning", "critical"):
+                setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: QMessageBox.Ok))
+            self._app = magasin.MagasinApp()
+            wait_search(self._app)
+        return self._app
+
+
+def wait_search(app, run=True):
+    """Lance (ou attend) la recherche de l'inventaire et rend la main une fois le tableau rempli."""
+    from PyQt5.QtCore import QEventLoop
+    from PyQt5.QtWidgets import QApplication
+    loop = QEventLoop()
+    app.search_ctrl.results.connect(loop.quit)
+    app.search_ctrl.failed.connect(loop.quit)
+    if run:
+        app.search_ctrl.run()
+    loop.exec_()
+    app.search_ctrl.results.disconnect(loop.quit)
+    app.search_ctrl.failed.disconnect(loop.quit)
+    QApplication.processEvents()
+
+
+def wait_changes(app):
+    """Attend que le journal des modifications ait été lu et appliqué à la fenêtre."""
+    from PyQt5.QtCore import QEventLoop
+    loop = QEventLoop()
+    app.changes.changed.connect(loop.quit)
+    loop.exec_()
+    app.changes.changed.disconnect(loop.quit)
+
+
+def _process_events():
+    from PyQt5.QtWidgets import QApplication
+    QApplication.processEvents()
+
+
+# === BENCHMARKS ===
+
+def _load_table(ctx, text, nature_index=0):
+    app = ctx.app
+    app.filter_nature.blockSignals(True)
+    app.filter_nature.setCurrentIndex(nature_index)
+    app.filter_nature.blockSignals(False)
+    app.search.blockSignals(True)
+    app.search.setText(text)
+    app.search.blockSignals(False)
+
+    def run():
+        wait_search(app)
+        return app.model.rowCount()
+    return run
+
+
+@benchmark("load_table[tout]", qt=True)
+def bench_load_all(ctx):
+    return _load_table(ctx, "")
+
+
+@benchmark("load_table[recherche]", qt=True)
+def bench_load_search(ctx):
+    return _load_table(ctx, "toner")
+
+
+@benchmark("load_table[nature]", qt=True)
+def bench_load_nature(ctx):
+    return _load_table(ctx, "", nature_index=2)
+
+
+@benchmark("update_badge", qt=True)
+def bench_badge(ctx):
+    return ctx.app.update_badge
+
+
+@benchmark("on_row_click", qt=True)
+def bench_row_click(ctx):
+    app = ctx.app
+    state = {"i": 0}
+
+    def run():
+        # Fiche de l'article lue dans le catalogue en mémoire
+        row = state["i"] % max(1, app.model.rowCount())
+        state["i"] += 1
+        app.on_row_click(app.model.index(row, 0))
+        return 1
+    return run
+
+
+@benchmark("catalogue[noms]")
+def bench_catalogue_names(ctx):
+    import catalogue
+    cat = catalogue.get_catalogue()
+    cat.refresh()
+    return lambda: len(cat.names())
+
+
+def _history(ctx, pages=1, **filters):
+    from models import HistoryModel
+    columns = [("Date", 0), ("Article", 1), ("Type", 2), ("Quantité", 3), ("Destinataire", 4),
+               ("Stock après", 6), ("Observation", 5)]
+    model = HistoryModel(columns, centered=(3, 5))
+    ctx.history_model = model   # gardé en vie avec ses préchargements
+
+    def run():
+        model.set_filter(filters)
+        for _ in range(pages - 1):
+            _process_events()   # laisse arriver la page préchargée
+            if not model.canFetchMore():
+                break
+            model.fetchMore()
+        return model.rowCount()
+    return run
+
+
+@benchmark("historique[tout]", qt=True)
+def bench_history_all(ctx):
+    return _history(ctx)
+
+
+@benchmark("historique[destinataire]", qt=True)
+def bench_history_service(ctx):
+    return _history(ctx, service="CBW Alger", type_mvt="SORTIE")
+
+
+@benchmark("historique[recherche]", qt=True)
+def bench_history_search(ctx):
+    import queries
+    return _history(ctx, article_txt="ramette", mode=queries.SEARCH_MODE)
+
+
+@benchmark("historique[defilement 20 pages]", qt=True)
+def bench_history_scroll(ctx):
+    return _history(ctx, pages=20)
+
+
+@benchmark("valider_affectation", qt=True)
+def bench_affectation(ctx):
+    import database
+    from PyQt5.QtWidgets import QDialog
+    app = ctx.app
+    with database.read() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM produits WHERE quantite >= 100 LIMIT 50")]
+    if not ids:
+        raise RuntimeError("aucun article avec un stock suffisant")
+    state = {"i": 0}
+
+    def run():
+        pid = ids[state["i"] % len(ids)]
+        state["i"] += 1
+        app.valider_affectation(QDialog(), pid, 1, "CBW Alger", "benchmark")
+        wait_changes(app)   # ligne de l'article mise à jour par le journal des modifications
+        return 1
+    return run
+
+
+@benchmark("affectation_lot[20 articles]", qt=True)
+def bench_affectation_lot(ctx):
+    import database
+    app = ctx.app
+    with database.read() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM produits WHERE quantite >= 100 LIMIT 20")]
+    if not ids:
+        raise RuntimeError("aucun article avec un stock suffisant")
+
+    def run():
+        # Même chemin que le bouton Valider du panier : une transaction, une actualisation
+        app.backend.affecter_lot([(pid, 1) for pid in ids], "CBW Alger", "benchmark")
+        app.changes.poll()
+        wait_changes(app)
+        return len(ids)
+    return run
+
+
+@benchmark("stock_a_date[article]")
+def bench_stock_at(ctx):
+    import database
+    import services
+    with database.read() as conn:
+        # Article le plus mouvementé : la queue rejouée après l'instantané reste courte
+        pid, debut, fin = conn.execute("""SELECT produit_id, MIN(date_mvt), MAX(date_mvt) FROM mouvements
+                                          GROUP BY produit_id ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    state = {"i": 0}
+
+    def run():
+        date = (debut, fin)[state["i"] % 2]
+        state["i"] += 1
+        services.stock_at(pid, date)
+        return 1
+    return run
+
+
+@benchmark("inventaire_date[nature]", max_repeat=3)
+def bench_inventory_at(ctx):
+    import services
+    from datetime import date
+    cloture = f"{date.today().year - 1}-12-31"
+    return lambda: len(services.inventory_at(cloture, "nature"))
+
+
+@benchmark("reconcile", max_repeat=3)
+def bench_reconcile(ctx):
+    import services
+    return lambda: len(services.ledger_drift())
+
+
+def _export(ctx, func_name, query, params, suffix):
+    import database
+    import export_utils
+    export = getattr(export_utils, func_name)
+    path = os.path.join(ctx.workdir, f"{func_name}{suffix}")
+
+    def run():
+        with database.read() as conn:
+            return export(conn.execute(f"{query} LIMIT ?", list(params) + [ctx.export_limit]), path)
+    return run
+
+
+@benchmark("export_excel[inventaire]", max_repeat=3)
+def bench_export_excel(ctx):
+    import queries
+    return _export(ctx, "export_excel", queries.INVENTORY_EXPORT_QUERY, [], ".xlsx")
+
+
+@benchmark("export_pdf[inventaire]", max_repeat=3)
+def bench_export_pdf(ctx):
+    import queries
+    return _export(ctx, "export_pdf", queries.INVENTORY_EXPORT_QUERY, [], ".pdf")
+
+
+@benchmark("export_excel[historique]", max_repeat=3)
+def bench_export_history_excel(ctx):
+    import queries
+    query, params = queries.history_export_query()
+    return _export(ctx, "export_history_excel", query, params, ".xlsx")
+
+
+@benchmark("export_pdf[historique]", max_repeat=3)
+def bench_export_history_pdf(ctx):
+    import queries
+    query, params = queries.history_export_query()
+    return _export(ctx, "export_history_pdf", query, params, ".pdf")
+
+
+# === EXÉCUTION ===
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None   # Windows : pas de getrusage
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_child(name, db_path, repeat, export_limit):
+    """Exécute un benchmark dans le processus courant et renvoie son résultat."""
+    setup, qt, max_repeat = BENCHMARKS[name]
+    import database
+    database.set_db_path(db_path)
+    database.init_db()
+    if qt:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        qapp = QApplication.instance() or QApplication([])   # noqa: F841
+    repeat = min(repeat, max_repeat or repeat)
+
+    with tempfile.TemporaryDirectory(prefix="magasin_bench_") as workdir:
+        ctx = Context(db_path, workdir, export_limit)
+        call = setup(ctx)
+        rss_before = _peak_rss_kb()
+        times, rows = [], None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = call()
+            times.append(time.perf_counter() - t0)
+        rss_after = _peak_rss_kb()
+        ctx.close()
+    return {
+        "repeat": len(times),
+        "rows": rows,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "max_s": max(times),
+        "peak_rss_kb": rss_after,
+        "rss_growth_kb": rss_after - rss_before if rss_after is not None else None,
+    }
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30)
+    except OSError:
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def _db_info(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            "file": os.path.basename(path),
+            "size_mb": round(os.path.getsize(path) / 1e6, 1),
+            "articles": conn.execute("SELECT COUNT(*) FROM produits").fetchone()[0],
+            "movements": conn.execute("SELECT COUNT(*) FROM mouvements").fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def _copy_db(src, dst):
+    # API de sauvegarde : copie cohérente même si un fichier -wal accompagne la base
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def run_all(db_path, names, repeat, export_limit):
+    report = {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "db": _db_info(db_path),
+        "export_limit": export_limit,
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="magasin_bench_db_") as tmp:
+        copy = os.path.join(tmp, "magasin.db")
+        _copy_db(db_path, copy)
+        for name in names:
+            cmd = [sys.executable, os.path.abspath(__file__), copy, "--child", name,
+                   "--repeat", str(repeat), "--export-limit", str(export_limit)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                result = {"error": (proc.stderr.strip().splitlines() or ["échec"])[-1]}
+                print(f"{name:<34} ERREUR : {result['error']}")
+            else:
+                result = json.loads(lines[-1])
+                print(f"{name:<34} {result['median_s'] * 1000:>10.1f} ms"
+                      f"  (min {result['min_s'] * 1000:.1f}, max {result['max_s'] * 1000:.1f})"
+                      + (f"  pic {result['peak_rss_kb'] / 1024:.0f} Mo" if result["peak_rss_kb"] else ""))
+            report["benchmarks"][name] = result
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Affiche l'écart de chaque médiane avec la référence ; renvoie les benchmarks en régression."""
+    regressions = []
+    print(f"\nComparaison avec {baseline.get('commit')} ({baseline.get('date')}) :")
+    for name, result in report["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old or "median_s" not in old or "median_s" not in result:
+            continue
+        ratio = result["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        slower = ratio > 1 + tolerance and result["median_s"] - old["median_s"] > NOISE_S
+        if slower:
+            regressions.append(name)
+        print(f"{name:<34} {old['median_s'] * 1000:>9.1f} → {result['median_s'] * 1000:>9.1f} ms"
+              f"  x{ratio:.2f}{'  RÉGRESSION' if slower else ''}")
+    if report["db"] != baseline.get("db"):
+        print("Attention : la base de référence n'est pas la même.")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques")
+    parser.add_argument("db", help="base générée par benchmarks/generate_db.py")
+    parser.add_argument("--only", nargs="+", metavar="NOM", help="préfixes des benchmarks à lancer")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--export-limit", type=int, default=EXPORT_LIMIT)
+    parser.add_argument("--output", help="fichier JSON (défaut : benchmarks/results/<commit>-<base>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="résultat de référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="ralentissement toléré (0.2 = 20 %%)")
+    parser.add_argument("--list", action="store_true", help="lister les benchmarks")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    db_path = os.path.abspath(args.db)
+    if args.child:
+        print(json.dumps(run_child(args.child, db_path, args.repeat, args.export_limit)))
+        return 0
+    if not os.path.exists(db_path):
+        parser.error(f"{db_path} introuvable")
+
+    names = [n for n in BENCHMARKS if not args.only or any(n.startswith(p) for p in args.only)]
+    report = run_all(db_path, names, args.repeat, args.export_limit)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['commit'] or 'local'}-{os.path.splitext(report['db']['file'])[0]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats : {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Écritures concurrentes sur une même base : N processus enregistrent des mouvements en parallèle.
+
+    python benchmarks/stress_concurrence.py --processus 8 --operations 500
+    python benchmarks/stress_concurrence.py --mode naif     # ancien schéma lecture / contrôle / écriture
+
+À la fin, chaque article doit vérifier : stock initial + entrées - sorties = quantité,
+quantité ≥ 0, et stock_apres du dernier mouvement = quantité. Aucune erreur
+« database is locked » ne doit remonter. Code de sortie 1 en cas d'anomalie.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARTICLES = 20
+STOCK_INITIAL = 200
+
+
+def _prepare(path):
+    import database
+    database.set_db_path(path)
+    database.init_db()
+    with database.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+            VALUES (?, '', ?, 1, 0, '2025-01-01', '')
+        """, [(f"Article {i}", STOCK_INITIAL) for i in range(1, ARTICLES + 1)])
+    database.get_manager().close()
+
+
+def _worker(path, worker, operations, mode, seed, results):
+    import database
+    import stock
+    database.set_db_path(path)
+    rng = random.Random(seed)
+    ok = insufficient = locked = 0
+    for _ in range(operations):
+        pid = rng.randint(1, ARTICLES)
+        qte = rng.randint(1, 5)
+        type_mvt = "ENTREE" if rng.random() < 0.3 else "SORTIE"
+        date_mvt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            if mode == "naif":
+                # Ancienne logique : lecture puis contrôle en Python, écriture dans une autre transaction
+                with database.read() as conn:
+                    disponible = conn.execute("SELECT quantite FROM produits WHERE id = ?", (pid,)).fetchone()[0]
+                if type_mvt == "SORTIE" and disponible < qte:
+                    insufficient += 1
+                    continue
+                nouveau = disponible + stock.signed_quantity(type_mvt, qte)
+                time.sleep(0.001)
+                with database.transaction() as conn:
+                    conn.execute("UPDATE produits SET quantite = ? WHERE id = ?", (nouveau, pid))
+                    conn.execute("""
+                        INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (pid, type_mvt, qte, date_mvt, f"poste {worker}", "", nouveau))
+            else:
+                with database.transaction() as conn:
+                    stock.enregistrer_mouvement(conn, pid, type_mvt, qte, date_mvt, f"poste {worker}")
+            ok += 1
+        except stock.StockInsuffisant:
+            insufficient += 1
+        except sqlite3.OperationalError as e:
+            if not database.is_busy_error(e):
+                raise
+            locked += 1
+    results.put((worker, ok, insufficient, locked))
+
+
+def check(path):
+    """Anomalies de cohérence entre produits.quantite et le journal des mouvements."""
+    conn = sqlite3.connect(path)
+    problems = []
+    try:
+        rows = conn.execute("""
+            SELECT p.id, p.quantite,
+                   COALESCE(SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE -m.quantite END), 0),
+                   (SELECT m2.stock_apres FROM mouvements m2 WHERE m2.produit_id = p.id ORDER BY m2.id DESC LIMIT 1)
+            FROM produits p LEFT JOIN mouvements m ON m.produit_id = p.id
+            GROUP BY p.id
+        """).fetchall()
+    finally:
+        conn.close()
+    for pid, quantite, delta, dernier in rows:
+        if quantite != STOCK_INITIAL + delta:
+            problems.append(f"article {pid} : quantité {quantite}, journal {STOCK_INITIAL + delta} "
+                            f"({quantite - STOCK_INITIAL - delta:+d})")
+        if quantite < 0:
+            problems.append(f"article {pid} : stock négatif ({quantite})")
+        if dernier is not None and dernier != quantite:
+            problems.append(f"article {pid} : stock_apres du dernier mouvement {dernier} ≠ {quantite}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress test des écritures concurrentes")
+    parser.add_argument("--processus", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=300, help="mouvements par processus")
+    parser.add_argument("--mode", choices=["atomique", "naif"], default="atomique")
+    parser.add_argument("--db", help="base à utiliser (défaut : fichier temporaire)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.db:
+        path = os.path.abspath(args.db)
+        if os.path.exists(path):
+            parser.error(f"{path} existe déjà : la base est créée par le test")
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="magasin_stress_")
+        path = os.path.join(tmp.name, "magasin.db")
+    _prepare(path)
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker,
+                                       args=(path, i, args.operations, args.mode, args.seed * 1000 + i, results))
+               for i in range(args.processus)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    stats = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+
+    ok = sum(s[1] for s in stats)
+    insufficient = sum(s[2] for s in stats)
+    locked = sum(s[3] for s in stats)
+    conn = sqlite3.connect(path)
+    written = conn.execute("SELECT COUNT(*) FROM mouvements").fetchone()[0]
+    conn.close()
+    problems = check(path)
+    if written != ok:
+        problems.append(f"{ok} mouvement(s) validé(s) mais {written} enregistré(s)")
+    if locked:
+        problems.append(f"{locked} erreur(s) « database is locked »")
+
+    print(f"mode {args.mode} : {args.processus} processus × {args.operations} opérations en {elapsed:.1f} s "
+          f"({ok / elapsed:.0f} mouvements/s)")
+    print(f"  {ok} mouvement(s) enregistré(s), {insufficient} refus pour stock insuffisant, {locked} verrouillage(s)")
+    for p in problems:
+        print(f"  - {p}")
+    print("  Aucune anomalie." if not problems else f"  {len(problems)} anomalie(s).")
+    if tmp is not None:
+        tmp.cleanup()
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import threading
+
+import backends
+import services
+
+# Catalogue des articles en mémoire, partagé par tout le processus (sans dépendance Qt).
+# Chargé une fois, puis tenu à jour à partir du journal des modifications
+# (services.changes_since) : tant qu'aucun commit n'a eu lieu, PRAGMA data_version
+# suffit à le savoir, sans requête. Un retard trop important provoque un rechargement.
+# Les lectures n'interrogent jamais le backend : refresh() est appelé par l'appelant,
+# sur notification du journal (workers.ChangeFeed) ou une fois par action.
+
+
+class Produit:
+    """Article du catalogue (enregistrement compact)."""
+    __slots__ = ("id", "nom", "nature", "quantite", "prix", "seuil_min", "date_ajout", "observation")
+
+    def __init__(self, row):
+        # Colonnes de queries.PRODUCT_COLUMNS
+        (self.nom, self.nature, self.quantite, self.prix, self.seuil_min,
+         self.date_ajout, self.observation, self.id) = row
+
+    def __repr__(self):
+        return f"Produit({self.id}, {self.nom!r}, quantite={self.quantite})"
+
+
+class Catalogue:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.RLock()
+        self._seq = None
+        self._by_id = {}
+        self._by_nom = {}       # nom -> {ids}
+        self._names = None      # noms triés, recalculés à la demande
+
+    # --- Mise à jour ---
+    def invalidate(self):
+        with self._lock:
+            self._seq = None
+
+    def refresh(self):
+        """Applique les modifications survenues depuis la dernière lecture."""
+        with self._lock:
+            if self._seq is None:
+                self._reload()
+                return
+            changes = self.backend.changes_since(self._seq)
+            if changes["reset"]:
+                self._reload()
+                return
+            self._seq = changes["seq"]
+            for produit_id in changes["produits_supprimes"]:
+                self._remove(produit_id)
+            if changes["produits"]:
+                for row in self.backend.search_products("", None, None, changes["produits"]):
+                    self._add(Produit(row))
+
+    def _reload(self):
+        seq = self.backend.change_seq()   # lu avant : une écriture concurrente sera rejouée
+        self._by_id, self._by_nom = {}, {}
+        self._names = None
+        for row in self.backend.search_products():
+            self._add(Produit(row))
+        self._seq = seq
+
+    def _add(self, produit):
+        self._remove(produit.id)
+        self._by_id[produit.id] = produit
+        self._by_nom.setdefault(produit.nom, set()).add(produit.id)
+        self._names = None
+
+    def _remove(self, produit_id):
+        old = self._by_id.pop(produit_id, None)
+        if old is None:
+            return
+        ids = self._by_nom.get(old.nom)
+        if ids is not None:
+            ids.discard(produit_id)
+            if not ids:
+                del self._by_nom[old.nom]
+        self._names = None
+
+    # --- Lecture (sans accès au backend) ---
+    def get(self, produit_id):
+        """Article `produit_id`, ou None s'il n'existe pas (ou plus, au dernier refresh)."""
+        with self._lock:
+            return self._by_id.get(produit_id)
+
+    def name(self, produit_id):
+        produit = self.get(produit_id)
+        if produit is None:
+            raise services.NotFound(f"Article introuvable (id={produit_id}).")
+        return produit.nom
+
+    def names(self):
+        """Noms distincts des articles, triés."""
+        with self._lock:
+            if self._names is None:
+                self._names = sorted(self._by_nom)
+            return list(self._names)
+
+    def sorted_by_name(self):
+        """Tous les articles, triés par nom puis id."""
+        with self._lock:
+            return sorted(self._by_id.values(), key=lambda p: (p.nom, p.id))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue():
+    """Catalogue du backend courant (backends.get_backend)."""
+    global _catalogue
+    backend = backends.get_backend()
+    with _catalogue_lock:
+        if _catalogue is None or _catalogue.backend is not backend:
+            _catalogue = Catalogue(backend)
+        return _catalogue
@@ -0,0 +1,18 @@
+# Listes de référence partagées par l'interface, la ligne de commande et les benchmarks
+# (module sans dépendance Qt).
+
+DESTINATAIRES = [
+    "CBW Alger", "CBW Boumerdes", "CBW Laghouat", "CBW Bouira",
+    "CBW Blida", "CBW Djelfa", "CBW Medea", "CBW Tizi ouzou",
+    "Bureau Informatique", "Bureau Suivi", "Bureau Personnel",
+    "Bureau Comptabilité", "Bureau Moyen", "secretariat", 
+    "Bureau Prevision", "Bureau Reglementation", "Bureau Formation",
+    "Bureau Inspection", 
+    "Autres"
+]
+
+CATEGORIES = [
+    "MATERIELS INFORMATIQUES", "FOURNITURES DE BUREAUX", "PRODUITS D'ENTRETIEN MENNAGER",
+    "HABILLEMENTS", "MOBILIER DE BUREAU", "PARC AUTO", "CONFECTION DES FOURNITURS IMPRIMEES",
+    "CONSOMMABLE INFORMATIQUE", "PRODUITS PHARMACEUTIQUES", "EAUX"
+]
@@ -1,4 +1,7 @@
-import os, sys, sqlite3
+import os, sys, sqlite3, threading, queue, time, random
+from contextlib import contextmanager
+
+import diagnostics
 
 def app_dir():
     if getattr(sys, "frozen", False):
@@ -7,38 +10,707 @@ def app_dir():
 
 DB_PATH = os.path.join(app_dir(), "magasin.db")
 
+# PRAGMAs appliqués une seule fois, à l'ouverture de chaque connexion du pool
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 Mo
+    "PRAGMA cache_size=-16000",     # ~16 Mo
+)
+
+# Taille du cache de requêtes préparées (par connexion)
+STATEMENT_CACHE = 256
+
+# Accès concurrents (plusieurs postes sur la même base) : SQLite attend BUSY_TIMEOUT
+# secondes qu'un autre écrivain libère la base, puis BEGIN/COMMIT sont retentés
+# BUSY_RETRIES fois avec un délai exponentiel (BUSY_BACKOFF, doublé, + aléa).
+BUSY_TIMEOUT = 2.0
+BUSY_RETRIES = 3
+BUSY_BACKOFF = 0.05
+
+
+def is_busy_error(e):
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Curseur instrumenté : durée d'exécution + lecture (fetch*), lignes lues, action courante.
+
+    Une requête est enregistrée à sa fin : fetchall(), fetchone() épuisé, nouvelle exécution,
+    fermeture ou destruction du curseur. Les lignes ne sont pas comptées si le curseur est
+    parcouru par itération (exports en flux).
+    """
+    _pending = None
+
+    def _flush(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, params, seconds, rows = pending
+            diagnostics.record(self.connection, sql, params, seconds, rows)
+
+    def _fetched(self, seconds, n):
+        if self._pending is not None:
+            self._pending[2] += seconds
+            self._pending[3] = (self._pending[3] or 0) + n
+
+    def execute(self, sql, params=()):
+        self._flush()
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        elapsed = time.perf_counter() - t0
+        if self.description is None:
+            diagnostics.record(self.connection, sql, params, elapsed, self.rowcount if self.rowcount >= 0 else None)
+        else:
+            self._pending = [sql, params, elapsed, None]
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._flush()
+        count = [0, None]   # nombre de jeux de paramètres, premier jeu (pour la forme)
+
+        def counted(seq):
+            for params in seq:
+                if count[1] is None:
+                    count[1] = params
+                count[0] += 1
+                yield params
+        t0 = time.perf_counter()
+        super().executemany(sql, counted(seq_of_params))
+        diagnostics.record(self.connection, sql, count[1], time.perf_counter() - t0,
+                           self.rowcount if self.rowcount >= 0 else None, many=count[0])
+        return self
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - t0, row is not None)
+        if row is None:
+            self._flush()
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - t0, len(rows))
+        self._flush()
+        return rows
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._flush()
+        except Exception:
+            pass   # fin de l'interpréteur : modules déjà déchargés
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connexion dont execute()/executemany() passent par TimedCursor."""
+
+    def execute(self, sql, params=()):
+        return self.cursor(TimedCursor).execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor(TimedCursor).executemany(sql, seq_of_params)
+
+
+class ConnectionManager:
+    """Connexions SQLite longue durée : un écrivain unique + un petit pool de lecteurs."""
+
+    def __init__(self, path=DB_PATH, readers=3):
+        self.path = path
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._readers = queue.LifoQueue()
+        self._max_readers = readers
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        self._watcher = None   # connexion dédiée à PRAGMA data_version
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE,
+                               isolation_level=None,   # transactions gérées explicitement
+                               timeout=BUSY_TIMEOUT,
+                               factory=TimedConnection if diagnostics.ENABLED else sqlite3.Connection)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _get_writer(self):
+        if self._writer is None:
+            self._writer = self._open()
+        return self._writer
+
+    @contextmanager
+    def transaction(self):
+        """Transaction d'écriture : commit à la sortie, rollback en cas d'exception."""
+        t0 = time.perf_counter()
+        with self._write_lock:
+            diagnostics.record_wait("verrou d'écriture", time.perf_counter() - t0)
+            conn = self._get_writer()
+            if conn.in_transaction:
+                # Transaction imbriquée (même thread) : on réutilise la transaction en cours
+                yield conn
+                return
+            self._execute_retrying(conn, "BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                try:
+                    self._execute_retrying(conn, "COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+
+    @staticmethod
+    def _execute_retrying(conn, sql):
+        """BEGIN/COMMIT avec nouvelles tentatives si un autre poste garde la base verrouillée."""
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            t0 = time.perf_counter()
+            try:
+                conn.execute(sql)
+                return
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == BUSY_RETRIES:
+                    raise
+                diagnostics.record_wait("base verrouillée par un autre poste", time.perf_counter() - t0)
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    @contextmanager
+    def read(self):
+        """Connexion de lecture empruntée au pool, rendue à la sortie."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._created < self._max_readers
+                if can_open:
+                    self._created += 1
+            if can_open:
+                conn = self._open()
+            else:
+                t0 = time.perf_counter()
+                conn = self._readers.get()
+                diagnostics.record_wait("connexion de lecture", time.perf_counter() - t0)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._readers.put(conn)
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            self._created = 0
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+    def data_version(self):
+        """PRAGMA data_version vu d'une connexion qui n'écrit jamais (ni instrumentée) :
+        la valeur change à chaque commit, quel que soit le processus ou la connexion."""
+        with self._pool_lock:
+            if self._watcher is None:
+                self._watcher = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                                timeout=BUSY_TIMEOUT)
+            return self._watcher.execute("PRAGMA data_version").fetchone()[0]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager(DB_PATH)
+        return _manager
+
+def set_db_path(path):
+    """Change la base utilisée (outils en ligne de commande, benchmarks) ; ferme le pool courant."""
+    global DB_PATH, _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+        DB_PATH = path
+
+def transaction():
+    return get_manager().transaction()
+
+def read():
+    return get_manager().read()
+
+def data_version():
+    return get_manager().data_version()
+
 def get_conn():
+    # Connexion autonome (hors pool), conservée pour les scripts ponctuels
     return sqlite3.connect(DB_PATH)
 
-def init_db():
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS produits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nom TEXT NOT NULL,
-            nature TEXT,
-            quantite INTEGER NOT NULL DEFAULT 0,
-            prix REAL NOT NULL DEFAULT 0,
-            seuil_min INTEGER NOT NULL DEFAULT 0,
-            date_ajout TEXT NOT NULL,
-            observation TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS mouvements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            produit_id INTEGER NOT NULL,
-            type TEXT NOT NULL,            -- ENTREE / SORTIE
-            quantite INTEGER NOT NULL,
-            date_mvt TEXT NOT NULL,
-            service TEXT,
-            observation TEXT,
-            FOREIGN KEY (produit_id) REFERENCES produits(id)
+def _create_trigram_index(conn):
+    # Index trigramme (recherche de sous-chaînes) : nécessite SQLite >= 3.34
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS produits_trigram USING fts5(
+                        nom, content='produits', content_rowid='id', tokenize='trigram')""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS produits_trigram_ai AFTER INSERT ON produits BEGIN
+                        INSERT INTO produits_trigram(rowid, nom) VALUES (new.id, new.nom);
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS produits_trigram_ad AFTER DELETE ON produits BEGIN
+                        INSERT INTO produits_trigram(produits_trigram, rowid, nom) VALUES ('delete', old.id, old.nom);
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS produits_trigram_au AFTER UPDATE OF nom ON produits BEGIN
+                        INSERT INTO produits_trigram(produits_trigram, rowid, nom) VALUES ('delete', old.id, old.nom);
+                        INSERT INTO produits_trigram(rowid, nom) VALUES (new.id, new.nom);
+                    END""")
+    conn.execute("INSERT INTO produits_trigram(produits_trigram) VALUES ('rebuild')")
+
+def _backfill_stock_apres(conn):
+    # Rejoue l'historique de chaque article à rebours depuis le stock actuel :
+    # stock après un mouvement = stock actuel - effet cumulé des mouvements suivants
+    conn.execute("""
+        WITH eff AS (
+            SELECT m.id, p.quantite AS stock_actuel,
+                   SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE -m.quantite END)
+                       OVER (PARTITION BY m.produit_id ORDER BY m.date_mvt DESC, m.id DESC
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS apres
+            FROM mouvements m JOIN produits p ON p.id = m.produit_id
         )
+        UPDATE mouvements SET stock_apres = eff.stock_actuel - COALESCE(eff.apres, 0)
+        FROM eff WHERE eff.id = mouvements.id
     """)
 
+# Entrées conservées dans journal_modifs (migration 7) ; un client plus en retard recharge tout
+JOURNAL_MAX = 20000
+
+# === MIGRATIONS ===
+# Chaque étape porte un numéro ; PRAGMA user_version mémorise la dernière appliquée.
+# Une étape est une liste d'instructions SQL ou de fonctions recevant la connexion.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_mvt_produit_date ON mouvements(produit_id, date_mvt)",
+        "CREATE INDEX IF NOT EXISTS idx_mvt_service_date ON mouvements(service, date_mvt)",
+        "CREATE INDEX IF NOT EXISTS idx_mvt_type_date ON mouvements(type, date_mvt)",
+        "CREATE INDEX IF NOT EXISTS idx_produits_nature_nom ON produits(nature, nom)",
+        "CREATE INDEX IF NOT EXISTS idx_produits_nom ON produits(nom)",
+        # Index partiel : seuls les articles en alerte y figurent
+        """CREATE INDEX IF NOT EXISTS idx_produits_alerte ON produits(id)
+           WHERE quantite < seuil_min AND seuil_min > 0""",
+    ]),
+    (2, [
+        # Index plein texte (nom + observation), insensible à la casse et aux accents
+        """CREATE VIRTUAL TABLE IF NOT EXISTS produits_fts USING fts5(
+               nom, observation,
+               content='produits', content_rowid='id',
+               tokenize="unicode61 remove_diacritics 2",
+               prefix='2 3'
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS produits_fts_ai AFTER INSERT ON produits BEGIN
+               INSERT INTO produits_fts(rowid, nom, observation) VALUES (new.id, new.nom, new.observation);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS produits_fts_ad AFTER DELETE ON produits BEGIN
+               INSERT INTO produits_fts(produits_fts, rowid, nom, observation)
+               VALUES ('delete', old.id, old.nom, old.observation);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS produits_fts_au AFTER UPDATE OF nom, observation ON produits BEGIN
+               INSERT INTO produits_fts(produits_fts, rowid, nom, observation)
+               VALUES ('delete', old.id, old.nom, old.observation);
+               INSERT INTO produits_fts(rowid, nom, observation) VALUES (new.id, new.nom, new.observation);
+           END""",
+        "INSERT INTO produits_fts(produits_fts) VALUES ('rebuild')",
+        _create_trigram_index,
+    ]),
+    (3, [
+        # Ensemble des articles en alerte, maintenu par triggers, et son cardinal
+        "CREATE TABLE IF NOT EXISTS alertes_stock (produit_id INTEGER PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS compteurs (nom TEXT PRIMARY KEY, valeur INTEGER NOT NULL DEFAULT 0)",
+        """INSERT OR IGNORE INTO alertes_stock (produit_id)
+           SELECT id FROM produits WHERE quantite < seuil_min AND seuil_min > 0""",
+        """INSERT OR REPLACE INTO compteurs (nom, valeur)
+           VALUES ('alertes', (SELECT COUNT(*) FROM alertes_stock))""",
+        """CREATE TRIGGER IF NOT EXISTS alertes_ai AFTER INSERT ON produits
+           WHEN new.quantite < new.seuil_min AND new.seuil_min > 0 BEGIN
+               INSERT OR IGNORE INTO alertes_stock (produit_id) VALUES (new.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS alertes_au AFTER UPDATE OF quantite, seuil_min ON produits BEGIN
+               DELETE FROM alertes_stock
+                WHERE produit_id = old.id AND NOT (new.quantite < new.seuil_min AND new.seuil_min > 0);
+               INSERT OR IGNORE INTO alertes_stock (produit_id)
+               SELECT new.id WHERE new.quantite < new.seuil_min AND new.seuil_min > 0;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS alertes_ad AFTER DELETE ON produits BEGIN
+               DELETE FROM alertes_stock WHERE produit_id = old.id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS compteur_alertes_ai AFTER INSERT ON alertes_stock BEGIN
+               UPDATE compteurs SET valeur = valeur + 1 WHERE nom = 'alertes';
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS compteur_alertes_ad AFTER DELETE ON alertes_stock BEGIN
+               UPDATE compteurs SET valeur = valeur - 1 WHERE nom = 'alertes';
+           END""",
+    ]),
+    (4, [
+        # Stock réel après chaque mouvement, écrit avec le mouvement
+        "ALTER TABLE mouvements ADD COLUMN stock_apres INTEGER",
+        _backfill_stock_apres,
+    ]),
+    (5, [
+        # Pagination par clé (date_mvt, id) de l'historique complet
+        "CREATE INDEX IF NOT EXISTS idx_mvt_date ON mouvements(date_mvt)",
+    ]),
+    (6, [
+        # Agrégats de consommation (voir rapports.py), tenus à jour par triggers
+        """CREATE TABLE IF NOT EXISTS conso_produit_jour (
+               produit_id INTEGER NOT NULL, jour TEXT NOT NULL,
+               entrees INTEGER NOT NULL DEFAULT 0, sorties INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (produit_id, jour)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS conso_service_mois (
+               service TEXT NOT NULL, mois TEXT NOT NULL,
+               entrees INTEGER NOT NULL DEFAULT 0, sorties INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (service, mois)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS conso_nature_mois (
+               nature TEXT NOT NULL, mois TEXT NOT NULL,
+               entrees INTEGER NOT NULL DEFAULT 0, sorties INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (nature, mois)) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS conso_ai AFTER INSERT ON mouvements BEGIN
+               INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+               VALUES (new.produit_id, substr(new.date_mvt, 1, 10),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (produit_id, jour) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+               VALUES (COALESCE(new.service, ''), substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (service, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+               VALUES ((SELECT COALESCE(nature, '') FROM produits WHERE id = new.produit_id),
+                       substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (nature, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS conso_ad AFTER DELETE ON mouvements BEGIN
+               UPDATE conso_produit_jour
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE produit_id = old.produit_id AND jour = substr(old.date_mvt, 1, 10);
+               UPDATE conso_service_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE service = COALESCE(old.service, '') AND mois = substr(old.date_mvt, 1, 7);
+               UPDATE conso_nature_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE nature = (SELECT COALESCE(nature, '') FROM produits WHERE id = old.produit_id)
+                  AND mois = substr(old.date_mvt, 1, 7);
+           END""",
+        # Agrégats recalculés depuis l'historique existant
+        "DELETE FROM conso_produit_jour",
+        "DELETE FROM conso_service_mois",
+        "DELETE FROM conso_nature_mois",
+        """INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+           SELECT m.produit_id, substr(m.date_mvt, 1, 10),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m GROUP BY 1, 2""",
+        """INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+           SELECT COALESCE(m.service, ''), substr(m.date_mvt, 1, 7),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m GROUP BY 1, 2""",
+        """INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+           SELECT COALESCE(p.nature, ''), substr(m.date_mvt, 1, 7),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m JOIN produits p ON p.id = m.produit_id GROUP BY 1, 2""",
+    ]),
+    (7, [
+        # Journal des modifications : les vues appliquent les changements ligne par ligne
+        # (voir services.changes_since) au lieu de tout relire
+        """CREATE TABLE IF NOT EXISTS journal_modifs (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               objet TEXT NOT NULL,          -- 'produit' ou 'mouvement'
+               operation TEXT NOT NULL,      -- 'I', 'U' ou 'D'
+               objet_id INTEGER NOT NULL)""",
+        """CREATE TRIGGER IF NOT EXISTS journal_produits_ai AFTER INSERT ON produits BEGIN
+               INSERT INTO journal_modifs (objet, operation, objet_id) VALUES ('produit', 'I', new.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS journal_produits_au AFTER UPDATE ON produits BEGIN
+               INSERT INTO journal_modifs (objet, operation, objet_id) VALUES ('produit', 'U', new.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS journal_produits_ad AFTER DELETE ON produits BEGIN
+               INSERT INTO journal_modifs (objet, operation, objet_id) VALUES ('produit', 'D', old.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS journal_mvt_ai AFTER INSERT ON mouvements BEGIN
+               INSERT INTO journal_modifs (objet, operation, objet_id) VALUES ('mouvement', 'I', new.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS journal_mvt_ad AFTER DELETE ON mouvements BEGIN
+               INSERT INTO journal_modifs (objet, operation, objet_id) VALUES ('mouvement', 'D', old.id);
+           END""",
+        # Purge par paliers : seules les JOURNAL_MAX dernières entrées sont conservées
+        f"""CREATE TRIGGER IF NOT EXISTS journal_purge AFTER INSERT ON journal_modifs
+            WHEN new.seq % 1000 = 0 BEGIN
+               DELETE FROM journal_modifs WHERE seq <= new.seq - {JOURNAL_MAX};
+           END""",
+    ]),
+    (8, [
+        # Grand livre des stocks (voir stock.py) : soldes d'ouverture, puis instantanés
+        # périodiques du stock de chaque article pour les calculs de stock à date
+        """CREATE TABLE IF NOT EXISTS stock_snapshots (
+               produit_id INTEGER NOT NULL,
+               date_mvt TEXT NOT NULL,           -- clé (date_mvt, mvt_id) du mouvement
+               mvt_id INTEGER NOT NULL,
+               quantite INTEGER NOT NULL,        -- stock après ce mouvement
+               PRIMARY KEY (produit_id, date_mvt, mvt_id)) WITHOUT ROWID""",
+        # Un mouvement antidaté, modifié ou supprimé rend faux les instantanés postérieurs
+        """CREATE TRIGGER IF NOT EXISTS snapshots_mvt_ai AFTER INSERT ON mouvements BEGIN
+               DELETE FROM stock_snapshots
+                WHERE produit_id = new.produit_id AND (date_mvt, mvt_id) > (new.date_mvt, new.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS snapshots_mvt_au
+           AFTER UPDATE OF produit_id, type, quantite, date_mvt ON mouvements BEGIN
+               DELETE FROM stock_snapshots
+                WHERE produit_id IN (old.produit_id, new.produit_id)
+                  AND (date_mvt, mvt_id) >= (MIN(old.date_mvt, new.date_mvt), 0);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS snapshots_mvt_ad AFTER DELETE ON mouvements BEGIN
+               DELETE FROM stock_snapshots
+                WHERE produit_id = old.produit_id AND (date_mvt, mvt_id) >= (old.date_mvt, old.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS snapshots_produits_ad AFTER DELETE ON produits BEGIN
+               DELETE FROM stock_snapshots WHERE produit_id = old.id;
+           END""",
+        # Soldes d'ouverture : un mouvement INITIAL par article dont les mouvements existants
+        # n'expliquent pas la quantité, daté juste avant le premier d'entre eux.
+        # Les instantanés sont pris ensuite par l'application (services.take_snapshots).
+        """INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres)
+           SELECT p.id, 'INITIAL', p.quantite - COALESCE(g.stock, 0),
+                  COALESCE(MIN(datetime(p.date_ajout), datetime(g.premier, '-1 second')),
+                           datetime(g.premier, '-1 second'), datetime(p.date_ajout),
+                           g.premier, '1970-01-01 00:00:00'),
+                  '', 'Solde d''ouverture', p.quantite - COALESCE(g.stock, 0)
+           FROM produits p
+           LEFT JOIN (SELECT m.produit_id, MIN(m.date_mvt) AS premier,
+                             SUM(CASE m.type WHEN 'SORTIE' THEN -m.quantite ELSE m.quantite END) AS stock
+                      FROM mouvements m GROUP BY m.produit_id) g ON g.produit_id = p.id
+           WHERE p.quantite != COALESCE(g.stock, 0)""",
+    ]),
+    (9, [
+        # Inventaire à date : la queue de mouvements rejouée après un instantané est lue
+        # dans l'index seul (type et quantité inclus) ; il remplace idx_mvt_produit_date
+        "CREATE INDEX IF NOT EXISTS idx_mvt_grand_livre ON mouvements(produit_id, date_mvt, type, quantite)",
+        "DROP INDEX IF EXISTS idx_mvt_produit_date",
+    ]),
+    (10, [
+        # Coût unitaire moyen pondéré (voir stock.CUMP) : valeur tenue à jour par article,
+        # prix unitaire et CUMP obtenu conservés sur chaque mouvement (NULL avant cette version)
+        "ALTER TABLE produits ADD COLUMN cump REAL",
+        "ALTER TABLE mouvements ADD COLUMN prix_unitaire REAL",
+        "ALTER TABLE mouvements ADD COLUMN cump_apres REAL",
+        # L'inventaire à date lit aussi le CUMP du dernier mouvement dans l'index
+        "DROP INDEX IF EXISTS idx_mvt_grand_livre",
+        """CREATE INDEX IF NOT EXISTS idx_mvt_grand_livre
+           ON mouvements(produit_id, date_mvt, type, quantite, cump_apres)""",
+    ]),
+    (11, [
+        # Les triggers de la migration 6 comptaient aussi INITIAL et AJUSTEMENT (lignes 0/0)
+        "DROP TRIGGER IF EXISTS conso_ai",
+        "DROP TRIGGER IF EXISTS conso_ad",
+        """CREATE TRIGGER IF NOT EXISTS conso_ai AFTER INSERT ON mouvements
+           WHEN new.type IN ('ENTREE', 'SORTIE') BEGIN
+               INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+               VALUES (new.produit_id, substr(new.date_mvt, 1, 10),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (produit_id, jour) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+               VALUES (COALESCE(new.service, ''), substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (service, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+               VALUES ((SELECT COALESCE(nature, '') FROM produits WHERE id = new.produit_id),
+                       substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (nature, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS conso_ad AFTER DELETE ON mouvements
+           WHEN old.type IN ('ENTREE', 'SORTIE') BEGIN
+               UPDATE conso_produit_jour
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE produit_id = old.produit_id AND jour = substr(old.date_mvt, 1, 10);
+               UPDATE conso_service_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE service = COALESCE(old.service, '') AND mois = substr(old.date_mvt, 1, 7);
+               UPDATE conso_nature_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE nature = (SELECT COALESCE(nature, '') FROM produits WHERE id = old.produit_id)
+                  AND mois = substr(old.date_mvt, 1, 7);
+           END""",
+        "DELETE FROM conso_produit_jour",
+        "DELETE FROM conso_service_mois",
+        "DELETE FROM conso_nature_mois",
+        """INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+           SELECT m.produit_id, substr(m.date_mvt, 1, 10),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m WHERE m.type IN ('ENTREE', 'SORTIE') GROUP BY 1, 2""",
+        """INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+           SELECT COALESCE(m.service, ''), substr(m.date_mvt, 1, 7),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m WHERE m.type IN ('ENTREE', 'SORTIE') GROUP BY 1, 2""",
+        """INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+           SELECT COALESCE(p.nature, ''), substr(m.date_mvt, 1, 7),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m JOIN produits p ON p.id = m.produit_id WHERE m.type IN ('ENTREE', 'SORTIE') GROUP BY 1, 2""",
+    ]),
+    (12, [
+        # Dates de mouvement toutes au format AAAA-MM-JJ HH:MM:SS (stock.DATE_MVT) : une date
+        # seule se classait avant les mouvements horodatés du même jour
+        "UPDATE mouvements SET date_mvt = date_mvt || ' 00:00:00' WHERE length(date_mvt) = 10",
+    ]),
+    (13, [
+        # Nature de l'article enregistrée sur le mouvement : conso_nature_mois ne dépend plus
+        # de la nature courante (modifiée depuis, ou article supprimé), ni pour un trigger ni
+        # pour un recalcul complet (rapports.rebuild_aggregates)
+        "ALTER TABLE mouvements ADD COLUMN nature TEXT",
+        """UPDATE mouvements
+              SET nature = (SELECT COALESCE(p.nature, '') FROM produits p WHERE p.id = mouvements.produit_id)""",
+        """CREATE TRIGGER IF NOT EXISTS mvt_nature_ai AFTER INSERT ON mouvements
+           WHEN new.nature IS NULL BEGIN
+               UPDATE mouvements
+                  SET nature = (SELECT COALESCE(nature, '') FROM produits WHERE id = new.produit_id)
+                WHERE id = new.id;
+           END""",
+        "DROP TRIGGER IF EXISTS conso_ai",
+        "DROP TRIGGER IF EXISTS conso_ad",
+        """CREATE TRIGGER IF NOT EXISTS conso_ai AFTER INSERT ON mouvements
+           WHEN new.type IN ('ENTREE', 'SORTIE') BEGIN
+               INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+               VALUES (new.produit_id, substr(new.date_mvt, 1, 10),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (produit_id, jour) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+               VALUES (COALESCE(new.service, ''), substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (service, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+               INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+               VALUES (COALESCE(new.nature, (SELECT COALESCE(nature, '') FROM produits WHERE id = new.produit_id), ''),
+                       substr(new.date_mvt, 1, 7),
+                       CASE new.type WHEN 'ENTREE' THEN new.quantite ELSE 0 END,
+                       CASE new.type WHEN 'SORTIE' THEN new.quantite ELSE 0 END)
+               ON CONFLICT (nature, mois) DO UPDATE
+                   SET entrees = entrees + excluded.entrees, sorties = sorties + excluded.sorties;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS conso_ad AFTER DELETE ON mouvements
+           WHEN old.type IN ('ENTREE', 'SORTIE') BEGIN
+               UPDATE conso_produit_jour
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE produit_id = old.produit_id AND jour = substr(old.date_mvt, 1, 10);
+               UPDATE conso_service_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE service = COALESCE(old.service, '') AND mois = substr(old.date_mvt, 1, 7);
+               UPDATE conso_nature_mois
+                  SET entrees = entrees - CASE old.type WHEN 'ENTREE' THEN old.quantite ELSE 0 END,
+                      sorties = sorties - CASE old.type WHEN 'SORTIE' THEN old.quantite ELSE 0 END
+                WHERE nature = COALESCE(old.nature, '') AND mois = substr(old.date_mvt, 1, 7);
+           END""",
+        "DELETE FROM conso_nature_mois",
+        """INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+           SELECT COALESCE(m.nature, ''), substr(m.date_mvt, 1, 7),
+                  SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END),
+                  SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)
+           FROM mouvements m WHERE m.type IN ('ENTREE', 'SORTIE') GROUP BY 1, 2""",
+    ]),
+]
 
-    conn.commit()
-    conn.close()
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
+def migrate(conn):
+    """Applique, dans la transaction courante, les étapes plus récentes que user_version."""
+    current = schema_version(conn)
+    for version, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        for step in steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        current = version
+    return current
+
+def init_db():
+    with transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS produits (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nom TEXT NOT NULL,
+                nature TEXT,
+                quantite INTEGER NOT NULL DEFAULT 0,
+                prix REAL NOT NULL DEFAULT 0,
+                seuil_min INTEGER NOT NULL DEFAULT 0,
+                date_ajout TEXT NOT NULL,
+                observation TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mouvements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                produit_id INTEGER NOT NULL,
+                type TEXT NOT NULL,            -- ENTREE / SORTIE / INITIAL / AJUSTEMENT
+                quantite INTEGER NOT NULL,
+                date_mvt TEXT NOT NULL,
+                service TEXT,
+                observation TEXT,
+                FOREIGN KEY (produit_id) REFERENCES produits(id)
+            )
+        """)
+        migrate(conn)
+        conn.execute("PRAGMA optimize")
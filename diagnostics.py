@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# Instrumentation des accès à la base (sans dépendance Qt).
+# Chaque requête passée par database.TimedConnection est enregistrée avec l'action
+# de l'interface qui l'a déclenchée : en mémoire (statistiques du dialogue
+# Diagnostics) ; le journal tournant à côté de la base ne reçoit que les requêtes
+# lentes et les attentes de verrou, sauf MAGASIN_DIAGNOSTICS=verbose (toutes les requêtes).
+
+ENABLED = os.environ.get("MAGASIN_DIAGNOSTICS", "1") != "0"
+VERBOSE = os.environ.get("MAGASIN_DIAGNOSTICS", "").lower() == "verbose"
+SLOW_QUERY_MS = 200          # au-delà : EXPLAIN QUERY PLAN joint au journal
+WAIT_MIN_MS = 1              # attentes de verrou plus courtes ignorées
+MAX_RECORDS = 20000          # requêtes conservées en mémoire
+MAX_SLOW = 100
+LOG_FILE = "magasin_sql.log"
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUPS = 5
+
+NO_ACTION = "(arrière-plan)"
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "INSERT", "DELETE")
+
+_action = contextvars.ContextVar("magasin_action", default=None)
+_queries = deque(maxlen=MAX_RECORDS)    # (action, sql, ms, lignes)
+_actions = deque(maxlen=MAX_RECORDS)    # (action, ms) : durée des gestionnaires de l'interface
+_slow = deque(maxlen=MAX_SLOW)          # (heure, action, ms, sql, forme des paramètres, plan)
+_plans = {}                             # sql -> plan (un seul EXPLAIN par requête)
+_logger = None
+_logger_lock = threading.Lock()
+
+
+# === ACTION COURANTE ===
+
+def current_action():
+    return _action.get()
+
+
+@contextmanager
+def action(name):
+    """Attribue à `name` les requêtes exécutées dans le bloc (thread courant)."""
+    token = _action.set(name)
+    try:
+        yield
+    finally:
+        _action.reset(token)
+
+
+def ui_action(name):
+    """Décorateur des gestionnaires de l'interface : durée de l'appel + attribution des requêtes.
+
+    Les arguments positionnels en trop (ex. `checked` de QPushButton.clicked) sont ignorés,
+    comme le fait PyQt pour une méthode non décorée.
+    """
+    def decorate(func):
+        code = func.__code__
+        n_args = None if code.co_flags & 0x04 else code.co_argcount   # 0x04 : *args
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if n_args is not None:
+                args = args[:n_args]
+            token = _action.set(name)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _action.reset(token)
+                if ENABLED:
+                    _actions.append((name, (time.perf_counter() - t0) * 1000))
+        return wrapper
+    return decorate
+
+
+# === ENREGISTREMENT ===
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger("magasin.sql")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                try:
+                    from database import app_dir
+                    log_dir = os.path.join(app_dir(), "logs")
+                    os.makedirs(log_dir, exist_ok=True)
+                    handler = RotatingFileHandler(os.path.join(log_dir, LOG_FILE), maxBytes=LOG_MAX_BYTES,
+                                                  backupCount=LOG_BACKUPS, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+                except OSError:
+                    handler = logging.NullHandler()   # dossier en lecture seule : pas de journal
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def log_path():
+    from database import app_dir
+    return os.path.join(app_dir(), "logs", LOG_FILE)
+
+
+def params_shape(params, many=0):
+    """Forme des paramètres, sans leurs valeurs : « (int, str) », « 2000 × (int, str) »."""
+    if params is None:
+        shape = "()"
+    elif isinstance(params, dict):
+        shape = "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    else:
+        shape = "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return f"{many} × {shape}" if many else shape
+
+
+def _compact(sql):
+    return " ".join(sql.split())
+
+
+def explain(conn, sql, params):
+    plan = _plans.get(sql)
+    if plan is None:
+        words = sql.split(None, 1)
+        if not words or words[0].upper() not in EXPLAINABLE:
+            return None
+        try:
+            # Méthode de base : l'EXPLAIN lui-même n'est pas enregistré
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        except sqlite3.Error:
+            return None
+        plan = _plans[sql] = "\n".join(r[-1] for r in rows)
+    return plan
+
+
+def record(conn, sql, params, seconds, rows, many=0):
+    ms = seconds * 1000
+    name = _action.get() or NO_ACTION
+    text = _compact(sql)
+    _queries.append((name, text, ms, rows))
+    if ms >= SLOW_QUERY_MS:
+        shape = params_shape(params, many)
+        plan = explain(conn, sql, params) if not many else None
+        _slow.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), name, ms, text, shape, plan))
+        _get_logger().warning("LENT %s %.1f ms lignes=%s params=%s | %s\n  plan : %s",
+                              name, ms, rows, shape, text, (plan or "-").replace("\n", "\n          "))
+    elif VERBOSE:
+        _get_logger().info("%s %.1f ms lignes=%s params=%s | %s", name, ms, rows, params_shape(params, many), text)
+
+
+def record_wait(what, seconds):
+    """Attente d'un verrou ou d'une connexion du pool (base occupée par une autre opération)."""
+    ms = seconds * 1000
+    if not ENABLED or ms < WAIT_MIN_MS:
+        return
+    name = _action.get() or NO_ACTION
+    _queries.append((name, f"(attente : {what})", ms, None))
+    _get_logger().info("%s %.1f ms attente : %s", name, ms, what)
+
+
+# === STATISTIQUES ===
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return 0.0
+    k = math.ceil(p / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, k)]
+
+
+def _summarize(groups):
+    result = []
+    for name, values in groups.items():
+        values.sort()
+        result.append({"action": name, "count": len(values),
+                       "p50": percentile(values, 50), "p95": percentile(values, 95),
+                       "p99": percentile(values, 99), "max": values[-1], "total": sum(values)})
+    result.sort(key=lambda r: r["p95"], reverse=True)
+    return result
+
+
+def action_stats():
+    """Durée des gestionnaires de l'interface, par action (ms)."""
+    groups = {}
+    for name, ms in list(_actions):
+        groups.setdefault(name, []).append(ms)
+    return _summarize(groups)
+
+
+def query_stats():
+    """Durée des requêtes SQL regroupées par action (ms), avec le nombre de lignes lues."""
+    groups, rows = {}, {}
+    for name, _, ms, n in list(_queries):
+        groups.setdefault(name, []).append(ms)
+        rows[name] = rows.get(name, 0) + (n or 0)
+    result = _summarize(groups)
+    for r in result:
+        r["rows"] = rows[r["action"]]
+    return result
+
+
+def slow_queries():
+    return list(_slow)
+
+
+def reset():
+    _queries.clear()
+    _actions.clear()
+    _slow.clear()
@@ -0,0 +1,147 @@
+import os
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import database
+import diagnostics
+
+# Fréquence (en lignes) des notifications de progression et des tests d'annulation
+PROGRESS_STEP = 500
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class JobSignals(QObject):
+    started = pyqtSignal(object)
+    progress = pyqtSignal(object, int, int)   # (job, lignes écrites, pourcentage ; -1 : total inconnu)
+    finished = pyqtSignal(object, int)        # (job, lignes écrites)
+    failed = pyqtSignal(object, str)
+    cancelled = pyqtSignal(object)
+
+
+class ExportJob(QRunnable):
+    """Export exécuté hors du thread GUI, sur une connexion de lecture du pool.
+
+    `export_func(rows, save_path)` reçoit un itérable instrumenté : chaque ligne
+    consommée fait avancer la progression, et l'annulation lève ExportCancelled
+    au prochain palier ; le fichier partiel est alors supprimé.
+    `estimate` : (requête, paramètres) d'un COUNT(*) peu coûteux donnant le total
+    approximatif (services.export_estimate) ; sans estimation, la progression est indéterminée.
+    """
+
+    def __init__(self, label, export_func, query, params, save_path, estimate=None, **export_kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.label = label
+        self.export_func = export_func
+        self.query = query
+        self.params = list(params)
+        self.save_path = save_path
+        self.estimate = estimate
+        self.export_kwargs = export_kwargs
+        self.action = diagnostics.current_action() or f"export : {label}"
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+        self.rows_written = 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def _track(self, cursor, total):
+        for row in cursor:
+            yield row
+            self.rows_written += 1
+            if self.rows_written % PROGRESS_STEP == 0:
+                if self._cancelled.is_set():
+                    raise ExportCancelled()
+                pct = min(int(self.rows_written * 100 / total), 99) if total else -1
+                self.signals.progress.emit(self, self.rows_written, pct)
+        if self._cancelled.is_set():
+            raise ExportCancelled()
+
+    def _cleanup(self):
+        try:
+            if os.path.exists(self.save_path):
+                os.remove(self.save_path)
+        except OSError:
+            pass
+
+    def run(self):
+        if self._cancelled.is_set():
+            self.signals.cancelled.emit(self)
+            return
+        self.signals.started.emit(self)
+        try:
+            with diagnostics.action(self.action):
+                self._export()
+        except ExportCancelled:
+            self._cleanup()
+            self.signals.cancelled.emit(self)
+        except Exception as e:
+            self._cleanup()
+            self.signals.failed.emit(self, str(e))
+        else:
+            self.signals.progress.emit(self, self.rows_written, 100)
+            self.signals.finished.emit(self, self.rows_written)
+
+    def _export(self):
+        with database.read() as conn:
+            # Estimation seulement : la requête d'export (tri, jointures) n'est exécutée qu'une fois
+            total = conn.execute(*self.estimate).fetchone()[0] if self.estimate else 0
+            rows = self._track(conn.execute(self.query, self.params), total)
+            self.export_func(rows, self.save_path, **self.export_kwargs)
+
+
+class DownloadJob(ExportJob):
+    """Export produit par le serveur d'inventaire et téléchargé dans `save_path`.
+
+    `download(save_path, progress, cancelled)` renvoie le nombre de lignes exportées
+    (voir backends.HttpBackend.download) ; la progression suit les octets reçus.
+    """
+
+    def __init__(self, label, download, save_path):
+        super().__init__(label, None, None, (), save_path)
+        self.download = download
+
+    def _progress(self, received, total):
+        pct = min(int(received * 100 / total), 99) if total else -1
+        self.signals.progress.emit(self, self.rows_written, pct)
+
+    def _export(self):
+        try:
+            self.rows_written = self.download(self.save_path, self._progress, self._cancelled.is_set)
+        except InterruptedError:
+            raise ExportCancelled()
+
+
+class ExportQueue(QObject):
+    """File d'attente des exports : un seul à la fois, dans un pool distinct de la recherche."""
+    changed = pyqtSignal(int)   # nombre d'exports en attente ou en cours
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._jobs = []
+
+    def submit(self, job):
+        for sig in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            sig.connect(self._done)
+        self._jobs.append(job)
+        self.pool.start(job)
+        self.changed.emit(len(self._jobs))
+        return job
+
+    def _done(self, job, *args):
+        if job in self._jobs:
+            self._jobs.remove(job)
+        self.changed.emit(len(self._jobs))
+
+    def pending(self):
+        return list(self._jobs)
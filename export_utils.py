@@ -1,136 +1,132 @@
+import os
 from datetime import datetime
+from itertools import islice
 
-def export_excel(rows, save_path):
+INVENTORY_HEADERS = ["Article", "Nature", "Quantité", "Prix", "Seuil mini", "Date ajout", "Observation", "CUMP",
+                     "Valeur (Qté*CUMP)"]
+HISTORY_HEADERS = ["Date", "Type", "Article", "Qté", "Destinataire", "Observation", "Stock après", "Prix unitaire"]
+
+# Nombre de lignes examinées pour estimer la largeur des colonnes
+WIDTH_SAMPLE = 500
+
+def _inventory_row(r):
+    # r[7] : CUMP tenu à jour par les entrées (queries.INVENTORY_EXPORT_QUERY)
+    cump = round(float(r[7] or 0), 2)
+    valeur = round((r[2] or 0) * float(r[7] or 0), 2)
+    return [r[0], r[1], r[2], r[3], r[4], r[5], r[6], cump, valeur]
+
+def export_excel_stream(rows, save_path, headers, title, transform=list, sample_size=WIDTH_SAMPLE):
+    """Export Excel en flux (openpyxl write-only) : mémoire bornée quel que soit le nombre de lignes.
+
+    `rows` peut être un curseur SQLite ou tout itérable ; seules les `sample_size`
+    premières lignes sont gardées en mémoire pour dimensionner les colonnes.
+    """
     from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
     from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Inventaire"
-    headers = ["Article", "Nature", "Quantité", "Prix", "Seuil mini", "Date ajout", "Observation", "Valeur (Qté*Prix)"]
-    ws.append(headers)
-    # Styles et ajout des données
+    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+
+    it = iter(rows)
+    sample = [transform(r) for r in islice(it, sample_size)]
+
+    # En mode write-only, les largeurs doivent être fixées avant la première ligne
+    for col, header in enumerate(headers, start=1):
+        max_len = len(str(header))
+        for r in sample:
+            v = r[col-1] if col-1 < len(r) else None
+            max_len = max(max_len, len(str(v)))
+        ws.column_dimensions[get_column_letter(col)].width = max(12, min(50, max_len+2))
+
     header_fill = PatternFill("solid", fgColor="1976D2")
     header_font = Font(color="FFFFFF", bold=True)
     center = Alignment(horizontal="center", vertical="center")
     thin = Side(style="thin", color="CCCCCC")
     border = Border(top=thin, left=thin, right=thin, bottom=thin)
-    for col in range(1, len(headers)+1):
-        cell = ws.cell(row=1, column=col)
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
         cell.fill = header_fill
         cell.font = header_font
         cell.alignment = center
         cell.border = border
-    for r in rows:
-        valeur = (r[2] or 0) * float(r[3] or 0)
-        ws.append([r[0], r[1], r[2], r[3], r[4], r[5], r[6], valeur])
-    for col in ws.columns:
-        max_len = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try: max_len = max(max_len, len(str(cell.value)))
-            except: pass
-        ws.column_dimensions[col_letter].width = max(12, min(50, max_len+2))
-    wb.save(save_path)
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    count = 0
+    saved = False
+    try:
+        for r in sample:
+            ws.append(r)
+            count += 1
+        for r in it:
+            ws.append(transform(r))
+            count += 1
+        wb.save(save_path)
+        saved = True
+    finally:
+        if not saved:
+            # Export interrompu (annulation, erreur) : save() referme la feuille et supprime son
+            # fichier temporaire (à défaut, openpyxl le supprime en fin de processus), puis le
+            # classeur partiel est effacé
+            try:
+                wb.save(save_path)
+            except Exception:
+                pass
+            wb.close()
+            if os.path.exists(save_path):
+                os.remove(save_path)
+    return count
+
+def export_excel(rows, save_path):
+    return export_excel_stream(rows, save_path, INVENTORY_HEADERS, "Inventaire", _inventory_row)
 
 def export_pdf(rows, save_path, title="Inventaire Magasin"):
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet
-    doc = SimpleDocTemplate(save_path, pagesize=landscape(A4), topMargin=24, bottomMargin=24, leftMargin=24, rightMargin=24)
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    title_style.textColor = colors.HexColor("#1976D2")
-    elems = [Paragraph(title, title_style), Spacer(1, 12)]
-    data = [["Article", "Nature", "Quantité", "Prix", "Seuil mini", "Date ajout", "Observation", "Valeur (Qté*Prix)"]]
-    for r in rows:
-        valeur = (r[2] or 0) * float(r[3] or 0)
-        data.append([r[0], r[1], r[2], r[3], r[4], r[5], r[6], valeur])
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#1976D2")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("ALIGN", (0,0), (-1,0), "CENTER"),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("FONTSIZE", (0,0), (-1,0), 10),
-        ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#B0BEC5")),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#E3F2FD")]),
-        ("ALIGN", (2,1), (3,-1), "CENTER"),
-        ("ALIGN", (7,1), (7,-1), "RIGHT"),
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ("LEFTPADDING", (0,0), (-1,-1), 6),
-        ("RIGHTPADDING", (0,0), (-1,-1), 6),
-    ]))
-    elems.append(table)
-    doc.build(elems)
+    from pdf_engine import render_table_pdf
+    return render_table_pdf((_inventory_row(r) for r in rows), save_path, title, INVENTORY_HEADERS,
+                            aligns=[(2, 3, "CENTER"), (7, 8, "RIGHT")])
 
 def export_history_excel(rows, save_path):
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Historique"
-    headers = ["Date", "Type", "Article", "Qté", "Destinataire", "Observation", "Stock après"]
-    ws.append(headers)
-    header_fill = PatternFill("solid", fgColor="1976D2")
-    header_font = Font(color="FFFFFF", bold=True)
-    center = Alignment(horizontal="center", vertical="center")
-    thin = Side(style="thin", color="CCCCCC")
-    border = Border(top=thin, left=thin, right=thin, bottom=thin)
-    for col in range(1, len(headers)+1):
-        cell = ws.cell(row=1, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = center
-        cell.border = border
-    for r in rows:
-        ws.append(list(r))
-    for col in ws.columns:
-        max_len = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try: max_len = max(max_len, len(str(cell.value)))
-            except: pass
-        ws.column_dimensions[col_letter].width = max(12, min(50, max_len+2))
-    wb.save(save_path)
+    return export_excel_stream(rows, save_path, HISTORY_HEADERS, "Historique")
 
 def export_history_pdf(rows, save_path, title="Historique Mouvements"):
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet
-    
-    doc = SimpleDocTemplate(save_path, pagesize=landscape(A4), 
-                           topMargin=24, bottomMargin=24, leftMargin=24, rightMargin=24)
-    
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    title_style.textColor = colors.HexColor("#1976D2")
-    
-    elems = [Paragraph(title, title_style), Spacer(1, 12)]
-    
-    # Définition des en-têtes (ici on les définit explicitement)
-    headers = ["Date", "Type", "Article", "Qté", "Destinataire", "Observation", "Stock après"]
-    
-    data = [headers]  # ← maintenant headers existe
+    from pdf_engine import render_table_pdf
+    return render_table_pdf(rows, save_path, title, HISTORY_HEADERS,
+                            aligns=[(3, 3, "CENTER"), (6, 7, "RIGHT")])
+
+# Inventaire à date (rapports.valuation_query), par article ou par nature
+VALUATION_HEADERS = {
+    "produit": ["Article", "Nature", "Quantité", "CUMP", "Valeur (Qté*CUMP)"],
+    "nature": ["Nature", "Articles", "Quantité", "Valeur"],
+}
+
+def _with_total(rows, value_col):
+    # Ligne « Total » ajoutée après la dernière ligne, sommée au fil du flux
+    total = 0.0
+    width = 0
     for r in rows:
-        data.append(list(r))
-    
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#1976D2")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("ALIGN", (0,0), (-1,0), "CENTER"),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("FONTSIZE", (0,0), (-1,0), 10),
-        ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#B0BEC5")),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#E3F2FD")]),
-        ("ALIGN", (3,1), (3,-1), "CENTER"),
-        ("ALIGN", (6,1), (6,-1), "RIGHT"),
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ("LEFTPADDING", (0,0), (-1,-1), 6),
-        ("RIGHTPADDING", (0,0), (-1,-1), 6),
-    ]))
-    
-    elems.append(table)
-    doc.build(elems)
\ No newline at end of file
+        r = list(r)
+        total += float(r[value_col] or 0)
+        width = len(r)
+        yield r
+    if width:
+        yield ["Total"] + [""] * (value_col - 1) + [round(total, 2)] + [""] * (width - value_col - 1)
+
+def _valuation_title(date):
+    day = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
+    return f"Inventaire au {day.strftime('%d/%m/%Y')}"
+
+def export_valuation_excel(rows, save_path, date=None, axe="produit"):
+    headers = VALUATION_HEADERS[axe]
+    title = f"Inventaire {date or datetime.now().strftime('%Y-%m-%d')}"
+    n = export_excel_stream(_with_total(rows, len(headers) - 1), save_path, headers, title)
+    return max(n - 1, 0)   # sans la ligne Total
+
+def export_valuation_pdf(rows, save_path, date=None, axe="produit"):
+    from pdf_engine import render_table_pdf
+    headers = VALUATION_HEADERS[axe]
+    last = len(headers) - 1
+    n = render_table_pdf(_with_total(rows, last), save_path, _valuation_title(date), headers,
+                         aligns=[(last - 2, last - 1, "CENTER"), (last, last, "RIGHT")])
+    return max(n - 1, 0)
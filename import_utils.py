@@ -0,0 +1,345 @@
+import csv
+import os
+import sys
+import unicodedata
+from datetime import datetime
+from itertools import islice
+
+import database
+import queries
+import stock
+
+# Import en masse d'articles et de mouvements depuis un fichier CSV ou XLSX.
+# Le fichier est lu en flux, chaque ligne est validée, puis les lignes valides
+# sont écrites par lots, dans une transaction par lot (executemany pour les articles ;
+# les mouvements, triés par date, passent par stock.enregistrer_mouvement).
+
+BATCH_SIZE = 2000
+
+# Libellés d'en-tête acceptés (normalisés : minuscules, sans accents) -> colonne
+ALIASES = {
+    "id": "id", "produit_id": "id", "id article": "id",
+    "article": "nom", "nom": "nom", "designation": "nom",
+    "nature": "nature", "categorie": "nature",
+    "quantite": "quantite", "qte": "quantite", "stock": "quantite",
+    "prix": "prix", "prix unitaire": "prix",
+    "seuil": "seuil_min", "seuil mini": "seuil_min", "seuil_min": "seuil_min",
+    "date ajout": "date_ajout", "date_ajout": "date_ajout",
+    "observation": "observation", "remarque": "observation",
+    "type": "type", "mouvement": "type",
+    "date": "date_mvt", "date_mvt": "date_mvt", "date mouvement": "date_mvt",
+    "destinataire": "service", "service": "service",
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%d/%m/%Y %H:%M")
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = []   # [(n° de ligne, motif), ...]
+
+    @property
+    def accepted(self):
+        return self.inserted + self.updated
+
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+    def summary(self):
+        return (f"{self.inserted} ajout(s), {self.updated} mise(s) à jour, "
+                f"{len(self.rejected)} ligne(s) rejetée(s)")
+
+
+def _normalize(label):
+    label = unicodedata.normalize("NFKD", str(label or "")).encode("ascii", "ignore").decode()
+    return " ".join(label.lower().replace("(", " ").replace(")", " ").split())
+
+
+def read_rows(path):
+    """Génère (n° de ligne, dict colonne -> valeur) depuis un CSV ou un XLSX, sans tout charger."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            yield from _map_rows(header, rows)
+        finally:
+            wb.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+            except csv.Error:
+                dialect = csv.excel
+            rows = csv.reader(f, dialect)
+            header = next(rows, None)
+            yield from _map_rows(header, rows)
+
+
+def _map_rows(header, rows):
+    if not header:
+        return
+    columns = [ALIASES.get(_normalize(h)) for h in header]
+    for line, values in enumerate(rows, start=2):
+        record = {}
+        for col, v in zip(columns, values):
+            if col is None:
+                continue
+            if isinstance(v, str):
+                v = v.strip()
+            record[col] = None if v == "" else v
+        if any(v is not None for v in record.values()):
+            yield line, record
+
+
+def _int(value, field, minimum=0):
+    if value is None:
+        return 0
+    try:
+        n = int(float(str(value).replace(",", ".")))
+    except ValueError:
+        raise ValueError(f"{field} invalide : {value!r}")
+    if n < minimum:
+        raise ValueError(f"{field} doit être ≥ {minimum}")
+    return n
+
+
+def _float(value, field):
+    if value is None:
+        return 0.0
+    try:
+        n = float(str(value).replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{field} invalide : {value!r}")
+    if n < 0:
+        raise ValueError(f"{field} doit être ≥ 0")
+    return n
+
+
+def _date(value, with_time=False):
+    """Date d'article (AAAA-MM-JJ) ou, `with_time`, date de mouvement (stock.DATE_MVT) :
+    une date sans heure prend l'heure courante, minuit explicite est conservé."""
+    if value is None:
+        return stock.horodatage() if with_time else datetime.now().strftime("%Y-%m-%d")
+    if isinstance(value, datetime):
+        return stock.horodatage(value) if with_time else value.strftime("%Y-%m-%d")
+    for fmt in DATE_FORMATS:
+        try:
+            d = datetime.strptime(str(value), fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"date invalide : {value!r}")
+    if not with_time:
+        return d.strftime("%Y-%m-%d")
+    return stock.horodatage(d if "%H" in fmt else d.strftime("%Y-%m-%d"))
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# === ARTICLES ===
+
+def _validate_produit(record):
+    nom = record.get("nom")
+    if not nom:
+        raise ValueError("article (nom) obligatoire")
+    return (str(nom).strip(), record.get("nature") or "",
+            _int(record.get("quantite"), "quantité"), _float(record.get("prix"), "prix"),
+            _int(record.get("seuil_min"), "seuil mini"), _date(record.get("date_ajout")),
+            record.get("observation") or "")
+
+
+# Conversion des colonnes d'un article existant : seules les cellules renseignées sont mises à jour
+_PRODUIT_CHANGES = {
+    "nom": lambda v: str(v).strip(),
+    "nature": lambda v: v,
+    "quantite": lambda v: _int(v, "quantité"),
+    "prix": lambda v: _float(v, "prix"),
+    "seuil_min": lambda v: _int(v, "seuil mini"),
+    "date_ajout": _date,
+    "observation": lambda v: v,
+}
+
+
+def _produit_changes(record):
+    """Colonnes fournies par la ligne pour un article existant : {colonne: valeur}.
+
+    Une colonne absente du fichier (ou une cellule vide) laisse la valeur en base
+    intacte : un tarif sans quantités ne remet pas les stocks à zéro.
+    """
+    return {col: conv(record[col]) for col, conv in _PRODUIT_CHANGES.items() if record.get(col) is not None}
+
+
+def import_produits(path, batch_size=BATCH_SIZE):
+    """Ajoute ou met à jour des articles ; clé : colonne id si présente, sinon (nom, nature).
+
+    Un nouvel article prend les valeurs par défaut des colonnes absentes ; un article
+    existant ne reçoit que les colonnes renseignées.
+    """
+    report = ImportReport()
+    updated = set()   # articles mis à jour : un article présent sur plusieurs lignes compte une fois
+    with database.read() as conn:
+        ids = set(r[0] for r in conn.execute("SELECT id FROM produits"))
+        by_key = {(nom.lower(), nature or ""): pid
+                  for pid, nom, nature in conn.execute("SELECT id, nom, nature FROM produits")}
+
+    for batch in _batches(read_rows(path), batch_size):
+        inserts, updates = {}, {}   # (nom, nature) -> valeurs ; id -> {colonne: valeur} ; la dernière ligne l'emporte
+        for line, record in batch:
+            pid = record.get("id")
+            try:
+                if pid is not None:
+                    try:
+                        pid = int(pid)
+                    except ValueError:
+                        raise ValueError(f"id invalide : {pid!r}")
+                    if pid not in ids:
+                        raise ValueError(f"article id={pid} introuvable")
+                    values = None
+                else:
+                    values = _validate_produit(record)
+                    pid = by_key.get((values[0].lower(), values[1]))
+                if pid is None:
+                    inserts[(values[0].lower(), values[1])] = values
+                    continue
+                changes = _produit_changes(record)
+                if "nom" in changes and not changes["nom"]:
+                    raise ValueError("article (nom) obligatoire")
+            except ValueError as e:
+                report.reject(line, str(e))
+                continue
+            updates.setdefault(pid, {}).update(changes)
+        with database.transaction() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM produits").fetchone()[0]
+            ledger = []   # quantités à inscrire au grand livre : (id, avant, après)
+            if inserts:
+                conn.executemany("""
+                    INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, list(inserts.values()))
+                # Les lots suivants mettront à jour ces articles au lieu de les dupliquer
+                for pid, nom, nature, qte in conn.execute(
+                        "SELECT id, nom, nature, quantite FROM produits WHERE id > ?", (last_id,)):
+                    ids.add(pid)
+                    by_key[(nom.lower(), nature or "")] = pid
+                    ledger.append((pid, None, qte))
+            if updates:
+                # Quantités relues sous le verrou d'écriture, pour l'écart à inscrire
+                clause, params = queries.ids_filter("id", [pid for pid, c in updates.items() if "quantite" in c])
+                avant = dict(conn.execute(f"SELECT id, quantite FROM produits WHERE 1=1{clause}", params))
+                by_columns = {}   # une instruction par combinaison de colonnes fournies
+                for pid, changes in updates.items():
+                    if not changes:
+                        continue
+                    if pid in avant:   # absent : supprimé entre-temps, l'UPDATE sera sans effet
+                        ledger.append((pid, avant[pid], changes["quantite"]))
+                    columns = tuple(sorted(changes))
+                    by_columns.setdefault(columns, []).append(tuple(changes[c] for c in columns) + (pid,))
+                for columns, rows in by_columns.items():
+                    conn.executemany(f"UPDATE produits SET {', '.join(f'{c}=?' for c in columns)} WHERE id=?", rows)
+            stock.journaliser_quantites(conn, ledger, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                        "Import d'articles")
+        report.inserted += len(inserts)
+        updated.update(updates)
+    report.updated = len(updated)
+    return report
+
+
+# === MOUVEMENTS ===
+
+def import_mouvements(path, batch_size=BATCH_SIZE):
+    """Importe des mouvements ENTREE/SORTIE ; l'article est désigné par son id ou son nom.
+
+    La colonne prix, facultative, donne le prix unitaire des ENTREE (CUMP recalculé).
+    Les lignes valides sont enregistrées dans l'ordre (date, n° de ligne), quel que soit
+    leur ordre dans le fichier, par stock.enregistrer_mouvement : une ligne antérieure aux
+    mouvements déjà en base les recalcule, et une ligne qui rend le stock négatif à une
+    date est rejetée seule.
+    """
+    report = ImportReport()
+    with database.read() as conn:
+        known = set(r[0] for r in conn.execute("SELECT id FROM produits"))
+        by_name = {}
+        for pid, nom in conn.execute("SELECT id, nom FROM produits ORDER BY id"):
+            by_name.setdefault(nom.lower(), pid)
+
+    valid = []   # (date, n° de ligne, ...) : trié avant écriture
+    for line, record in read_rows(path):
+        try:
+            pid = record.get("id")
+            if pid is not None:
+                pid = int(pid)
+            elif record.get("nom"):
+                pid = by_name.get(str(record["nom"]).strip().lower())
+            if pid is None or pid not in known:
+                raise ValueError("article introuvable")
+            type_mvt = str(record.get("type") or "").upper()
+            if type_mvt not in ("ENTREE", "SORTIE"):
+                raise ValueError(f"type invalide : {record.get('type')!r} (ENTREE/SORTIE)")
+            qte = _int(record.get("quantite"), "quantité", minimum=1)
+            date_mvt = _date(record.get("date_mvt"), with_time=True)
+            # Prix unitaire d'une ENTREE (colonne facultative) : met à jour le CUMP
+            prix = _float(record.get("prix"), "prix") if record.get("prix") is not None else None
+        except ValueError as e:
+            report.reject(line, str(e))
+            continue
+        valid.append((date_mvt, line, pid, type_mvt, qte, record.get("service") or "",
+                      record.get("observation") or "", prix if type_mvt == "ENTREE" else None))
+    valid.sort(key=lambda v: v[:2])
+
+    for batch in _batches(valid, batch_size):
+        with database.transaction() as conn:
+            for date_mvt, line, pid, type_mvt, qte, service, observation, prix in batch:
+                conn.execute("SAVEPOINT ligne")
+                try:
+                    stock.enregistrer_mouvement(conn, pid, type_mvt, qte, date_mvt, service, observation, prix)
+                except stock.StockInsuffisant as e:
+                    conn.execute("ROLLBACK TO ligne")
+                    report.reject(line, f"stock insuffisant ({e.disponible} disponible(s) à cette date)")
+                except ValueError:   # article supprimé depuis la lecture du fichier
+                    conn.execute("ROLLBACK TO ligne")
+                    report.reject(line, "article introuvable")
+                else:
+                    report.inserted += 1
+                conn.execute("RELEASE ligne")
+    report.rejected.sort()
+    return report
+
+
+IMPORTERS = {
+    "produits": import_produits,
+    "mouvements": import_mouvements,
+}
+
+
+def print_report(report, out=sys.stdout):
+    print(report.summary(), file=out)
+    for line, reason in report.rejected:
+        print(f"  ligne {line} : {reason}", file=out)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Import en masse (CSV / XLSX) dans magasin.db")
+    parser.add_argument("type", choices=sorted(IMPORTERS))
+    parser.add_argument("fichier")
+    parser.add_argument("--lot", type=int, default=BATCH_SIZE, help="lignes par transaction")
+    args = parser.parse_args()
+    database.init_db()
+    report = IMPORTERS[args.type](args.fichier, args.lot)
+    print_report(report)
+    sys.exit(1 if report.rejected else 0)
@@ -1,11 +1,25 @@
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QMessageBox
-from PyQt5.QtCore import Qt
-from magasin import MagasinApp  # Import de la fenêtre principale
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+import threading
+
+import backends
+import services
+
+# La fenêtre principale (magasin et ses dépendances) n'est pas importée ici :
+# elle est chargée en arrière-plan pendant la saisie du mot de passe.
 
 class LoginWindow(QWidget):
-    def __init__(self):
+    preloaded = pyqtSignal()   # base initialisée et module magasin importé
+
+    def __init__(self, preload=True):
         super().__init__()
+        self.main_app = None
+        self._preload_error = None
+        self._preload_thread = threading.Thread(target=self._preload, daemon=True)
+        self.preloaded.connect(self._build_main_app)
+        if preload:
+            QTimer.singleShot(0, self._preload_thread.start)   # après le premier affichage
         self.setWindowTitle("Gestion Magasin - DRB Alger")
         self.setFixedSize(420, 560)
         self.setWindowFlags(Qt.FramelessWindowHint)
@@ -77,14 +91,45 @@ class LoginWindow(QWidget):
         qr.moveCenter(cp)
         self.move(qr.topLeft())
 
+    # --- Préchargement de la fenêtre principale ---
+    def _preload(self):
+        # Thread secondaire : aucun widget n'est créé ici
+        try:
+            backend = backends.get_backend()
+            backend.init()   # base locale ; rien à faire en mode serveur
+            if not backend.remote:
+                services.take_snapshots()   # en mode serveur, c'est le serveur qui s'en charge
+            import catalogue
+            catalogue.get_catalogue().refresh()   # premier clic sur un article sans attente
+            import magasin  # noqa: F401
+        except Exception as e:
+            self._preload_error = e
+        self.preloaded.emit()
+
+    def _build_main_app(self):
+        # Thread GUI, dès que le préchargement est terminé : la fenêtre est construite cachée
+        if self.main_app is None and self._preload_error is None:
+            from magasin import MagasinApp
+            self.main_app = MagasinApp()
+
+    def _main_app(self):
+        if self.main_app is None:
+            if self._preload_thread.is_alive():
+                self._preload_thread.join()
+            elif not self._preload_thread.ident:
+                self._preload()   # préchargement désactivé
+            if self._preload_error is not None:
+                raise self._preload_error
+            self._build_main_app()
+        return self.main_app
+
     def check_login(self):
         CORRECT_PASSWORD = "drb2025"
 
         
         if self.password_input.text() == CORRECT_PASSWORD:
             self.hide()
-            self.main_app = MagasinApp()
-            self.main_app.show()
+            self._main_app().show()
         else:
             QMessageBox.critical(self, "Accès refusé", "Mot de passe incorrect.")
             self.password_input.clear()
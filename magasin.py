@@ -1,27 +1,40 @@
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QColor
 from datetime import datetime
-
-from database import get_conn
+import functools
+
+import backends
+import catalogue
+import diagnostics
+import export_utils
+import services
+import stock
+import rapports
+from constantes import DESTINATAIRES, CATEGORIES
 from widgets import ModernComboBox, StyledItemDelegate
-from export_utils import export_excel, export_pdf, export_history_excel, export_history_pdf
-
-DESTINATAIRES = [
-    "CBW Alger", "CBW Boumerdes", "CBW Laghouat", "CBW Bouira",
-    "CBW Blida", "CBW Djelfa", "CBW Medea", "CBW Tizi ouzou",
-    "Bureau Informatique", "Bureau Suivi", "Bureau Personnel",
-    "Bureau Comptabilité", "Bureau Moyen", "secretariat", 
-    "Bureau Prevision", "Bureau Reglementation", "Bureau Formation",
-    "Bureau Inspection", 
-    "Autres"
-]
+from workers import SearchController, ChangeFeed
+from models import InventoryModel, HistoryModel
+from export_jobs import ExportJob, DownloadJob, ExportQueue
+
+# Délai (ms) entre la dernière frappe et le lancement de la recherche
+SEARCH_DEBOUNCE_MS = 250
+# Intervalle (ms) de lecture du journal des modifications (autres fenêtres, autres postes)
+CHANGES_POLL_MS = 1000
 
 class MagasinApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.selected_id = None
-        self.setWindowTitle("Gestion Magasin - DRB Alger")
+        self.selected_qte = None
+        # Base locale ou serveur d'inventaire (MAGASIN_SERVEUR), voir backends.py
+        self.backend = backends.get_backend()
+        self.catalogue = catalogue.get_catalogue()
+        self.catalogue.refresh()   # déjà chargé au préchargement : simple lecture du journal
+        title = "Gestion Magasin - DRB Alger"
+        if self.backend.remote:
+            title += f" — serveur {self.backend.url}"
+        self.setWindowTitle(title)
         self.resize(1200, 700)
         self.setMinimumSize(1000, 600)
 
@@ -35,7 +48,7 @@ class MagasinApp(QMainWindow):
             }
             QPushButton:hover { background-color: #1E88E5; }
             QPushButton:disabled { background-color: #90CAF9; }
-            QTableWidget {
+            QTableWidget, QTableView {
                 background: #FFFFFF; gridline-color: #E3F2FD; alternate-background-color: #F5F9FF;
             }
             QHeaderView::section {
@@ -65,6 +78,22 @@ class MagasinApp(QMainWindow):
         btn_hist_dest.clicked.connect(self.ouvrir_historique_par_destinataire)
         toolbar.addWidget(btn_hist_dest)
 
+        btn_rapport = QPushButton("Consommation")
+        btn_rapport.clicked.connect(self.ouvrir_rapport_consommation)
+        toolbar.addWidget(btn_rapport)
+
+        btn_inventaire_date = QPushButton("Inventaire à date")
+        btn_inventaire_date.clicked.connect(self.ouvrir_inventaire_date)
+        toolbar.addWidget(btn_inventaire_date)
+
+        btn_import = QPushButton("Importer")
+        btn_import.clicked.connect(self.on_import)
+        toolbar.addWidget(btn_import)
+
+        btn_diag = QPushButton("Diagnostics")
+        btn_diag.clicked.connect(self.ouvrir_diagnostics)
+        toolbar.addWidget(btn_diag)
+
         self.btn_affecter = QPushButton("Affectation")
         self.btn_affecter.setStyleSheet("""
             QPushButton { background-color: #D32F2FA4; color: white; padding: 8px 16px; border-radius: 10px; }
@@ -74,20 +103,24 @@ class MagasinApp(QMainWindow):
         self.btn_affecter.setEnabled(False)
         toolbar.addWidget(self.btn_affecter)
 
+        btn_affecter_lot = QPushButton("Affectation groupée")
+        btn_affecter_lot.setStyleSheet(self.btn_affecter.styleSheet())
+        btn_affecter_lot.clicked.connect(self.ouvrir_affectation_lot)
+        toolbar.addWidget(btn_affecter_lot)
+
         # === RECHERCHE + FILTRE ===
         self.search = QLineEdit()
         self.search.setPlaceholderText("Rechercher par article...")
-        self.search.textChanged.connect(self.load_table)
+        self.search_mode = self.backend.search_mode()
+        self.search_ctrl = SearchController(self._inventory_query, SEARCH_DEBOUNCE_MS, self)
+        self.search_ctrl.results.connect(self._fill_table)
+        self.search_ctrl.failed.connect(lambda msg: QMessageBox.critical(self, "Erreur", msg))
+        self.search.textChanged.connect(self.search_ctrl.schedule)
 
         self.filter_nature = ModernComboBox()
         self.filter_nature.setMaximumWidth(300)
         self.filter_nature.addItem("Toutes les catégories", "")
-        categories = [
-            "MATERIELS INFORMATIQUES", "FOURNITURES DE BUREAUX", "PRODUITS D'ENTRETIEN MENNAGER",
-            "HABILLEMENTS", "MOBILIER DE BUREAU", "PARC AUTO", "CONFECTION DES FOURNITURS IMPRIMEES",
-            "CONSOMMABLE INFORMATIQUE", "PRODUITS PHARMACEUTIQUES", "EAUX"
-        ]
-        for cat in categories:
+        for cat in CATEGORIES:
             self.filter_nature.addItem(cat, cat)
         self.filter_nature.currentIndexChanged.connect(self.load_table)
         self.filter_nature.setItemDelegate(StyledItemDelegate(self.filter_nature))
@@ -101,15 +134,16 @@ class MagasinApp(QMainWindow):
         search_bar.addStretch()
 
         # === TABLEAU ===
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels([
-            "Article", "Nature", "Quantité", "Prix", "Seuil mini", "Date ajout", "Observation"
-        ])
+        self.model = InventoryModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.setAlternatingRowColors(True)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(28)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.clicked.connect(self.on_row_click)
 
         # === FORMULAIRE ===
@@ -117,7 +151,7 @@ class MagasinApp(QMainWindow):
         self.nom.setMaximumWidth(280)
         self.nature = ModernComboBox()
         self.nature.setMaximumWidth(280)
-        for cat in categories:
+        for cat in CATEGORIES:
             self.nature.addItem(cat, cat)
         self.nature.setItemDelegate(StyledItemDelegate(self.nature))
 
@@ -186,8 +220,32 @@ class MagasinApp(QMainWindow):
         main.addLayout(hnums)
         main.addLayout(crud)
 
+        # === EXPORTS (barre d'état) ===
+        self.exports = ExportQueue(self)
+        self.exports.changed.connect(self._on_exports_changed)
+        self._export_current = None
+        self.export_label = QLabel("")
+        self.export_progress = QProgressBar()
+        self.export_progress.setRange(0, 100)
+        self.export_progress.setMaximumWidth(220)
+        self.btn_export_cancel = QPushButton("Annuler l'export")
+        self.btn_export_cancel.clicked.connect(self._cancel_export)
+        self.export_queue_label = QLabel("")
+        status = self.statusBar()
+        status.addPermanentWidget(self.export_queue_label)
+        status.addPermanentWidget(self.export_label)
+        status.addPermanentWidget(self.export_progress)
+        status.addPermanentWidget(self.btn_export_cancel)
+        for w in (self.export_label, self.export_progress, self.btn_export_cancel):
+            w.hide()
+
+        # === MODIFICATIONS (ce poste et les autres) ===
+        # Les vues n'appliquent que les lignes modifiées au lieu de tout relire
+        self.changes = ChangeFeed(self.backend, CHANGES_POLL_MS, self)
+        self.changes.changed.connect(self._on_changes)
+        self.changes.start()
+
         self.load_table()
-        self.update_badge()
 
     def _labeled(self, text, widget):
         container = QWidget()
@@ -200,50 +258,58 @@ class MagasinApp(QMainWindow):
         vbox.addWidget(widget)
         return container
 
+    @diagnostics.ui_action("load_table")
     def load_table(self):
+        # Rechargement immédiat (après écriture) : pas de temporisation
+        self.search_ctrl.run()
+        self.update_badge()
+
+    def _inventory_query(self):
         key = self.search.text().strip()
         nature_filter = self.filter_nature.currentData()
+        return self.backend.search_request(key, nature_filter, self.search_mode)
 
-        conn = get_conn()
-        c = conn.cursor()
-        query = """SELECT nom, nature, quantite, prix, seuil_min, date_ajout, observation, id 
-                   FROM produits WHERE 1=1"""
-        params = []
-        if key:
-            query += " AND nom LIKE ?"
-            params.append(f"%{key}%")
-        if nature_filter:
-            query += " AND nature = ?"
-            params.append(nature_filter)
-        query += " ORDER BY nom ASC"
-        c.execute(query, params)
-        rows = c.fetchall()
-        conn.close()
-
-        self.table.setRowCount(len(rows))
-        for i, r in enumerate(rows):
-            for j in range(7):
-                item = QTableWidgetItem(str(r[j]) if r[j] is not None else "")
-                if j in (2, 3, 4):
-                    item.setTextAlignment(Qt.AlignCenter)
-                if r[2] is not None and r[4] is not None and r[2] < r[4]:
-                    item.setForeground(QColor("#D32F2F"))
-                self.table.setItem(i, j, item)
-            self.table.item(i, 0).setData(Qt.UserRole, r[7])  # ID caché
+    def _fill_table(self, rows):
+        self.model.set_rows(rows)
 
-        self.table.resizeRowsToContents()
-        self.update_badge()
+    @diagnostics.ui_action("modifications")
+    def _on_changes(self, changes):
+        ids = changes["produits"] + changes["produits_supprimes"]
+        if not ids and not changes["reset"]:
+            return
+        self.catalogue.refresh()   # une seule mise à jour du catalogue par notification
+        if changes["reset"] or self.search.text().strip() or self.search_ctrl.pending():
+            # Retard trop important, tri par pertinence ou recherche en cours : relecture complète
+            self.load_table()
+        else:
+            rows = []
+            if changes["produits"]:
+                rows = self.backend.search_products("", self.filter_nature.currentData(), self.search_mode,
+                                                    changes["produits"])
+            self.model.apply_changes(rows, ids)
+            self.update_badge()
+        if self.selected_id in changes["produits_supprimes"]:
+            self.clear_form()
 
+    @diagnostics.ui_action("on_row_click")
     def on_row_click(self, index):
-        row = index.row()
-        self.selected_id = self.table.item(row, 0).data(Qt.UserRole)
-        self.nom.setText(self.table.item(row, 0).text())
-        self.nature.setCurrentText(self.table.item(row, 1).text())
-        self.quantite.setValue(int(float(self.table.item(row, 2).text() or 0)))
-        self.prix.setValue(float(self.table.item(row, 3).text() or 0))
-        self.seuil.setValue(int(float(self.table.item(row, 4).text() or 0)))
-        self.date.setText(self.table.item(row, 5).text())
-        self.observation.setText(self.table.item(row, 6).text())
+        produit_id = self.model.row_id(index.row())
+        if produit_id is None:
+            return
+        # Valeurs du catalogue (tenu à jour par _on_changes), sans requête
+        p = self.catalogue.get(produit_id)
+        if p is None:
+            self.clear_form()
+            return
+        self.selected_id = produit_id
+        self.selected_qte = p.quantite   # quantité lue : contrôle optimiste dans update_product
+        self.nom.setText(p.nom)
+        self.nature.setCurrentText(p.nature or "")
+        self.quantite.setValue(int(p.quantite or 0))
+        self.prix.setValue(float(p.prix or 0))
+        self.seuil.setValue(int(p.seuil_min or 0))
+        self.date.setText(p.date_ajout or "")
+        self.observation.setText(p.observation or "")
 
         self.btn_update.setEnabled(True)
         self.btn_delete.setEnabled(True)
@@ -252,6 +318,7 @@ class MagasinApp(QMainWindow):
 
     def clear_form(self):
         self.selected_id = None
+        self.selected_qte = None
         self.nom.clear()
         self.nature.setCurrentIndex(0)
         self.quantite.setValue(0)
@@ -265,114 +332,173 @@ class MagasinApp(QMainWindow):
         self.btn_add.setEnabled(True)           # ← RÉACTIVER AJOUTER
         self.table.clearSelection()
 
+    def _form_values(self):
+        return {"nom": self.nom.text().strip(), "nature": self.nature.currentText(),
+                "quantite": self.quantite.value(), "prix": self.prix.value(), "seuil_min": self.seuil.value(),
+                "date_ajout": self.date.text(), "observation": self.observation.text().strip()}
+
     def add_product(self):
         if not self.nom.text().strip():
             QMessageBox.warning(self, "Erreur", "L'article est obligatoire.")
             return
-        conn = get_conn()
-        c = conn.cursor()
         try:
-            c.execute("""
-                INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (self.nom.text().strip(), self.nature.currentText(), self.quantite.value(),
-                  self.prix.value(), self.seuil.value(), self.date.text(), self.observation.text().strip()))
-            conn.commit()
+            with diagnostics.action("add_product"):
+                self.backend.add_product(self._form_values())
             QMessageBox.information(self, "Succès", "Article ajouté.")
             self.clear_form()
-            self.load_table()
+            self.changes.poll()
         except Exception as e:
             QMessageBox.critical(self, "Erreur", str(e))
-        finally:
-            conn.close()
 
     def update_product(self):
         if not self.selected_id:
             QMessageBox.warning(self, "Erreur", "Sélectionnez un article.")
             return
-        conn = get_conn()
-        c = conn.cursor()
         try:
-            c.execute("""
-                UPDATE produits SET nom=?, nature=?, quantite=?, prix=?, seuil_min=?, date_ajout=?, observation=?
-                WHERE id=?
-            """, (self.nom.text().strip(), self.nature.currentText(), self.quantite.value(),
-                  self.prix.value(), self.seuil.value(), self.date.text(), self.observation.text().strip(),
-                  self.selected_id))
-            conn.commit()
+            with diagnostics.action("update_product"):
+                # Refusé si un autre poste a modifié le stock depuis la sélection de l'article
+                ok = self.backend.update_product(self.selected_id, self._form_values(), self.selected_qte)
+            if not ok:
+                QMessageBox.warning(self, "Article modifié ailleurs",
+                                    "Le stock de cet article a changé depuis sa sélection.\n"
+                                    "Le tableau a été actualisé : sélectionnez à nouveau l'article.")
+                self.clear_form()
+                self.load_table()
+                return
             QMessageBox.information(self, "Succès", "Article modifié.")
             self.clear_form()
-            self.load_table()
+            self.changes.poll()
         except Exception as e:
             QMessageBox.critical(self, "Erreur", str(e))
-        finally:
-            conn.close()
 
     def delete_product(self):
         if not self.selected_id:
             return
         if QMessageBox.question(self, "Confirmer", "Supprimer cet article ?") != QMessageBox.Yes:
             return
-        conn = get_conn()
-        c = conn.cursor()
         try:
-            c.execute("DELETE FROM produits WHERE id=?", (self.selected_id,))
-            conn.commit()
+            with diagnostics.action("delete_product"):
+                self.backend.delete_product(self.selected_id)
             QMessageBox.information(self, "Succès", "Article supprimé.")
             self.clear_form()
-            self.load_table()
+            self.changes.poll()
         except Exception as e:
             QMessageBox.critical(self, "Erreur", str(e))
-        finally:
-            conn.close()
 
+    @diagnostics.ui_action("update_badge")
     def update_badge(self):
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM produits WHERE quantite < seuil_min AND seuil_min > 0")
-        n = c.fetchone()[0]
-        conn.close()
+        n, alertes = self.backend.low_stock(20)
         self.badge_low.setText(f"{n} article(s) en alerte" if n else "")
+        noms = [f"{r[0]} ({r[2]} / {r[4]})" for r in alertes]
+        if n > len(noms):
+            noms.append("…")
+        self.badge_low.setToolTip("\n".join(noms))
+
+    def _has_products(self):
+        return self.backend.has_products()
 
     def on_export_excel(self):
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT nom, nature, quantite, prix, seuil_min, date_ajout, observation FROM produits ORDER BY nom")
-        rows = c.fetchall()
-        conn.close()
-        if not rows:
+        if not self._has_products():
             return
         path, _ = QFileDialog.getSaveFileName(self, "Exporter Excel", "", "Excel (*.xlsx)")
         if path:
-            export_excel(rows, path)
+            self._submit_export("Inventaire Excel", "inventaire", "xlsx", {}, path)
 
     def on_export_pdf(self):
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT nom, nature, quantite, prix, seuil_min, date_ajout, observation FROM produits ORDER BY nom")
-        rows = c.fetchall()
-        conn.close()
-        if not rows:
+        if not self._has_products():
             return
         path, _ = QFileDialog.getSaveFileName(self, "Exporter PDF", "", "PDF (*.pdf)")
         if path:
-            export_pdf(rows, path)
+            self._submit_export("Inventaire PDF", "inventaire", "pdf", {}, path)
 
-    def open_affectation(self):
-        # Remplacer la méthode open_affectation par cette version améliorée :
+    def on_import(self):
+        kinds = {"Articles": "produits", "Mouvements": "mouvements"}
+        kind, ok = QInputDialog.getItem(self, "Importer", "Type de données :", list(kinds), 0, False)
+        if not ok:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Importer", "", "CSV / Excel (*.csv *.xlsx)")
+        if not path:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            with diagnostics.action("on_import"):
+                report = self.backend.import_file(kinds[kind], path)
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.critical(self, "Erreur d'import", str(e))
+            return
+        QApplication.restoreOverrideCursor()
+        # Une seule actualisation de la vue, à la fin de l'import (relecture complète si gros volume)
+        self.changes.poll()
+        box = QMessageBox(QMessageBox.Warning if report.rejected else QMessageBox.Information,
+                          "Import terminé", report.summary(), parent=self)
+        if report.rejected:
+            box.setDetailedText("\n".join(f"Ligne {line} : {reason}" for line, reason in report.rejected))
+        box.exec_()
+
+    # === EXPORTS EN ARRIÈRE-PLAN ===
+    def _submit_export(self, label, kind, fmt, filters, path):
+        # Export nommé (services.EXPORT_KINDS) : produit localement, ou par le serveur puis téléchargé
+        if self.backend.remote:
+            job = DownloadJob(label, functools.partial(self.backend.download, kind, fmt, filters), path)
+        else:
+            query, params, export_func = services.export_source(kind, fmt, filters)
+            job = ExportJob(label, export_func, query, params, path, services.export_estimate(kind, filters))
+        job.signals.started.connect(self._on_export_started)
+        job.signals.progress.connect(self._on_export_progress)
+        job.signals.finished.connect(self._on_export_finished)
+        job.signals.failed.connect(self._on_export_failed)
+        job.signals.cancelled.connect(self._on_export_cancelled)
+        self.exports.submit(job)
+
+    def _on_export_started(self, job):
+        self._export_current = job
+        self.export_label.setText(f"{job.label} : 0 ligne")
+        self.export_progress.setRange(0, 100)
+        self.export_progress.setValue(0)
+        for w in (self.export_label, self.export_progress, self.btn_export_cancel):
+            w.show()
+
+    def _on_export_progress(self, job, rows, pct):
+        self.export_label.setText(f"{job.label} : {rows} ligne(s)")
+        if pct < 0:
+            self.export_progress.setRange(0, 0)   # total inconnu : barre d'attente
+        else:
+            self.export_progress.setRange(0, 100)
+            self.export_progress.setValue(pct)
 
-    
+    def _on_export_finished(self, job, rows):
+        self.statusBar().showMessage(f"{job.label} terminé : {rows} ligne(s) → {job.save_path}", 8000)
+
+    def _on_export_failed(self, job, message):
+        QMessageBox.critical(self, "Erreur d'export", f"{job.label} : {message}")
+
+    def _on_export_cancelled(self, job):
+        self.statusBar().showMessage(f"{job.label} annulé.", 5000)
+
+    def _on_exports_changed(self, n):
+        if n == 0:
+            self._export_current = None
+            for w in (self.export_label, self.export_progress, self.btn_export_cancel):
+                w.hide()
+        self.export_queue_label.setText(f"{n - 1} export(s) en attente" if n > 1 else "")
+
+    def _cancel_export(self):
+        if self._export_current is not None:
+            self._export_current.cancel()
+
+    def open_affectation(self):
         if not self.selected_id:
             QMessageBox.warning(self, "Sélection requise", "Veuillez sélectionner un article.")
             return
 
-        row = self.table.currentRow()
-        article = self.table.item(row, 0).text()
-        nature = self.table.item(row, 1).text()
-        try:
-            stock_actuel = int(float(self.table.item(row, 2).text() or 0))
-        except:
-            stock_actuel = 0
+        p = self.catalogue.get(self.selected_id)
+        if p is None:
+            QMessageBox.warning(self, "Sélection requise", "Veuillez sélectionner un article.")
+            return
+        article = p.nom
+        nature = p.nature or ""
+        stock_actuel = int(p.quantite or 0)
 
         if stock_actuel <= 0:
             QMessageBox.warning(self, "Stock insuffisant", "Stock disponible insuffisant.")
@@ -565,53 +691,441 @@ class MagasinApp(QMainWindow):
             QMessageBox.warning(self, "Erreur", "Quantité invalide.")
             return
 
-        conn = get_conn()
-        c = conn.cursor()
         try:
-            c.execute("SELECT quantite FROM produits WHERE id = ?", (produit_id,))
-            stock = c.fetchone()[0]
-
-            if stock < quantite:
-                QMessageBox.warning(self, "Stock insuffisant", f"Stock disponible : {stock}")
-                return
+            # Contrôle du stock et décrément en une seule écriture (voir stock.py)
+            with diagnostics.action("valider_affectation"):
+                _, new_stock = self.backend.affecter(produit_id, quantite, destinataire, observation)
 
-            new_stock = stock - quantite
-            c.execute("UPDATE produits SET quantite = ? WHERE id = ?", (new_stock, produit_id))
-
-            date_mvt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            c.execute("""
-                INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation)
-                VALUES (?, 'SORTIE', ?, ?, ?, ?)
-            """, (produit_id, quantite, date_mvt, destinataire, observation.strip()))
-
-            conn.commit()
             QMessageBox.information(self, "Succès", f"Affectation enregistrée.\nStock restant : {new_stock}")
-            self.load_table()
-            self.update_badge()
+            self.changes.poll()
             dialog.accept()
 
+        except stock.StockInsuffisant as e:
+            QMessageBox.warning(self, "Stock insuffisant", f"Stock disponible : {e.disponible}")
+            self.load_table()   # la quantité affichée n'était plus à jour
         except Exception as e:
-            conn.rollback()
             QMessageBox.critical(self, "Erreur", str(e))
-        finally:
-            conn.close()
+
+    def ouvrir_affectation_lot(self):
+        """Panier d'articles affectés à un même destinataire, validé en une seule transaction."""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Affectation groupée")
+        dialog.resize(820, 560)
+        layout = QVBoxLayout(dialog)
+
+        # --- Destinataire et observation (communs à toutes les lignes) ---
+        entete = QFormLayout()
+        combo_dest = QComboBox()
+        combo_dest.addItems(DESTINATAIRES)
+        combo_dest.setEditable(True)
+        combo_dest.setInsertPolicy(QComboBox.InsertAtTop)
+        edit_obs = QLineEdit()
+        edit_obs.setPlaceholderText("N° bon de sortie, remarque...")
+        entete.addRow("Destinataire :", combo_dest)
+        entete.addRow("Observation :", edit_obs)
+        layout.addLayout(entete)
+
+        # --- Choix d'un article (catalogue en mémoire, relu une fois à l'ouverture) ---
+        self.catalogue.refresh()
+        ajout = QHBoxLayout()
+        combo_article = QComboBox()
+        combo_article.setEditable(True)
+        combo_article.setInsertPolicy(QComboBox.NoInsert)
+        combo_article.completer().setFilterMode(Qt.MatchContains)
+        combo_article.completer().setCompletionMode(QCompleter.PopupCompletion)
+        for p in self.catalogue.sorted_by_name():
+            if p.quantite > 0:
+                combo_article.addItem(f"{p.nom} ({p.quantite})", p.id)
+        spin_qte = QSpinBox()
+        spin_qte.setRange(1, 10_000_000)
+        btn_ajouter = QPushButton("Ajouter au panier")
+        ajout.addWidget(QLabel("Article :"))
+        ajout.addWidget(combo_article, 1)
+        ajout.addWidget(QLabel("Quantité :"))
+        ajout.addWidget(spin_qte)
+        ajout.addWidget(btn_ajouter)
+        layout.addLayout(ajout)
+
+        # --- Panier ---
+        table = QTableWidget(0, 5)
+        table.setHorizontalHeaderLabels(["Article", "Nature", "Disponible", "Quantité", "Reste"])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(table)
+        panier = []   # [produit_id, ...] dans l'ordre des lignes du tableau
+
+        bottom = QHBoxLayout()
+        lbl_total = QLabel("")
+        btn_retirer = QPushButton("Retirer la ligne")
+        btn_annuler = QPushButton("Annuler")
+        btn_valider = QPushButton("Valider l'affectation")
+        bottom.addWidget(lbl_total)
+        bottom.addStretch()
+        for btn in (btn_retirer, btn_annuler, btn_valider):
+            bottom.addWidget(btn)
+        layout.addLayout(bottom)
+
+        def rafraichir_ligne(i):
+            p = self.catalogue.get(panier[i])
+            disponible = p.quantite if p is not None else 0
+            qte = table.cellWidget(i, 3).value()
+            reste = disponible - qte
+            for col, v in ((2, disponible), (4, reste)):
+                item = QTableWidgetItem(str(v))
+                item.setTextAlignment(Qt.AlignCenter)
+                if reste < 0:
+                    item.setForeground(QColor("#D32F2F"))
+                table.setItem(i, col, item)
+            lbl_total.setText(f"{len(panier)} article(s), {sum(table.cellWidget(r, 3).value() for r in range(len(panier)))} unité(s)")
+
+        def ajouter(produit_id, quantite):
+            if produit_id in panier:
+                # Article déjà au panier : la quantité s'ajoute à la ligne existante
+                spin = table.cellWidget(panier.index(produit_id), 3)
+                spin.setValue(spin.value() + quantite)
+                return
+            p = self.catalogue.get(produit_id)
+            if p is None:
+                return
+            i = len(panier)
+            panier.append(produit_id)
+            table.insertRow(i)
+            table.setItem(i, 0, QTableWidgetItem(p.nom))
+            table.setItem(i, 1, QTableWidgetItem(p.nature or ""))
+            spin = QSpinBox()
+            spin.setRange(1, 10_000_000)
+            spin.setValue(quantite)
+            spin.valueChanged.connect(lambda _, pid=produit_id: rafraichir_ligne(panier.index(pid)))
+            table.setCellWidget(i, 3, spin)
+            rafraichir_ligne(i)
+
+        def ajouter_choix():
+            idx = combo_article.findText(combo_article.currentText())
+            if idx < 0:
+                QMessageBox.warning(dialog, "Article", "Choisissez un article de la liste.")
+                return
+            ajouter(combo_article.itemData(idx), spin_qte.value())
+            spin_qte.setValue(1)
+            combo_article.setFocus()
+
+        def retirer():
+            i = table.currentRow()
+            if 0 <= i < len(panier):
+                table.removeRow(i)
+                del panier[i]
+                for r in range(len(panier)):
+                    rafraichir_ligne(r)
+                if not panier:
+                    lbl_total.setText("")
+
+        def valider():
+            if not panier:
+                QMessageBox.warning(dialog, "Panier vide", "Ajoutez au moins un article.")
+                return
+            lignes = [(pid, table.cellWidget(i, 3).value()) for i, pid in enumerate(panier)]
+            try:
+                with diagnostics.action("affectation_lot"):
+                    mouvements = self.backend.affecter_lot(lignes, combo_dest.currentText(), edit_obs.text())
+            except stock.StocksInsuffisants as e:
+                noms = {pid: table.item(i, 0).text() for i, pid in enumerate(panier)}
+                details = "\n".join(f"{noms.get(m.produit_id, m.produit_id)} : {m.disponible} disponible(s), "
+                                    f"{m.demande} demandé(s)" for m in e.manques)
+                self.catalogue.refresh()
+                for r in range(len(panier)):
+                    rafraichir_ligne(r)   # stocks relus : lignes en défaut en rouge
+                QMessageBox.warning(dialog, "Stock insuffisant",
+                                    f"Aucune sortie enregistrée.\n\n{details}")
+                return
+            except Exception as e:
+                QMessageBox.critical(dialog, "Erreur", str(e))
+                return
+            QMessageBox.information(dialog, "Succès",
+                                    f"{len(mouvements)} sortie(s) enregistrée(s) pour {combo_dest.currentText()}.")
+            self.changes.poll()   # une seule actualisation des vues pour tout le lot
+            dialog.accept()
+
+        btn_ajouter.clicked.connect(ajouter_choix)
+        combo_article.lineEdit().returnPressed.connect(ajouter_choix)
+        btn_retirer.clicked.connect(retirer)
+        btn_annuler.clicked.connect(dialog.reject)
+        btn_valider.clicked.connect(valider)
+
+        # L'article sélectionné dans l'inventaire entre dans le panier
+        if self.selected_id:
+            p = self.catalogue.get(self.selected_id)
+            if p is not None and p.quantite > 0:
+                ajouter(p.id, 1)
+
+        dialog.exec_()
 
     def ouvrir_historique_article(self):
         if not self.selected_id:
             QMessageBox.warning(self, "Sélection requise", "Sélectionnez un article.")
             return
 
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT nom FROM produits WHERE id=?", (self.selected_id,))
-        nom = c.fetchone()[0]
-        conn.close()
+        try:
+            nom = self.catalogue.name(self.selected_id)
+        except services.NotFound:
+            QMessageBox.warning(self, "Article introuvable", "Cet article a été supprimé.")
+            self.clear_form()
+            self.load_table()
+            return
 
         self._ouvrir_fenetre_historique(
             title=f"Historique – {nom}",
             prefiltre_article=nom      # on pré-remplit avec le nom, sans bloquer l'ID
         )
 
+    def ouvrir_rapport_consommation(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Consommation mensuelle")
+        dialog.resize(900, 600)
+        layout = QVBoxLayout(dialog)
+
+        # --- Barre de filtres ---
+        filtres = QHBoxLayout()
+        combo_axe = QComboBox()
+        for key, label in rapports.AXES.items():
+            combo_axe.addItem(label, key)
+        mois = datetime.now().strftime("%Y-%m")
+        edit_debut = QLineEdit(f"{datetime.now().year}-01")
+        edit_debut.setMaximumWidth(90)
+        edit_fin = QLineEdit(mois)
+        edit_fin.setMaximumWidth(90)
+        filtres.addWidget(QLabel("Par :"))
+        filtres.addWidget(combo_axe)
+        filtres.addSpacing(20)
+        filtres.addWidget(QLabel("Du mois (AAAA-MM) :"))
+        filtres.addWidget(edit_debut)
+        filtres.addWidget(QLabel("au :"))
+        filtres.addWidget(edit_fin)
+        filtres.addStretch()
+        layout.addLayout(filtres)
+
+        # --- Tableau ---
+        table = QTableWidget()
+        table.setColumnCount(4)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(table)
+
+        bottom = QHBoxLayout()
+        lbl_total = QLabel("")
+        bottom.addWidget(lbl_total)
+        bottom.addStretch()
+        btn_rebuild = QPushButton("Recalculer les agrégats")
+        btn_excel = QPushButton("Exporter Excel")
+        bottom.addWidget(btn_rebuild)
+        bottom.addWidget(btn_excel)
+        layout.addLayout(bottom)
+
+        def filtres():
+            return {"axe": combo_axe.currentData(), "debut": edit_debut.text().strip() or None,
+                    "fin": edit_fin.text().strip() or None}
+
+        @diagnostics.ui_action("rapport_consommation")
+        def charger():
+            rows = self.backend.consumption(**filtres())
+            table.setHorizontalHeaderLabels([combo_axe.currentText(), "Mois", "Entrées", "Sorties"])
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                for j, v in enumerate(row):
+                    item = QTableWidgetItem("" if v is None else str(v))
+                    if j >= 2:
+                        item.setTextAlignment(Qt.AlignCenter)
+                    table.setItem(i, j, item)
+            lbl_total.setText(f"Total sorties : {sum(r[3] or 0 for r in rows)}")
+
+        def reconstruire():
+            self.backend.rebuild_aggregates()
+            charger()
+
+        def export_excel_action():
+            path, _ = QFileDialog.getSaveFileName(dialog, "Exporter Excel", "", "Excel (*.xlsx)")
+            if path:
+                self._submit_export("Consommation Excel", "consommation", "xlsx", filtres(), path)
+
+        def appliquer(changes):
+            if changes["reset"] or changes["mouvements"] or changes["mouvements_supprimes"]:
+                charger()
+
+        combo_axe.currentIndexChanged.connect(charger)
+        edit_debut.editingFinished.connect(charger)
+        edit_fin.editingFinished.connect(charger)
+        btn_rebuild.clicked.connect(reconstruire)
+        btn_excel.clicked.connect(export_excel_action)
+
+        charger()
+        self.changes.changed.connect(appliquer)
+        dialog.exec_()
+        self.changes.changed.disconnect(appliquer)
+
+    def ouvrir_inventaire_date(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Inventaire à date")
+        dialog.resize(900, 600)
+        layout = QVBoxLayout(dialog)
+
+        # --- Barre de filtres ---
+        filtres = QHBoxLayout()
+        edit_date = QDateEdit()
+        edit_date.setCalendarPopup(True)
+        edit_date.setDisplayFormat("dd/MM/yyyy")
+        edit_date.setDate(QDate(datetime.now().year - 1, 12, 31))   # clôture de l'exercice précédent
+        combo_axe = QComboBox()
+        for key, label in rapports.VALUATION_AXES.items():
+            combo_axe.addItem(label, key)
+        combo_nature = QComboBox()
+        combo_nature.addItem("Toutes les catégories", "")
+        for cat in CATEGORIES:
+            combo_nature.addItem(cat, cat)
+        filtres.addWidget(QLabel("Au :"))
+        filtres.addWidget(edit_date)
+        filtres.addSpacing(20)
+        filtres.addWidget(QLabel("Par :"))
+        filtres.addWidget(combo_axe)
+        filtres.addSpacing(20)
+        filtres.addWidget(QLabel("Nature :"))
+        filtres.addWidget(combo_nature)
+        filtres.addStretch()
+        layout.addLayout(filtres)
+
+        # --- Tableau ---
+        table = QTableWidget()
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(table)
+
+        bottom = QHBoxLayout()
+        lbl_total = QLabel("")
+        bottom.addWidget(lbl_total)
+        bottom.addStretch()
+        btn_excel = QPushButton("Exporter Excel")
+        btn_pdf = QPushButton("Exporter PDF")
+        bottom.addWidget(btn_excel)
+        bottom.addWidget(btn_pdf)
+        layout.addLayout(bottom)
+
+        def filtres():
+            return {"date": edit_date.date().toString("yyyy-MM-dd"), "axe": combo_axe.currentData(),
+                    "nature": combo_nature.currentData() or None}
+
+        @diagnostics.ui_action("inventaire_date")
+        def charger():
+            f = filtres()
+            rows = self.backend.inventory_at(**f)
+            headers = export_utils.VALUATION_HEADERS[f["axe"]]
+            table.clear()
+            table.setColumnCount(len(headers))
+            table.setHorizontalHeaderLabels(headers)
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                for j, v in enumerate(row):
+                    if isinstance(v, float) or j == len(headers) - 1:   # CUMP, valeur
+                        v = f"{v or 0:,.2f}".replace(",", " ")
+                    item = QTableWidgetItem("" if v is None else str(v))
+                    if j >= len(headers) - 3:
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter if j == len(headers) - 1
+                                              else Qt.AlignCenter)
+                    table.setItem(i, j, item)
+            total = sum(r[-1] or 0 for r in rows)
+            lbl_total.setText(f"Valeur du stock : {total:,.2f}".replace(",", " "))
+
+        def exporter(fmt):
+            if table.rowCount() == 0:
+                QMessageBox.warning(dialog, "Export", "Aucune donnée à exporter.")
+                return
+            label, pattern = ("Excel", "Excel (*.xlsx)") if fmt == "xlsx" else ("PDF", "PDF (*.pdf)")
+            path, _ = QFileDialog.getSaveFileName(dialog, f"Exporter {label}", "", pattern)
+            if path:
+                self._submit_export(f"Inventaire à date {label}", "inventaire_date", fmt, filtres(), path)
+
+        def appliquer(changes):
+            # Un mouvement antérieur à la date (antidaté ou importé) change l'inventaire
+            if changes["reset"] or changes["mouvements"] or changes["mouvements_supprimes"]:
+                charger()
+
+        edit_date.dateChanged.connect(charger)
+        combo_axe.currentIndexChanged.connect(charger)
+        combo_nature.currentIndexChanged.connect(charger)
+        btn_excel.clicked.connect(lambda: exporter("xlsx"))
+        btn_pdf.clicked.connect(lambda: exporter("pdf"))
+
+        charger()
+        self.changes.changed.connect(appliquer)
+        dialog.exec_()
+        self.changes.changed.disconnect(appliquer)
+
+    def ouvrir_diagnostics(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Diagnostics – temps de réponse")
+        dialog.resize(1000, 600)
+        layout = QVBoxLayout(dialog)
+        tabs = QTabWidget()
+        layout.addWidget(tabs)
+
+        def tableau(headers):
+            table = QTableWidget()
+            table.setColumnCount(len(headers))
+            table.setHorizontalHeaderLabels(headers)
+            table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+            table.setSelectionBehavior(QAbstractItemView.SelectRows)
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+            table.horizontalHeader().setStretchLastSection(True)
+            return table
+
+        table_actions = tableau(["Action", "Appels", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"])
+        table_sql = tableau(["Action", "Requêtes", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)",
+                             "Total (ms)", "Lignes lues"])
+        table_lentes = tableau(["Heure", "Action", "Durée (ms)", "Paramètres", "Requête"])
+        tabs.addTab(table_actions, "Actions")
+        tabs.addTab(table_sql, "Requêtes par action")
+        tabs.addTab(table_lentes, f"Requêtes lentes (≥ {diagnostics.SLOW_QUERY_MS} ms)")
+
+        def remplir(table, rows):
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                for j, v in enumerate(row):
+                    item = QTableWidgetItem(f"{v:.1f}" if isinstance(v, float) else str(v))
+                    if isinstance(v, (int, float)):
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    table.setItem(i, j, item)
+
+        def actualiser():
+            remplir(table_actions, [(r["action"], r["count"], r["p50"], r["p95"], r["p99"], r["max"])
+                                    for r in diagnostics.action_stats()])
+            remplir(table_sql, [(r["action"], r["count"], r["p50"], r["p95"], r["p99"], r["max"],
+                                 r["total"], r["rows"]) for r in diagnostics.query_stats()])
+            lentes = list(reversed(diagnostics.slow_queries()))
+            remplir(table_lentes, [(heure, action, ms, shape, sql) for heure, action, ms, sql, shape, _ in lentes])
+            for i, (*_, plan) in enumerate(lentes):
+                # Plan d'exécution en info-bulle sur la ligne
+                for j in range(table_lentes.columnCount()):
+                    table_lentes.item(i, j).setToolTip(plan or "Plan indisponible")
+
+        def reinitialiser():
+            diagnostics.reset()
+            actualiser()
+
+        def ouvrir_journal():
+            from PyQt5.QtGui import QDesktopServices
+            from PyQt5.QtCore import QUrl
+            QDesktopServices.openUrl(QUrl.fromLocalFile(diagnostics.log_path()))
+
+        bottom = QHBoxLayout()
+        bottom.addWidget(QLabel(f"Journal : {diagnostics.log_path()}"))
+        bottom.addStretch()
+        for text, slot in (("Actualiser", actualiser), ("Réinitialiser", reinitialiser),
+                           ("Ouvrir le journal", ouvrir_journal)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            bottom.addWidget(btn)
+        layout.addLayout(bottom)
+
+        actualiser()
+        dialog.exec_()
+
     def ouvrir_historique_par_destinataire(self):
         dest, ok = QInputDialog.getItem(
             self, "Filtrer par destinataire", "Bureau / CB :", ["Tous"] + DESTINATAIRES, 0, False
@@ -639,16 +1153,13 @@ class MagasinApp(QMainWindow):
         # COMBOBOX pour les articles (avec liste déroulante)
         combo_article = QComboBox()
         combo_article.setEditable(True)                     # permet aussi de taper
+        combo_article.setInsertPolicy(QComboBox.NoInsert)   # texte libre = recherche plein texte
         combo_article.setPlaceholderText("Choisir un article...")
         combo_article.addItem("Tous les articles", None)    # option pour tout afficher
 
         # Remplir la combo avec les noms d'articles existants
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT nom FROM produits ORDER BY nom")
-        for (nom,) in c.fetchall():
+        for nom in self.catalogue.names():
             combo_article.addItem(nom, nom)
-        conn.close()
 
         if prefiltre_article:
             idx = combo_article.findText(prefiltre_article)
@@ -680,7 +1191,7 @@ class MagasinApp(QMainWindow):
 
         if not is_hist_par_dest:
             combo_type = QComboBox()
-            combo_type.addItems(["Tous", "ENTREE", "SORTIE"])
+            combo_type.addItems(["Tous", "ENTREE", "SORTIE", "INITIAL", "AJUSTEMENT"])
             filtres.addWidget(QLabel("Type :"))
             filtres.addWidget(combo_type)
 
@@ -688,19 +1199,22 @@ class MagasinApp(QMainWindow):
         layout.addLayout(filtres)
 
         # --- Tableau ---
+        # (en-tête, colonne de queries.HISTORY_PAGE_SELECT)
         if is_hist_par_dest:
-            table = QTableWidget()
-            table.setColumnCount(6)
-            table.setHorizontalHeaderLabels([
-                "Date", "Article", "Quantité", "Destinataire", "Stock après", "Observation"
-            ])
+            columns = [("Date", 0), ("Article", 1), ("Quantité", 3), ("Destinataire", 4),
+                       ("Stock après", 6), ("Observation", 5)]
+            model = HistoryModel(columns, centered=(2, 4), parent=dialog, backend=self.backend)
         else:
-            table = QTableWidget()
-            table.setColumnCount(7)
-            table.setHorizontalHeaderLabels([
-                "Date", "Article", "Type", "Quantité", "Destinataire", "Stock après", "Observation"
-            ])
+            columns = [("Date", 0), ("Article", 1), ("Type", 2), ("Quantité", 3), ("Destinataire", 4),
+                       ("Stock après", 6), ("Observation", 5)]
+            model = HistoryModel(columns, centered=(3, 5), parent=dialog, backend=self.backend)
+        table = QTableView()
+        table.setModel(model)
         table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        table.verticalHeader().setDefaultSectionSize(26)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
         layout.addWidget(table)
 
         # --- Boutons d'export ---
@@ -712,170 +1226,67 @@ class MagasinApp(QMainWindow):
         bottom.addWidget(btn_pdf)
         layout.addLayout(bottom)
 
-        # --- Fonction de chargement des données ---
-        def charger():
-            # Valeurs actuelles des filtres
-            article_data = combo_article.currentData()   # None si "Tous"
-            dest_data = combo_dest.currentData()         # None si "Tous"
-
-            conn = get_conn()
-            c = conn.cursor()
-
-            query = """
-                SELECT 
-                    m.date_mvt,
-                    p.nom,
-                    m.type,
-                    m.quantite,
-                    m.service,
-                    m.observation,
-                    p.quantite AS stock_apres
-                FROM mouvements m
-                JOIN produits p ON m.produit_id = p.id
-                WHERE 1=1
-            """
-            params = []
-
-            # Filtre article (exact, car on a une liste de noms)
-            if article_data is not None:
-                query += " AND p.nom = ?"
-                params.append(article_data)
-
-            # Filtre destinataire (uniquement basé sur la combo)
-            if dest_data is not None:
-                query += " AND m.service = ?"
-                params.append(dest_data)
-
-            # Filtre type (sauf pour historique destinataire)
-            if not is_hist_par_dest:
-                type_val = combo_type.currentText()
-                if type_val != "Tous":
-                    query += " AND m.type = ?"
-                    params.append(type_val)
+        # --- Filtres courants (communs à l'affichage et aux exports) ---
+        def filtres():
+            article_txt = combo_article.currentText().strip()
+            idx = combo_article.findText(article_txt)
+            if idx >= 0:
+                article_data = combo_article.itemData(idx)   # None si "Tous"
+                article_txt = ""                             # nom de la liste : filtre exact
             else:
-                # Pour l'historique par destinataire, on ne montre que les sorties
-                query += " AND m.type = 'SORTIE'"
-
-            query += " ORDER BY m.date_mvt DESC LIMIT 1500"
-
-            c.execute(query, params)
-            rows = c.fetchall()
-            conn.close()
-
-            # Remplissage du tableau
+                article_data = None                          # texte libre : recherche plein texte
             if is_hist_par_dest:
-                table.setRowCount(len(rows))
-                for i, row in enumerate(rows):
-                    items = [
-                        QTableWidgetItem(row[0]),               # Date
-                        QTableWidgetItem(row[1]),               # Article
-                        QTableWidgetItem(str(row[3])),          # Quantité
-                        QTableWidgetItem(row[4] or ""),         # Destinataire
-                        QTableWidgetItem(str(row[6])),          # Stock après
-                        QTableWidgetItem(row[5] or "")          # Observation
-                    ]
-                    for j, item in enumerate(items):
-                        if j in (2, 4):
-                            item.setTextAlignment(Qt.AlignCenter)
-                    for j in range(6):
-                        table.setItem(i, j, items[j])
+                # Pour l'historique par destinataire, on ne montre que les sorties
+                type_val = "SORTIE"
             else:
-                table.setRowCount(len(rows))
-                for i, row in enumerate(rows):
-                    items = [
-                        QTableWidgetItem(row[0]),               # Date
-                        QTableWidgetItem(row[1]),               # Article
-                        QTableWidgetItem(row[2]),               # Type
-                        QTableWidgetItem(str(row[3])),          # Quantité
-                        QTableWidgetItem(row[4] or ""),         # Destinataire
-                        QTableWidgetItem(str(row[6])),          # Stock après
-                        QTableWidgetItem(row[5] or "")          # Observation
-                    ]
-                    if row[2] == "SORTIE":
-                        items[2].setForeground(QColor("#D32F2F"))
-                    elif row[2] == "ENTREE":
-                        items[2].setForeground(QColor("#2E7D32"))
-                    for j, item in enumerate(items):
-                        if j in (3, 5):
-                            item.setTextAlignment(Qt.AlignCenter)
-                    for j in range(7):
-                        table.setItem(i, j, items[j])
-
-            table.resizeRowsToContents()
-            return rows
+                type_val = combo_type.currentText()
+            return dict(article_nom=article_data, article_txt=article_txt,
+                        service=combo_dest.currentData(), type_mvt=type_val,
+                        mode=self.search_mode)
+
+        # --- Fonction de chargement des données (pages chargées au défilement) ---
+        @diagnostics.ui_action("historique")
+        def charger():
+            model.set_filter(filtres())
 
         # Connexion des signaux
         combo_article.currentIndexChanged.connect(charger)
+        combo_article.lineEdit().editingFinished.connect(charger)
         combo_dest.currentIndexChanged.connect(charger)
         if not is_hist_par_dest:
             combo_type.currentIndexChanged.connect(charger)
 
-        # Gestion des exports
+        # Gestion des exports (en arrière-plan, sur tout l'historique filtré)
         def export_excel_action():
-            rows = charger()
-            if not rows:
+            if model.rowCount() == 0:
                 QMessageBox.warning(dialog, "Export", "Aucune donnée à exporter.")
                 return
             path, _ = QFileDialog.getSaveFileName(dialog, "Exporter Excel", "", "Excel (*.xlsx)")
             if path:
-                export_history_excel(rows, path)
+                self._submit_export("Historique Excel", "historique", "xlsx", filtres(), path)
 
         def export_pdf_action():
-            rows = charger()
-            if not rows:
+            if model.rowCount() == 0:
                 QMessageBox.warning(dialog, "Export", "Aucune donnée à exporter.")
                 return
             path, _ = QFileDialog.getSaveFileName(dialog, "Exporter PDF", "", "PDF (*.pdf)")
             if path:
-                export_history_pdf(rows, path)
+                self._submit_export("Historique PDF", "historique", "pdf", filtres(), path)
 
         btn_excel.clicked.connect(export_excel_action)
         btn_pdf.clicked.connect(export_pdf_action)
 
+        # Nouveaux mouvements (ce poste ou un autre) ajoutés en tête, sans recharger
+        @diagnostics.ui_action("historique")
+        def appliquer(changes):
+            model.apply_changes(changes)
+
         # Chargement initial
         charger()
 
+        self.changes.changed.connect(appliquer)
         dialog.exec_()
-    def _export_hist(self, dialog, mode, article_txt, dest_val, type_val, filtre_article, filtre_destinataire):
-        conn = get_conn()
-        c = conn.cursor()
-        query = """
-            SELECT m.date_mvt, m.type, p.nom, m.quantite, m.service, m.observation, p.quantite
-            FROM mouvements m JOIN produits p ON m.produit_id = p.id WHERE 1=1
-        """
-        params = []
-        if filtre_article:
-            query += " AND m.produit_id = ?"
-            params.append(filtre_article)
-        elif article_txt:
-            query += " AND p.nom LIKE ?"
-            params.append(f"%{article_txt}%")
-        if dest_val:
-            query += " AND m.service = ?"
-            params.append(dest_val)
-        elif filtre_destinataire:
-            query += " AND m.service = ?"
-            params.append(filtre_destinataire)
-        if type_val != "Tous":
-            query += " AND m.type = ?"
-            params.append(type_val)
-        query += " ORDER BY m.date_mvt DESC"
-        c.execute(query, params)
-        rows = c.fetchall()
-        conn.close()
-
-        if not rows:
-            QMessageBox.warning(dialog, "Export", "Aucun données à exporter.")
-            return
-
-        if mode == 'excel':
-            path, _ = QFileDialog.getSaveFileName(dialog, "Exporter Excel", "", "Excel (*.xlsx)")
-            if path:
-                export_history_excel(rows, path)
-        else:
-            path, _ = QFileDialog.getSaveFileName(dialog, "Exporter PDF", "", "PDF (*.pdf)")
-            if path:
-                export_history_pdf(rows, path)
+        self.changes.changed.disconnect(appliquer)
 
 # Pour tester rapidement (optionnel)
 if __name__ == "__main__":
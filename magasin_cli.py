@@ -0,0 +1,214 @@
+"""Interface en ligne de commande (sans Qt) pour les traitements par lots.
+
+    python -m magasin_cli export-inventory inventaire.xlsx
+    python -m magasin_cli export-history historique.pdf --destinataire "CBW Alger" --type SORTIE
+    python -m magasin_cli export-valuation cloture.xlsx --date 2025-12-31 --par nature
+    python -m magasin_cli low-stock
+    python -m magasin_cli import produits articles.csv
+    python -m magasin_cli check
+    python -m magasin_cli reconcile --complet
+    python -m magasin_cli snapshots
+"""
+import argparse
+import csv
+import os
+import sys
+
+import database
+import queries
+
+# Ce module ne doit jamais importer PyQt5 : démarrage rapide, utilisable sans affichage.
+
+
+def _exporter(path, excel_func, pdf_func):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xlsx":
+        return excel_func
+    if ext == ".pdf":
+        return pdf_func
+    raise SystemExit(f"Extension non prise en charge : {ext} (.xlsx ou .pdf)")
+
+
+def cmd_export_inventory(args):
+    from export_utils import export_excel, export_pdf
+    export = _exporter(args.fichier, export_excel, export_pdf)
+    with database.read() as conn:
+        n = export(conn.execute(queries.INVENTORY_EXPORT_QUERY), args.fichier)
+    print(f"{n} article(s) exporté(s) → {args.fichier}")
+
+
+def cmd_export_history(args):
+    from export_utils import export_history_excel, export_history_pdf
+    export = _exporter(args.fichier, export_history_excel, export_history_pdf)
+    query, params = queries.history_export_query(
+        produit_id=args.produit_id, article_nom=args.article, article_txt=args.recherche,
+        service=args.destinataire, type_mvt=args.type)
+    with database.read() as conn:
+        n = export(conn.execute(query, params), args.fichier)
+    print(f"{n} mouvement(s) exporté(s) → {args.fichier}")
+
+
+def cmd_export_valuation(args):
+    import services
+    fmt = os.path.splitext(args.fichier)[1].lower().lstrip(".")
+    if fmt not in services.EXPORT_KINDS["inventaire_date"]:
+        raise SystemExit(f"Extension non prise en charge : .{fmt} (.xlsx ou .pdf)")
+    try:
+        n = services.export("inventaire_date", fmt, {"date": args.date, "axe": args.par, "nature": args.nature},
+                            args.fichier)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"{n} ligne(s) exportée(s) → {args.fichier}")
+
+
+def cmd_low_stock(args):
+    with database.read() as conn:
+        rows = queries.low_stock_products(conn)
+    if args.csv:
+        writer = csv.writer(sys.stdout, delimiter=";")
+        writer.writerow(["id", "article", "nature", "quantite", "seuil_min"])
+        for r in rows:
+            writer.writerow([r[7], r[0], r[1], r[2], r[4]])
+    else:
+        for r in rows:
+            print(f"{r[7]:>6}  {r[0]:<40} {r[2]:>6} / {r[4]:<6} {r[1] or ''}")
+        print(f"{len(rows)} article(s) en alerte")
+    return 1 if rows and args.exit_code else 0
+
+
+def cmd_import(args):
+    import import_utils
+    report = import_utils.IMPORTERS[args.type](args.fichier, args.lot)
+    import_utils.print_report(report)
+    return 1 if report.rejected else 0
+
+
+def integrity_problems(conn):
+    """Liste des incohérences détectées dans la base (liste vide si tout va bien)."""
+    problems = []
+    result = conn.execute("PRAGMA integrity_check").fetchall()
+    if result != [("ok",)]:
+        problems += [f"integrity_check : {r[0]}" for r in result]
+    try:
+        conn.execute("INSERT INTO produits_fts(produits_fts) VALUES ('integrity-check')")
+    except Exception as e:
+        problems.append(f"index plein texte : {e}")
+    expected = conn.execute(
+        "SELECT COUNT(*) FROM produits WHERE quantite < seuil_min AND seuil_min > 0").fetchone()[0]
+    counted = queries.low_stock_count(conn)
+    if expected != counted:
+        problems.append(f"compteur d'alertes : {counted} enregistré(s), {expected} réel(s)")
+    negative = conn.execute("SELECT COUNT(*) FROM produits WHERE quantite < 0").fetchone()[0]
+    if negative:
+        problems.append(f"{negative} article(s) avec un stock négatif")
+    query, params = queries.ledger_drift_query()
+    drift = conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+    if drift:
+        problems.append(f"{drift} article(s) dont la quantité diffère du grand livre (voir reconcile)")
+    return problems
+
+
+def integrity_notes(conn):
+    """Constats sans incidence sur la cohérence de la base."""
+    notes = []
+    # delete_product conserve l'historique des mouvements de l'article supprimé
+    orphans = conn.execute("""SELECT COUNT(*) FROM mouvements m
+                              WHERE NOT EXISTS (SELECT 1 FROM produits p WHERE p.id = m.produit_id)""").fetchone()[0]
+    if orphans:
+        notes.append(f"{orphans} mouvement(s) conservé(s) d'articles supprimés")
+    return notes
+
+
+def cmd_check(args):
+    with database.read() as conn:
+        problems = integrity_problems(conn)
+        notes = integrity_notes(conn)
+    for n in notes:
+        print(f"(info) {n}")
+    for p in problems:
+        print(f"- {p}")
+    print("Base cohérente." if not problems else f"{len(problems)} problème(s) détecté(s).")
+    return 1 if problems else 0
+
+
+def cmd_reconcile(args):
+    import services
+    rows = services.ledger_drift(full=args.complet)
+    if args.csv:
+        writer = csv.writer(sys.stdout, delimiter=";")
+        writer.writerow(["id", "article", "quantite", "grand_livre", "ecart"])
+        for pid, nom, quantite, ledger in rows:
+            writer.writerow([pid, nom, quantite, ledger, quantite - ledger])
+    else:
+        for pid, nom, quantite, ledger in rows:
+            print(f"{pid:>6}  {nom:<40} {quantite:>8} {ledger:>8}  écart {quantite - ledger:+d}")
+        print(f"{len(rows)} article(s) en écart avec le grand livre" if rows
+              else "Quantités conformes au grand livre.")
+    return 1 if rows else 0
+
+
+def cmd_snapshots(args):
+    import services
+    print(f"{services.take_snapshots()} instantané(s) de stock créé(s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="magasin_cli", description="Gestion Magasin DRB – traitements par lots")
+    parser.add_argument("--db", help="chemin de magasin.db (par défaut : à côté de l'application)")
+    sub = parser.add_subparsers(dest="commande", required=True)
+
+    p = sub.add_parser("export-inventory", help="exporter l'inventaire (.xlsx ou .pdf)")
+    p.add_argument("fichier")
+    p.set_defaults(func=cmd_export_inventory)
+
+    p = sub.add_parser("export-history", help="exporter l'historique des mouvements (.xlsx ou .pdf)")
+    p.add_argument("fichier")
+    p.add_argument("--produit-id", type=int)
+    p.add_argument("--article", help="nom exact de l'article")
+    p.add_argument("--recherche", help="recherche plein texte sur l'article")
+    p.add_argument("--destinataire")
+    p.add_argument("--type", choices=["Tous", "ENTREE", "SORTIE", "INITIAL", "AJUSTEMENT"], default="Tous")
+    p.set_defaults(func=cmd_export_history)
+
+    p = sub.add_parser("export-valuation", help="exporter l'inventaire valorisé à une date (.xlsx ou .pdf)")
+    p.add_argument("fichier")
+    p.add_argument("--date", help="AAAA-MM-JJ, journée incluse (par défaut : aujourd'hui)")
+    p.add_argument("--par", choices=["produit", "nature"], default="produit")
+    p.add_argument("--nature", help="limiter à une nature")
+    p.set_defaults(func=cmd_export_valuation)
+
+    p = sub.add_parser("low-stock", help="lister les articles sous leur seuil")
+    p.add_argument("--csv", action="store_true", help="sortie CSV (séparateur ;)")
+    p.add_argument("--exit-code", action="store_true", help="code de sortie 1 s'il y a des alertes")
+    p.set_defaults(func=cmd_low_stock)
+
+    p = sub.add_parser("import", help="importer des articles ou des mouvements (.csv ou .xlsx)")
+    p.add_argument("type", choices=["produits", "mouvements"])
+    p.add_argument("fichier")
+    p.add_argument("--lot", type=int, default=2000, help="lignes par transaction")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("check", help="vérifier l'intégrité de la base")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("reconcile", help="comparer les quantités en stock au grand livre des mouvements")
+    p.add_argument("--complet", action="store_true",
+                   help="rejouer tous les mouvements sans passer par les instantanés")
+    p.add_argument("--csv", action="store_true", help="sortie CSV (séparateur ;)")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = sub.add_parser("snapshots", help="compléter les instantanés de stock (calculs de stock à date)")
+    p.set_defaults(func=cmd_snapshots)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.db:
+        database.set_db_path(os.path.abspath(args.db))
+    database.init_db()
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
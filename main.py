@@ -1,12 +1,68 @@
 import sys
-from PyQt5.QtWidgets import QApplication
-from database import init_db
-from login import LoginWindow
+import time
+import multiprocessing
 
-if __name__ == "__main__":
-    init_db()
+# Seul l'écran de connexion est chargé au démarrage ; la base est initialisée et
+# la fenêtre principale importée en arrière-plan (voir LoginWindow._preload).
+
+
+def profile_startup():
+    """--profile-startup : mesure chaque étape du démarrage, affiche le détail puis quitte."""
+    timings = []
+
+    def step(label, func):
+        before = len(sys.modules)
+        t0 = time.perf_counter()
+        result = func()
+        timings.append((label, time.perf_counter() - t0, len(sys.modules) - before))
+        return result
+
+    def show(widget):
+        widget.show()
+        QApplication.processEvents()
+
+    from importlib import import_module
+    QtWidgets = step("import PyQt5.QtWidgets", lambda: import_module("PyQt5.QtWidgets"))
+    QApplication = QtWidgets.QApplication
+    database = step("import database", lambda: import_module("database"))
+    login = step("import login", lambda: import_module("login"))
+    app = step("QApplication", lambda: QApplication(sys.argv))
+    app.setStyle("Fusion")
+    window = step("LoginWindow()", lambda: login.LoginWindow(preload=False))
+    step("affichage connexion", lambda: show(window))
+    step("init_db", database.init_db)
+    magasin = step("import magasin", lambda: import_module("magasin"))
+    main_app = step("MagasinApp()", magasin.MagasinApp)
+    step("affichage fenêtre principale", lambda: show(main_app))
+
+    lines = [f"{label:<32} {seconds * 1000:>9.1f} ms  {modules:>4} module(s)"
+             for label, seconds, modules in timings]
+    lines.append(f"{'total':<32} {sum(t[1] for t in timings) * 1000:>9.1f} ms")
+    report = "\n".join(lines)
+    if sys.stdout is not None:
+        print(report)
+    else:
+        # Exécutable sans console : rapport écrit à côté de la base
+        import os
+        with open(os.path.join(database.app_dir(), "startup_profile.txt"), "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    main_app.close()
+    window.close()
+
+
+def main():
+    from PyQt5.QtWidgets import QApplication
+    from login import LoginWindow
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     login = LoginWindow()
     login.show()
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()   # processus de rendu PDF dans l'exécutable PyInstaller
+    if "--profile-startup" in sys.argv[1:]:
+        profile_startup()
+        sys.exit(0)
+    sys.exit(main())
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['pypdf'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
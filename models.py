@@ -0,0 +1,310 @@
+import bisect
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QThreadPool
+from PyQt5.QtGui import QColor
+
+import backends
+import diagnostics
+from workers import runnable_for
+
+ALERT_COLOR = QColor("#D32F2F")
+
+
+class InventoryModel(QAbstractTableModel):
+    """Modèle virtualisé de l'inventaire.
+
+    Les lignes (tuples issus de la requête) sont conservées telles quelles ;
+    la vue n'en découvre qu'une tranche à la fois via canFetchMore/fetchMore,
+    et couleur/alignement sont calculés à la demande dans data().
+    """
+    HEADERS = ["Article", "Nature", "Quantité", "Prix", "Seuil mini", "Date ajout", "Observation"]
+    CENTERED = (2, 3, 4)
+    BATCH = 256
+    # Position des colonnes dans les tuples de la requête
+    COL_NOM, COL_QTE, COL_SEUIL, COL_ID = 0, 2, 4, 7
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._loaded = 0
+
+    # --- Données ---
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._rows = rows
+        self._loaded = min(self.BATCH, len(rows))
+        self.endResetModel()
+
+    def apply_changes(self, rows, ids):
+        """Applique les lignes relues `rows` des articles `ids`, sans réinitialiser la vue.
+
+        Un article de `ids` absent de `rows` (supprimé, ou hors du filtre courant) est retiré ;
+        les autres sont remplacés sur place ou insérés à leur rang, les lignes étant triées
+        par nom (inventaire sans recherche saisie).
+        """
+        fresh = {r[self.COL_ID]: r for r in rows}
+        ids = set(ids) | set(fresh)
+        positions = [i for i, r in enumerate(self._rows) if r[self.COL_ID] in ids]
+        # Retraits : articles disparus ou renommés (leur rang change)
+        for i in reversed(positions):
+            old = self._rows[i]
+            new = fresh.get(old[self.COL_ID])
+            if new is not None and new[self.COL_NOM] == old[self.COL_NOM]:
+                self._rows[i] = new
+                fresh.pop(old[self.COL_ID])
+                if i < self._loaded:
+                    self.dataChanged.emit(self.index(i, 0), self.index(i, len(self.HEADERS) - 1))
+                continue
+            if i < self._loaded:
+                self.beginRemoveRows(QModelIndex(), i, i)
+                del self._rows[i]
+                self._loaded -= 1
+                self.endRemoveRows()
+            else:
+                del self._rows[i]
+        # Insertions à leur rang alphabétique
+        names = [r[self.COL_NOM] for r in self._rows]
+        for new in sorted(fresh.values(), key=lambda r: r[self.COL_NOM]):
+            i = bisect.bisect_right(names, new[self.COL_NOM])
+            names.insert(i, new[self.COL_NOM])
+            if i <= self._loaded:
+                self.beginInsertRows(QModelIndex(), i, i)
+                self._rows.insert(i, new)
+                self._loaded += 1
+                self.endInsertRows()
+            else:
+                self._rows.insert(i, new)
+
+    def row_data(self, row):
+        if 0 <= row < self._loaded:
+            return self._rows[row]
+        return None
+
+    def row_id(self, row):
+        r = self.row_data(row)
+        return r[self.COL_ID] if r else None
+
+    # --- Chargement paresseux ---
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        n = min(self.BATCH, len(self._rows) - self._loaded)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + n - 1)
+        self._loaded += n
+        self.endInsertRows()
+
+    # --- Interface QAbstractTableModel ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        r = self._rows[index.row()]
+        col = index.column()
+        if role == Qt.DisplayRole:
+            v = r[col]
+            return str(v) if v is not None else ""
+        if role == Qt.TextAlignmentRole:
+            if col in self.CENTERED:
+                return Qt.AlignCenter
+            return None
+        if role == Qt.ForegroundRole:
+            qte, seuil = r[self.COL_QTE], r[self.COL_SEUIL]
+            if qte is not None and seuil is not None and qte < seuil:
+                return ALERT_COLOR
+            return None
+        if role == Qt.UserRole:
+            return r[self.COL_ID]
+        return None
+
+
+class HistoryModel(QAbstractTableModel):
+    """Historique des mouvements paginé par clé (date_mvt, id), du plus récent au plus ancien.
+
+    Les pages sont chargées à mesure du défilement (fetchMore) ; la suivante est
+    préchargée en arrière-plan. Seules MAX_PAGES pages restent en mémoire : une page
+    évincée est relue à la demande à partir de sa clé de départ, conservée.
+    Les mouvements enregistrés ensuite (apply_changes) sont ajoutés en tête, hors pages.
+    """
+    PAGE_SIZE = 200
+    MAX_PAGES = 10
+    TYPE_COLORS = {"SORTIE": QColor("#D32F2F"), "ENTREE": QColor("#2E7D32"),
+                   "INITIAL": QColor("#546E7A"), "AJUSTEMENT": QColor("#EF6C00")}
+
+    def __init__(self, columns, centered=(), parent=None, action="historique", backend=None):
+        super().__init__(parent)
+        self.backend = backend or backends.get_backend()
+        self.columns = columns          # [(en-tête, index dans queries.HISTORY_PAGE_SELECT), ...]
+        self.action = action            # attribution des requêtes (diagnostics)
+        self.centered = set(centered)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._filters = {}
+        self._runnables = set()         # préchargements en cours (gardés en vie)
+        self._reset_state()
+
+    def _reset_state(self):
+        self._generation = getattr(self, "_generation", 0) + 1
+        self._starts = [None]           # clé de départ de chaque page (None = début)
+        self._pages = OrderedDict()     # page -> lignes (LRU borné)
+        self._head = []                 # nouveaux mouvements insérés au-dessus de la page 0
+        self._rows = 0
+        self._exhausted = False
+        self._prefetched = {}           # page -> lignes préchargées
+        self._prefetching = set()
+
+    # --- Requêtes ---
+    def set_filter(self, filters):
+        """Filtres de queries.history_where (article_nom, service, type_mvt, ...)."""
+        self.beginResetModel()
+        self._filters = dict(filters)
+        self._reset_state()
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def _page_request(self, page):
+        return self.backend.history_request(self._filters, self._starts[page], self.PAGE_SIZE)
+
+    def _fetch_page_sync(self, page):
+        with diagnostics.action(diagnostics.current_action() or self.action):
+            return backends.execute_request(self._page_request(page))
+
+    def _store(self, page, rows):
+        self._pages[page] = rows
+        self._pages.move_to_end(page)
+        while len(self._pages) > self.MAX_PAGES:
+            self._pages.popitem(last=False)
+
+    def _page(self, page):
+        rows = self._pages.get(page)
+        if rows is None:
+            rows = self._fetch_page_sync(page)   # page évincée : relue depuis sa clé
+            self._store(page, rows)
+        else:
+            self._pages.move_to_end(page)
+        return rows
+
+    def _prefetch(self, page):
+        if page in self._prefetched or page in self._prefetching or page >= len(self._starts):
+            return
+        runnable = runnable_for(page, self._page_request(page), self.action)
+        generation = self._generation
+        runnable.signals.result.connect(lambda p, rows, g=generation: self._on_prefetched(g, p, rows))
+        runnable.signals.finished.connect(self._runnables.discard)
+        self._runnables.add(runnable)
+        self._prefetching.add(page)
+        self.pool.start(runnable)
+
+    def _on_prefetched(self, generation, page, rows):
+        if generation != self._generation:
+            return   # filtres modifiés entre-temps
+        self._prefetching.discard(page)
+        self._prefetched[page] = rows
+
+    def apply_changes(self, changes):
+        """Applique un lot de workers.ChangeFeed : nouveaux mouvements insérés en tête.
+
+        Un mouvement antidaté (plus ancien que la tête affichée) ou supprimé oblige à
+        relire l'historique depuis le début.
+        """
+        if changes["reset"] or changes["mouvements_supprimes"]:
+            self.set_filter(self._filters)
+            return
+        ids = changes["mouvements"]
+        if not ids:
+            return
+        with diagnostics.action(diagnostics.current_action() or self.action):
+            rows = self.backend.history_page(self._filters, None, len(ids), ids)
+        if not rows:
+            return   # hors du filtre courant
+        top = self._top_key()
+        if top is not None and (rows[-1][0], rows[-1][7]) < top:
+            self.set_filter(self._filters)
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self._head[:0] = rows
+        self._rows += len(rows)
+        # La page 0 (relue si évincée) s'arrête désormais juste sous la tête
+        self._starts[0] = (self._head[-1][0], self._head[-1][7])
+        self.endInsertRows()
+
+    def _top_key(self):
+        if self._head:
+            return self._head[0][0], self._head[0][7]
+        if self._rows:
+            first = self._page(0)[0]
+            return first[0], first[7]
+        return None
+
+    # --- Chargement paresseux ---
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = len(self._starts) - 1
+        rows = self._prefetched.pop(page, None)
+        if rows is None:
+            rows = self._fetch_page_sync(page)
+        if len(rows) < self.PAGE_SIZE:
+            self._exhausted = True
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), self._rows, self._rows + len(rows) - 1)
+        self._store(page, rows)
+        self._rows += len(rows)
+        self.endInsertRows()
+        if not self._exhausted:
+            last = rows[-1]
+            self._starts.append((last[0], last[7]))
+            self._prefetch(page + 1)
+
+    # --- Interface QAbstractTableModel ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if row < len(self._head):
+            r = self._head[row]
+        else:
+            page, offset = divmod(row - len(self._head), self.PAGE_SIZE)
+            rows = self._page(page)
+            if offset >= len(rows):
+                return None
+            r = rows[offset]
+        src = self.columns[index.column()][1]
+        if role == Qt.DisplayRole:
+            v = r[src]
+            return "" if v is None else str(v)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter if index.column() in self.centered else None
+        if role == Qt.ForegroundRole and src == 2:
+            return self.TYPE_COLORS.get(r[2])
+        return None
@@ -0,0 +1,268 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Moteur PDF par blocs : une Table reportlab par page (en-tête répété), dessinée
+# directement sur le canevas puis libérée, au lieu d'une seule Table géante dont la
+# mise en page devient quadratique. Hauteur de ligne fixe : le texte trop long pour sa
+# colonne est tronqué.
+# Au-delà de PARALLEL_THRESHOLD lignes, les lignes sont lues par tranches d'une partie
+# et déposées dans des fichiers temporaires : le résultat de la requête n'est jamais
+# chargé en entier. Les parties sont rendues par plusieurs processus puis fusionnées
+# (pypdf, cf. requirements.txt) ; à défaut, relues l'une après l'autre dans un seul document.
+
+MARGIN = 24
+ROW_HEIGHT = 18
+TITLE_HEIGHT = 52          # titre + espacement, sur la première page uniquement
+FOOTER_HEIGHT = 14         # numéro de page
+FRAME_PADDING = 12         # marges internes du cadre : haut + bas (et gauche + droite)
+PARALLEL_THRESHOLD = 20000
+PAGES_PER_PART = 40
+WIDTH_SAMPLE = 2000        # lignes examinées pour fixer des largeurs de colonnes communes
+
+
+def _page_size():
+    from reportlab.lib.pagesizes import A4, landscape
+    return landscape(A4)
+
+
+def rows_per_page(first=False):
+    _, height = _page_size()
+    usable = height - 2 * MARGIN - FOOTER_HEIGHT - FRAME_PADDING - (TITLE_HEIGHT if first else 0)
+    return int(usable // ROW_HEIGHT) - 1   # -1 : ligne d'en-tête
+
+
+def paginate(n_rows):
+    """Découpe [0, n_rows) en tranches (début, fin), une par page."""
+    pages = []
+    first = rows_per_page(first=True)
+    other = rows_per_page()
+    start = 0
+    end = min(n_rows, first)
+    pages.append((start, end))
+    while end < n_rows:
+        start, end = end, min(n_rows, end + other)
+        pages.append((start, end))
+    return pages
+
+
+def _usable_width():
+    width, _ = _page_size()
+    return width - 2 * MARGIN - FRAME_PADDING   # marges internes gauche + droite du cadre
+
+
+def _fit_widths(widths, usable):
+    """Ramène le tableau à la largeur `usable` (points), avec une marge de 20 % par colonne
+    pour les valeurs plus longues que celles de l'échantillon. Trop étroit : les colonnes
+    sont élargies en proportion. Trop large : les colonnes les plus larges sont réduites,
+    une colonne plus étroite que sa part égale du reste garde sa largeur."""
+    widths = [w * 1.2 for w in widths]
+    total = sum(widths)
+    if total <= usable:
+        return [w * usable / total for w in widths]
+    share = {}
+    remaining, left = usable, len(widths)
+    for j in sorted(range(len(widths)), key=widths.__getitem__):
+        share[j] = min(widths[j], remaining / left)
+        remaining -= share[j]
+        left -= 1
+    return [share[j] for j in range(len(widths))]
+
+
+def column_widths(rows, headers):
+    """Largeurs communes à toutes les pages, estimées sur un échantillon de lignes
+    et ramenées à la largeur de la page ; le texte plus long est tronqué (voir _clip)."""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    widths = [stringWidth(str(h), "Helvetica-Bold", 10) for h in headers]
+    for r in rows[:WIDTH_SAMPLE]:
+        for j, v in enumerate(r):
+            w = stringWidth("" if v is None else str(v), "Helvetica", 10)
+            if w > widths[j]:
+                widths[j] = w
+    return _fit_widths([w + 12 for w in widths], _usable_width())   # + marges gauche/droite des cellules
+
+
+def _clip(value, width, font="Helvetica", size=10):
+    """Texte de la cellule, raccourci (…) s'il dépasse `width` points : la hauteur des lignes
+    est fixe (ROW_HEIGHT), la pagination calculée à l'avance ne change donc pas."""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    text = "" if value is None else str(value)
+    # Aucun glyphe Helvetica ne dépasse 1,015 fois la taille : inutile de mesurer un texte court
+    width += 0.5   # tolérance d'arrondi : la colonne la plus large de l'échantillon tient exactement
+    if len(text) * size * 1.015 <= width or stringWidth(text, font, size) <= width:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(text[:mid] + "…", font, size) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+def _table_style(aligns, odd_start):
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    bands = [colors.whitesmoke, colors.HexColor("#E3F2FD")]
+    if odd_start:
+        bands.reverse()   # conserve l'alternance globale d'une page à l'autre
+    commands = [
+        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#1976D2")),
+        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+        ("ALIGN", (0,0), (-1,0), "CENTER"),
+        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+        ("FONTSIZE", (0,0), (-1,0), 10),
+        ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#B0BEC5")),
+        ("ROWBACKGROUNDS", (0,1), (-1,-1), bands),
+        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        ("LEFTPADDING", (0,0), (-1,-1), 6),
+        ("RIGHTPADDING", (0,0), (-1,-1), 6),
+    ]
+    for first_col, last_col, align in aligns:
+        commands.append(("ALIGN", (first_col,1), (last_col,-1), align))
+    return TableStyle(commands)
+
+
+def _render(save_path, pages, headers, widths, aligns, title, first_page_number, total_pages):
+    """Rend `pages`, itérable de (indice de la première ligne, lignes de la page), dans un
+    fichier PDF : chaque page est dessinée puis libérée avant de lire la suivante."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.platypus import Paragraph, Table
+
+    page_width, page_height = _page_size()
+    canvas = Canvas(save_path, pagesize=(page_width, page_height))
+    inner = [w - 12 for w in widths]   # largeur utile des cellules
+    header = [_clip(h, w, "Helvetica-Bold") for h, w in zip(headers, inner)]
+    number = first_page_number
+    for start, rows in pages:
+        top = page_height - MARGIN - FRAME_PADDING / 2
+        if title and number == first_page_number:
+            styles = getSampleStyleSheet()
+            title_style = styles["Title"]
+            title_style.textColor = colors.HexColor("#1976D2")
+            para = Paragraph(title, title_style)
+            _, h = para.wrapOn(canvas, page_width - 2 * MARGIN, TITLE_HEIGHT)
+            para.drawOn(canvas, MARGIN, top - h)
+            top -= TITLE_HEIGHT
+        data = [header] + [[_clip(v, w) for v, w in zip(r, inner)] for r in rows]
+        table = Table(data, colWidths=widths, rowHeights=ROW_HEIGHT)
+        table.setStyle(_table_style(aligns, start % 2 == 1))
+        w, h = table.wrapOn(canvas, page_width - 2 * MARGIN, top)
+        table.drawOn(canvas, (page_width - w) / 2, top - h)
+
+        canvas.saveState()
+        canvas.setFont("Helvetica", 8)
+        canvas.setFillColor(colors.HexColor("#607D8B"))
+        canvas.drawRightString(page_width - MARGIN, MARGIN / 2, f"Page {number} / {total_pages}")
+        canvas.restoreState()
+        canvas.showPage()
+        number += 1
+    canvas.save()
+
+
+def _part_pages(rows, pages):
+    """(indice, lignes) de chaque page d'une partie ; `rows` commence à la première page."""
+    base = pages[0][0] if pages else 0
+    for start, end in pages:
+        yield start, rows[start - base:end - base]
+
+
+def _load(rows_path):
+    with open(rows_path, "rb") as f:
+        return pickle.load(f)
+
+
+def _render_part(args):
+    # Point d'entrée des processus de rendu (doit rester au niveau module) :
+    # les lignes de la partie sont relues depuis leur fichier temporaire
+    save_path, rows_path, pages, *rest = args
+    _render(save_path, _part_pages(_load(rows_path), pages), *rest)
+    return save_path
+
+
+def _spooled_pages(parts):
+    """Pages de toutes les parties, relues une partie à la fois (rendu dans un seul processus)."""
+    for _, rows_path, pages, *_ in parts:
+        yield from _part_pages(_load(rows_path), pages)
+
+
+def _merger():
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        return None
+    return PdfWriter
+
+
+def _part_sizes():
+    """Nombre de lignes de chaque partie de PAGES_PER_PART pages (la première page est plus courte)."""
+    other = rows_per_page()
+    yield rows_per_page(first=True) + (PAGES_PER_PART - 1) * other
+    while True:
+        yield PAGES_PER_PART * other
+
+
+def render_table_pdf(rows, save_path, title, headers, aligns=(), workers=None):
+    """Rend `rows` en PDF paginé : en-têtes répétés, bandes alternées, « Page n / N ».
+
+    `aligns` : liste de (première colonne, dernière colonne, alignement) pour le corps du tableau.
+    """
+    it = iter(rows)
+    head = [list(r) for r in islice(it, PARALLEL_THRESHOLD)]
+    workers = workers or os.cpu_count() or 1
+    widths = column_widths(head, headers)
+
+    if len(head) < PARALLEL_THRESHOLD:
+        pages = paginate(len(head))
+        _render(save_path, _part_pages(head, pages), headers, widths, aligns, title, 1, len(pages))
+        return len(head)
+
+    tmpdir = tempfile.mkdtemp(prefix="magasin_pdf_")
+    try:
+        # Dépôt des lignes par parties : le total de pages (pied « Page n / N ») n'est connu qu'à la fin
+        chunks = []   # (fichier des lignes, nombre de lignes)
+        n_rows = 0
+        for size in _part_sizes():
+            chunk = head[:size]
+            del head[:size]
+            if len(chunk) < size:
+                chunk.extend(list(r) for r in islice(it, size - len(chunk)))
+            if not chunk:
+                break
+            rows_path = os.path.join(tmpdir, f"rows_{len(chunks):06d}.pickle")
+            with open(rows_path, "wb") as f:
+                pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+            chunks.append((rows_path, len(chunk)))
+            n_rows += len(chunk)
+            if len(chunk) < size:
+                break
+
+        pages = paginate(n_rows)
+        total = len(pages)
+        parts = []
+        for i, (rows_path, _) in enumerate(chunks):
+            k = i * PAGES_PER_PART
+            parts.append((os.path.join(tmpdir, f"part_{k:06d}.pdf"), rows_path, pages[k:k + PAGES_PER_PART],
+                          headers, widths, aligns, title if k == 0 else None, k + 1, total))
+        PdfWriter = _merger()
+        if workers < 2 or PdfWriter is None:
+            # Un seul processus, ou pas de fusion possible : un seul document, partie par partie
+            _render(save_path, _spooled_pages(parts), headers, widths, aligns, title, 1, total)
+            return n_rows
+        with ProcessPoolExecutor(max_workers=min(workers, len(parts))) as pool:
+            paths = list(pool.map(_render_part, parts))
+        writer = PdfWriter()
+        for path in paths:
+            writer.append(path)
+        with open(save_path, "wb") as f:
+            writer.write(f)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+    return n_rows
@@ -0,0 +1,246 @@
+import json
+import re
+
+# Requêtes SQL partagées par l'interface et les outils sans Qt.
+
+PRODUCT_COLUMNS = "p.nom, p.nature, p.quantite, p.prix, p.seuil_min, p.date_ajout, p.observation, p.id"
+
+# "prefix" : mots entiers ou débuts de mots (index unicode61, sans accents)
+# "trigram" : sous-chaînes d'au moins 3 caractères (index trigramme)
+SEARCH_MODE = "prefix"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_match_expression(text):
+    """Transforme une saisie libre en expression MATCH FTS5 : chaque mot devient un préfixe."""
+    words = _WORD_RE.findall(text or "")
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def trigram_match_expression(text):
+    text = (text or "").strip()
+    if len(text) < 3:
+        return ""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def has_trigram_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='produits_trigram'"
+    ).fetchone() is not None
+
+
+def _match(text, mode):
+    """Renvoie (table_fts, expression) pour le mode demandé, ou (None, '') si rien à chercher."""
+    if mode == "trigram":
+        expr = trigram_match_expression(text)
+        if expr:
+            return "produits_trigram", expr
+    expr = fts_match_expression(text)
+    return ("produits_fts", expr) if expr else (None, "")
+
+
+def ids_filter(column, ids):
+    """Fragment 'AND <column> IN (...)' pour une liste d'identifiants de taille quelconque."""
+    return f" AND {column} IN (SELECT value FROM json_each(?))", [json.dumps([int(i) for i in ids])]
+
+
+def product_search_query(key="", nature=None, mode=None, ids=None):
+    """Requête de l'inventaire : (sql, params), triée par pertinence si une recherche est saisie.
+
+    `ids` restreint le résultat à ces articles (mise à jour partielle de la vue).
+    """
+    table, expr = _match(key, mode or SEARCH_MODE)
+    params = []
+    if table:
+        query = f"""SELECT {PRODUCT_COLUMNS}
+                    FROM {table} f JOIN produits p ON p.id = f.rowid
+                    WHERE f.{table} MATCH ?"""
+        params.append(expr)
+    else:
+        query = f"SELECT {PRODUCT_COLUMNS} FROM produits p WHERE 1=1"
+    if nature:
+        query += " AND p.nature = ?"
+        params.append(nature)
+    if ids is not None:
+        clause, clause_params = ids_filter("p.id", ids)
+        query += clause
+        params += clause_params
+    if table == "produits_fts":
+        # Le nom pèse plus que l'observation dans le classement
+        query += " ORDER BY bm25(f.produits_fts, 10.0, 1.0), p.nom ASC"
+    elif table:
+        query += " ORDER BY f.rank, p.nom ASC"
+    else:
+        query += " ORDER BY p.nom ASC"
+    return query, params
+
+
+def article_filter(text, mode=None, column="p.id"):
+    """Fragment SQL 'AND <column> IN (...)' filtrant les articles par recherche plein texte."""
+    table, expr = _match(text, mode or SEARCH_MODE)
+    if not table:
+        return "", []
+    return f" AND {column} IN (SELECT rowid FROM {table} WHERE {table} MATCH ?)", [expr]
+
+
+# === ALERTES DE STOCK ===
+# Maintenues par triggers (migration 3) : lecture en O(1), sans parcours de produits.
+
+def low_stock_count(conn):
+    row = conn.execute("SELECT valeur FROM compteurs WHERE nom = 'alertes'").fetchone()
+    return row[0] if row else 0
+
+
+def low_stock_ids(conn):
+    return [r[0] for r in conn.execute("SELECT produit_id FROM alertes_stock ORDER BY produit_id")]
+
+
+def low_stock_products(conn, limit=None):
+    query = f"""SELECT {PRODUCT_COLUMNS}
+                FROM alertes_stock a JOIN produits p ON p.id = a.produit_id
+                ORDER BY p.nom"""
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return conn.execute(query).fetchall()
+
+
+# === EXPORTS / HISTORIQUE ===
+
+# Colonnes de l'inventaire affiché, puis le CUMP (stock.CUMP) qui sert à la valorisation
+INVENTORY_EXPORT_QUERY = """SELECT nom, nature, quantite, prix, seuil_min, date_ajout, observation,
+                                   COALESCE(cump, prix)
+                            FROM produits ORDER BY nom"""
+
+# Colonnes dans l'ordre de export_utils.HISTORY_HEADERS
+HISTORY_EXPORT_COLUMNS = """m.date_mvt, m.type, p.nom, m.quantite, m.service, m.observation, m.stock_apres,
+                            COALESCE(ROUND(m.prix_unitaire, 2), '')"""
+
+
+def history_where(article_nom=None, article_txt=None, produit_id=None,
+                  service=None, type_mvt=None, mode=None):
+    """Clause WHERE (et paramètres) commune à l'affichage et à l'export de l'historique."""
+    where = " WHERE 1=1"
+    params = []
+    if produit_id:
+        where += " AND m.produit_id = ?"
+        params.append(produit_id)
+    elif article_nom is not None:
+        where += " AND p.nom = ?"
+        params.append(article_nom)
+    elif article_txt:
+        clause, clause_params = article_filter(article_txt, mode, "m.produit_id")
+        where += clause
+        params += clause_params
+    if service:
+        where += " AND m.service = ?"
+        params.append(service)
+    if type_mvt and type_mvt != "Tous":
+        where += " AND m.type = ?"
+        params.append(type_mvt)
+    return where, params
+
+
+# Colonnes de l'historique affiché : date, article, type, quantité, destinataire,
+# observation, stock après, id (la clé de page est (date_mvt, id))
+HISTORY_PAGE_SELECT = """SELECT m.date_mvt, p.nom, m.type, m.quantite, m.service, m.observation, m.stock_apres, m.id
+                         FROM mouvements m JOIN produits p ON m.produit_id = p.id"""
+
+
+def history_page_query(filters, start_key=None, limit=200, ids=None):
+    """Une page de l'historique, du plus récent au plus ancien, après la clé (date_mvt, id).
+
+    `ids` restreint la page à ces mouvements (nouveaux mouvements à insérer dans la vue).
+    """
+    where, params = history_where(**filters)
+    query = HISTORY_PAGE_SELECT + where
+    if ids is not None:
+        clause, clause_params = ids_filter("m.id", ids)
+        query += clause
+        params += clause_params
+    if start_key is not None:
+        query += " AND (m.date_mvt, m.id) < (?, ?)"
+        params += list(start_key)
+    query += " ORDER BY m.date_mvt DESC, m.id DESC LIMIT ?"
+    params.append(limit)
+    return query, params
+
+
+def history_export_query(**filters):
+    where, params = history_where(**filters)
+    query = f"""SELECT {HISTORY_EXPORT_COLUMNS}
+                FROM mouvements m JOIN produits p ON m.produit_id = p.id{where}
+                ORDER BY m.date_mvt DESC, m.id DESC"""
+    return query, params
+
+
+def history_count_query(**filters):
+    """Nombre de lignes de history_export_query, sans tri ni jointure (sauf filtre par nom)."""
+    where, params = history_where(**filters)
+    join = " JOIN produits p ON m.produit_id = p.id" if "p.nom" in where else ""
+    return f"SELECT COUNT(*) FROM mouvements m{join}{where}", params
+
+
+# === GRAND LIVRE DES STOCKS ===
+# Le stock d'un article est la somme des effets de ses mouvements : SORTIE retire,
+# ENTREE et INITIAL ajoutent, AJUSTEMENT porte une quantité signée.
+
+MOVEMENT_EFFECT = "CASE m.type WHEN 'SORTIE' THEN -m.quantite ELSE m.quantite END"
+
+# Borne des requêtes « à date » quand aucune date n'est donnée (stock actuel)
+LEDGER_END = "9999-12-31 23:59:59"
+
+
+def ledger_bound(date=None):
+    """Borne supérieure incluse de date_mvt : une date seule couvre toute la journée."""
+    if not date:
+        return LEDGER_END
+    date = str(date)
+    return date + " 23:59:59" if len(date) == 10 else date
+
+
+def stock_at_query(date=None, ids=None):
+    """Stock de chaque article à `date` : (sql, params) renvoyant (produit_id, stock).
+
+    Dernier instantané (stock_snapshots) antérieur à la date, puis rejeu des seuls
+    mouvements suivants, lus dans l'index idx_mvt_grand_livre.
+    """
+    bound = ledger_bound(date)
+    query = f"""
+        SELECT p.id, COALESCE(i.quantite, 0) + COALESCE((
+                   SELECT SUM({MOVEMENT_EFFECT}) FROM mouvements m
+                   WHERE m.produit_id = p.id AND m.date_mvt <= ?
+                     AND m.date_mvt >= COALESCE(i.date_mvt, '')
+                     AND (i.produit_id IS NULL OR m.date_mvt > i.date_mvt OR m.id > i.mvt_id)), 0)
+        FROM produits p
+        LEFT JOIN stock_snapshots i ON i.produit_id = p.id AND (i.date_mvt, i.mvt_id) = (
+            SELECT s.date_mvt, s.mvt_id FROM stock_snapshots s
+            WHERE s.produit_id = p.id AND s.date_mvt <= ?
+            ORDER BY s.date_mvt DESC, s.mvt_id DESC LIMIT 1)
+        WHERE 1=1"""
+    params = [bound, bound]
+    if ids is not None:
+        clause, clause_params = ids_filter("p.id", ids)
+        query += clause
+        params += clause_params
+    return query, params
+
+
+def ledger_drift_query(full=False):
+    """Articles dont produits.quantite diffère du grand livre : (id, nom, quantité, grand livre).
+
+    `full` rejoue tous les mouvements sans passer par les instantanés (contrôle de ceux-ci).
+    """
+    if full:
+        ledger = f"""SELECT m.produit_id AS id, SUM({MOVEMENT_EFFECT}) AS stock
+                     FROM mouvements m GROUP BY m.produit_id"""
+        params = []
+    else:
+        ledger, params = stock_at_query()
+    query = f"""WITH grand_livre(id, stock) AS ({ledger})
+                SELECT p.id, p.nom, p.quantite, COALESCE(g.stock, 0)
+                FROM produits p LEFT JOIN grand_livre g ON g.id = p.id
+                WHERE p.quantite != COALESCE(g.stock, 0)
+                ORDER BY p.nom, p.id"""
+    return query, params
@@ -0,0 +1,108 @@
+# Agrégats de consommation (entrées / sorties) maintenus par triggers sur mouvements :
+#   conso_produit_jour  : article × jour
+#   conso_service_mois  : destinataire × mois
+#   conso_nature_mois   : nature × mois (nature enregistrée sur le mouvement, migration 13)
+# Les rapports lisent ces tables au lieu de parcourir mouvements.
+
+AGGREGATE_TABLES = ("conso_produit_jour", "conso_service_mois", "conso_nature_mois")
+
+AXES = {
+    "service": "Destinataire",
+    "nature": "Nature",
+    "produit": "Article",
+}
+
+_ENTREES = "SUM(CASE m.type WHEN 'ENTREE' THEN m.quantite ELSE 0 END)"
+_SORTIES = "SUM(CASE m.type WHEN 'SORTIE' THEN m.quantite ELSE 0 END)"
+_CONSO_TYPES = "m.type IN ('ENTREE', 'SORTIE')"   # comme les triggers conso_ai / conso_ad (migration 13)
+
+
+def rebuild_aggregates(conn):
+    """Recalcule entièrement les agrégats depuis mouvements (dans la transaction courante)."""
+    for table in AGGREGATE_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"""
+        INSERT INTO conso_produit_jour (produit_id, jour, entrees, sorties)
+        SELECT m.produit_id, substr(m.date_mvt, 1, 10), {_ENTREES}, {_SORTIES}
+        FROM mouvements m WHERE {_CONSO_TYPES} GROUP BY 1, 2
+    """)
+    conn.execute(f"""
+        INSERT INTO conso_service_mois (service, mois, entrees, sorties)
+        SELECT COALESCE(m.service, ''), substr(m.date_mvt, 1, 7), {_ENTREES}, {_SORTIES}
+        FROM mouvements m WHERE {_CONSO_TYPES} GROUP BY 1, 2
+    """)
+    conn.execute(f"""
+        INSERT INTO conso_nature_mois (nature, mois, entrees, sorties)
+        SELECT COALESCE(m.nature, p.nature, ''), substr(m.date_mvt, 1, 7), {_ENTREES}, {_SORTIES}
+        FROM mouvements m LEFT JOIN produits p ON p.id = m.produit_id WHERE {_CONSO_TYPES} GROUP BY 1, 2
+    """)
+
+
+def consumption_query(axis, mois_debut=None, mois_fin=None):
+    """Consommation mensuelle selon l'axe : (sql, params) renvoyant (libellé, mois, entrées, sorties)."""
+    if axis == "service":
+        query = "SELECT service, mois, entrees, sorties FROM conso_service_mois a WHERE 1=1"
+        column = "a.mois"
+    elif axis == "nature":
+        query = "SELECT nature, mois, entrees, sorties FROM conso_nature_mois a WHERE 1=1"
+        column = "a.mois"
+    elif axis == "produit":
+        query = """SELECT p.nom, substr(a.jour, 1, 7) AS mois, SUM(a.entrees), SUM(a.sorties)
+                   FROM conso_produit_jour a JOIN produits p ON p.id = a.produit_id WHERE 1=1"""
+        column = "substr(a.jour, 1, 7)"
+    else:
+        raise ValueError(f"Axe inconnu : {axis}")
+    params = []
+    if mois_debut:
+        query += f" AND {column} >= ?"
+        params.append(mois_debut)
+    if mois_fin:
+        query += f" AND {column} <= ?"
+        params.append(mois_fin)
+    if axis == "produit":
+        query += " GROUP BY a.produit_id, 2"
+    query += " ORDER BY 1, 2"
+    return query, params
+
+
+# === INVENTAIRE À DATE ===
+# Quantités reconstituées par le grand livre (queries.stock_at_query : dernier instantané
+# puis mouvements suivants), en une seule requête pour tous les articles.
+
+VALUATION_AXES = {
+    "produit": "Article",
+    "nature": "Nature",
+}
+
+
+def valuation_query(date=None, axis="produit", nature=None):
+    """Inventaire valorisé à `date` (AAAA-MM-JJ incluse ; None : aujourd'hui) : (sql, params).
+
+    Par article : (article, nature, quantité, CUMP, valeur) ; par nature :
+    (nature, nombre d'articles, quantité, valeur). Les articles sans stock à la date sont omis.
+    Le CUMP à la date est celui enregistré par le dernier mouvement antérieur (cump_apres),
+    à défaut le CUMP courant de l'article.
+    """
+    import queries
+    stock_query, params = queries.stock_at_query(date)
+    cump = "COALESCE(p.cump, p.prix)"   # stock.CUMP
+    if date:
+        cump = f"""COALESCE((SELECT m.cump_apres FROM mouvements m
+                             WHERE m.produit_id = p.id AND m.date_mvt <= ?
+                             ORDER BY m.date_mvt DESC, m.id DESC LIMIT 1), {cump})"""
+        params.append(queries.ledger_bound(date))
+    where = ""
+    if nature:
+        where = " AND p.nature = ?"
+        params.append(nature)
+    base = f"""WITH stock_date(id, quantite) AS ({stock_query})
+               SELECT nom, nature, quantite, cump, quantite * cump AS valeur FROM (
+                   SELECT p.nom, COALESCE(p.nature, '') AS nature, s.quantite, {cump} AS cump
+                   FROM produits p JOIN stock_date s ON s.id = p.id
+                   WHERE s.quantite != 0{where})"""
+    if axis == "produit":
+        return base + " ORDER BY 2, 1", params
+    if axis == "nature":
+        return f"""SELECT nature, COUNT(*), SUM(quantite), SUM(valeur)
+                   FROM ({base}) GROUP BY nature ORDER BY nature""", params
+    raise ValueError(f"Axe inconnu : {axis}")
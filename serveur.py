@@ -0,0 +1,447 @@
+"""Serveur d'inventaire : un seul processus possède magasin.db et l'expose en HTTP/JSON.
+
+    python serveur.py                                   # http://127.0.0.1:8765
+    python serveur.py --host 0.0.0.0 --port 8765 --jeton secret --db D:\\Magasin\\magasin.db
+
+Les postes clients lancent l'application avec MAGASIN_SERVEUR=http://<hôte>:8765
+(et MAGASIN_JETON si le serveur en exige un). Sans dépendance Qt.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import database
+import diagnostics
+import services
+import stock
+from backends import TOKEN_HEADER
+
+DEFAULT_PORT = 8765
+MAX_BODY = 50 * 1024 * 1024     # imports CSV / XLSX
+SEND_CHUNK = 64 * 1024
+SNAPSHOT_INTERVAL = 3600        # secondes entre deux passes d'instantanés de stock
+EXPORT_TYPES = {"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                "pdf": "application/pdf"}
+
+log = logging.getLogger("magasin.serveur")
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FileResponse:
+    """Réponse servie depuis un fichier temporaire, supprimé après l'envoi."""
+
+    def __init__(self, path, content_type, headers=None):
+        self.path = path
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+# === ROUTES ===
+
+ROUTES = []   # (méthode, motif compilé, gestionnaire)
+
+
+def route(method, pattern):
+    def register(func):
+        ROUTES.append((method, re.compile(f"^{pattern}$"), func))
+        return func
+    return register
+
+
+def _int(value, name):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HttpError(400, f"{name} invalide : {value!r}")
+
+
+def _ids(query):
+    if "ids" not in query:
+        return None
+    try:
+        return [int(i) for i in query["ids"].split(",") if i]
+    except ValueError:
+        raise HttpError(400, f"ids invalides : {query['ids']!r}")
+
+
+def _history_filters(query):
+    filters = {k: query[k] for k in services.HISTORY_FILTERS if query.get(k)}
+    if "produit_id" in filters:
+        filters["produit_id"] = _int(filters["produit_id"], "produit_id")
+    return filters
+
+
+@route("GET", "/api/sante")
+def sante(query, body):
+    with database.read() as conn:
+        return {"ok": True, "schema": database.schema_version(conn)}
+
+
+@route("GET", "/api/recherche/mode")
+def mode_recherche(query, body):
+    return {"mode": services.search_mode()}
+
+
+@route("GET", "/api/produits")
+def produits(query, body):
+    return services.search_products(query.get("q", ""), query.get("nature") or None, query.get("mode") or None,
+                                    _ids(query))
+
+
+@route("GET", "/api/produits/existe")
+def produits_existe(query, body):
+    return services.has_products()
+
+
+@route("GET", r"/api/produits/(?P<produit_id>\d+)/stock")
+def produit_stock(query, body, produit_id):
+    return services.stock_at(int(produit_id), query.get("date") or None)
+
+
+@route("POST", "/api/produits")
+def produit_ajout(query, body):
+    return {"id": services.add_product(body or {})}
+
+
+@route("PUT", r"/api/produits/(?P<produit_id>\d+)")
+def produit_modif(query, body, produit_id):
+    body = body or {}
+    return {"ok": services.update_product(int(produit_id), body.get("valeurs") or {},
+                                          body.get("quantite_attendue"))}
+
+
+@route("DELETE", r"/api/produits/(?P<produit_id>\d+)")
+def produit_suppression(query, body, produit_id):
+    services.delete_product(int(produit_id))
+    return {"ok": True}
+
+
+@route("GET", "/api/alertes")
+def alertes(query, body):
+    n, rows = services.low_stock(_int(query.get("limit"), "limit") or 20)
+    return {"nombre": n, "articles": rows}
+
+
+@route("POST", "/api/affectations")
+def affectation(query, body):
+    body = body or {}
+    try:
+        produit_id, quantite = int(body["produit_id"]), int(body["quantite"])
+    except (KeyError, TypeError, ValueError):
+        raise HttpError(400, "produit_id et quantite (entiers) sont obligatoires")
+    mvt_id, stock_apres = services.affecter(produit_id, quantite, body.get("destinataire") or "",
+                                            body.get("observation") or "", body.get("date_mvt"))
+    return {"id": mvt_id, "stock_apres": stock_apres}
+
+
+@route("POST", "/api/affectations/lot")
+def affectation_lot(query, body):
+    body = body or {}
+    try:
+        lignes = [(int(pid), int(q)) for pid, q in body["lignes"]]
+    except (KeyError, TypeError, ValueError):
+        raise HttpError(400, "lignes : liste de [produit_id, quantite] obligatoire")
+    result = services.affecter_lot(lignes, body.get("destinataire") or "", body.get("observation") or "",
+                                   body.get("date_mvt"))
+    return {"mouvements": result}
+
+
+@route("GET", "/api/historique")
+def historique(query, body):
+    start_key = None
+    if query.get("apres_date") and query.get("apres_id"):
+        start_key = (query["apres_date"], _int(query["apres_id"], "apres_id"))
+    limit = min(_int(query.get("limit"), "limit") or 200, 5000)
+    return services.history_page(_history_filters(query), start_key, limit, _ids(query))
+
+
+@route("GET", "/api/historique/existe")
+def historique_existe(query, body):
+    return services.history_exists(_history_filters(query))
+
+
+@route("GET", "/api/modifications/seq")
+def modifications_seq(query, body):
+    return services.change_seq()
+
+
+@route("GET", "/api/modifications")
+def modifications(query, body):
+    return services.changes_since(_int(query.get("depuis"), "depuis") or 0,
+                                  min(_int(query.get("limit"), "limit") or services.CHANGES_LIMIT, 10000))
+
+
+@route("GET", "/api/consommation")
+def consommation(query, body):
+    return services.consumption(query.get("axe"), query.get("debut") or None, query.get("fin") or None)
+
+
+@route("POST", "/api/consommation/recalcul")
+def consommation_recalcul(query, body):
+    services.rebuild_aggregates()
+    return {"ok": True}
+
+
+@route("GET", "/api/inventaire")
+def inventaire_date(query, body):
+    return services.inventory_at(query.get("date") or None, query.get("axe") or "produit",
+                                 query.get("nature") or None)
+
+
+@route("POST", r"/api/import/(?P<kind>\w+)")
+def importer(query, body, kind):
+    extension = query.get("extension", ".csv")
+    if extension not in (".csv", ".xlsx", ".xlsm"):
+        raise HttpError(400, f"Extension non prise en charge : {extension}")
+    fd, path = tempfile.mkstemp(prefix="magasin_import_", suffix=extension)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(body or b"")
+        report = services.import_file(kind, path)
+    finally:
+        os.remove(path)
+    return {"inserted": report.inserted, "updated": report.updated, "rejected": report.rejected}
+
+
+@route("GET", r"/api/export/(?P<kind>\w+)\.(?P<fmt>xlsx|pdf)")
+def exporter(query, body, kind, fmt):
+    filters = _history_filters(query) if kind == "historique" else dict(query)
+    fd, path = tempfile.mkstemp(prefix="magasin_export_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        rows = services.export(kind, fmt, filters, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return FileResponse(path, EXPORT_TYPES[fmt], {"X-Lignes": str(rows),
+                                                   "Content-Disposition": f'attachment; filename="{kind}.{fmt}"'})
+
+
+def resolve(method, path):
+    allowed = False
+    for m, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if m == method:
+                return handler, match.groupdict()
+            allowed = True
+    raise HttpError(405 if allowed else 404, f"{method} {path} : route inconnue")
+
+
+def _error_body(exc):
+    if isinstance(exc, stock.StocksInsuffisants):
+        return 409, {"erreur": str(exc), "type": "StocksInsuffisants",
+                     "manques": [[m.produit_id, m.disponible, m.demande] for m in exc.manques]}
+    if isinstance(exc, stock.StockInsuffisant):
+        return 409, {"erreur": str(exc), "type": "StockInsuffisant", "produit_id": exc.produit_id,
+                     "disponible": exc.disponible, "demande": exc.demande}
+    if isinstance(exc, HttpError):
+        return exc.status, {"erreur": str(exc)}
+    if isinstance(exc, services.NotFound):
+        return 404, {"erreur": str(exc), "type": "NotFound"}
+    if isinstance(exc, (ValueError, KeyError)):
+        return 400, {"erreur": str(exc)}
+    if isinstance(exc, Exception) and database.is_busy_error(exc):
+        return 503, {"erreur": "Base occupée, réessayez."}
+    return 500, {"erreur": f"{type(exc).__name__} : {exc}"}
+
+
+# === HTTP ===
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class InventoryServer:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, workers=4, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        # Les gestionnaires (bloquants) s'exécutent ici ; l'accès à la base passe par le
+        # pool de database (un écrivain, plusieurs lecteurs)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="magasin-http")
+        self.server = None
+
+    def _authorized(self, headers):
+        # Comparaison à temps constant : la durée ne révèle pas la longueur du préfixe correct
+        given = headers.get(TOKEN_HEADER.lower(), "")
+        return hmac.compare_digest(given.encode("utf-8", "surrogateescape"), self.token.encode("utf-8"))
+
+    def _dispatch(self, method, path, query, body):
+        handler, kwargs = resolve(method, path)
+        with diagnostics.action(f"http {handler.__name__}"):
+            return handler(query, body, **kwargs)
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Ligne de requête invalide")
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Content-Length invalide")
+        if length < 0:
+            raise HttpError(400, "Content-Length invalide")
+        if length > MAX_BODY:
+            raise HttpError(413, "Corps de requête trop volumineux")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    async def _write(self, writer, status, payload, headers=None, keep_alive=True):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(data)),
+                "Connection": "keep-alive" if keep_alive else "close"}
+        head.update(headers or {})
+        writer.write(self._head(status, head) + data)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"] + [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_file(self, writer, response, keep_alive):
+        try:
+            head = {"Content-Type": response.content_type, "Content-Length": str(os.path.getsize(response.path)),
+                    "Connection": "keep-alive" if keep_alive else "close"}
+            head.update(response.headers)
+            writer.write(self._head(200, head))
+            with open(response.path, "rb") as f:
+                while True:
+                    chunk = f.read(SEND_CHUNK)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+        finally:
+            os.remove(response.path)
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._write(writer, e.status, {"erreur": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                url = urlsplit(target)
+                query = dict(parse_qsl(url.query, keep_blank_values=True))
+                try:
+                    if self.token and not self._authorized(headers):
+                        raise HttpError(401, "Jeton absent ou invalide")
+                    if body and headers.get("content-type", "").startswith("application/json"):
+                        try:
+                            body = json.loads(body)
+                        except ValueError:
+                            raise HttpError(400, "JSON invalide")
+                    result = await loop.run_in_executor(self.executor, self._dispatch,
+                                                        method, url.path, query, body)
+                except Exception as e:
+                    status, payload = _error_body(e)
+                    if status >= 500:
+                        log.exception("%s %s", method, url.path)
+                    else:
+                        log.info("%s %s -> %s %s", method, url.path, status, payload["erreur"])
+                    await self._write(writer, status, payload, keep_alive=keep_alive)
+                else:
+                    if isinstance(result, FileResponse):
+                        await self._send_file(writer, result, keep_alive)
+                    else:
+                        await self._write(writer, 200, result, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]   # port réel si 0 (tests)
+        return self.server
+
+    async def _snapshots(self):
+        # Instantanés de stock tenus à jour pendant que le serveur tourne
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                n = await loop.run_in_executor(self.executor, services.take_snapshots)
+                if n:
+                    log.info("%s instantané(s) de stock créé(s)", n)
+            except Exception:
+                log.exception("instantanés de stock")
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+    async def serve_forever(self):
+        await self.start()
+        log.info("Serveur d'inventaire sur http://%s:%s (base : %s)", self.host, self.port, database.DB_PATH)
+        snapshots = asyncio.ensure_future(self._snapshots())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            snapshots.cancel()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur HTTP/JSON de Gestion Magasin DRB")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 pour accepter les autres postes")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", help="chemin de magasin.db (par défaut : à côté de l'application)")
+    parser.add_argument("--workers", type=int, default=4, help="requêtes traitées en parallèle")
+    parser.add_argument("--jeton", default=os.environ.get("MAGASIN_JETON"),
+                        help="jeton exigé dans l'en-tête X-Jeton des clients")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.db:
+        database.set_db_path(os.path.abspath(args.db))
+    database.init_db()
+    server = InventoryServer(args.host, args.port, args.workers, args.jeton)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
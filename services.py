@@ -0,0 +1,308 @@
+import functools
+import os
+import threading
+from datetime import datetime
+
+import database
+import diagnostics
+import queries
+import rapports
+import stock
+
+# Opérations de l'application sur la base, sans dépendance Qt.
+# MagasinApp les appelle directement (backends.DirectBackend) ; le serveur
+# (serveur.py) les expose en HTTP/JSON pour les postes distants.
+
+PRODUCT_FIELDS = ("nom", "nature", "quantite", "prix", "seuil_min", "date_ajout", "observation")
+HISTORY_FILTERS = ("article_nom", "article_txt", "produit_id", "service", "type_mvt", "mode")
+
+
+class NotFound(LookupError):
+    pass
+
+
+def search_mode():
+    with database.read() as conn:
+        return queries.SEARCH_MODE if queries.has_trigram_index(conn) else "prefix"
+
+
+# === ARTICLES ===
+
+def search_products(text="", nature=None, mode=None, ids=None):
+    query, params = queries.product_search_query(text, nature, mode, ids)
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def low_stock(limit=20):
+    """(nombre d'articles en alerte, les `limit` premiers par nom)."""
+    with database.read() as conn:
+        n = queries.low_stock_count(conn)
+        return n, queries.low_stock_products(conn, limit=limit) if n else []
+
+
+def has_products():
+    with database.read() as conn:
+        return bool(conn.execute("SELECT EXISTS (SELECT 1 FROM produits)").fetchone()[0])
+
+
+def _product_values(values):
+    missing = [f for f in PRODUCT_FIELDS if f not in values]
+    if missing:
+        raise ValueError(f"Champ(s) manquant(s) : {', '.join(missing)}")
+    if not str(values["nom"]).strip():
+        raise ValueError("L'article est obligatoire.")
+    return tuple(values[f] for f in PRODUCT_FIELDS)
+
+
+def _now():
+    return stock.horodatage()
+
+
+def add_product(values):
+    """Crée l'article ; son stock initial est inscrit au grand livre (mouvement INITIAL)."""
+    row = _product_values(values)
+    with database.transaction() as conn:
+        cur = conn.execute("""
+            INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, row)
+        stock.journaliser_quantites(conn, [(cur.lastrowid, None, row[2])], _now(), "Stock initial")
+        return cur.lastrowid
+
+
+def update_product(produit_id, values, expected_qte):
+    """Met à jour l'article si son stock vaut toujours `expected_qte` ; renvoie False sinon.
+
+    Une quantité modifiée est inscrite au grand livre (mouvement AJUSTEMENT).
+    """
+    row = _product_values(values)
+    with database.transaction() as conn:
+        # Refusé si un autre poste a modifié le stock depuis la sélection de l'article
+        cur = conn.execute("""
+            UPDATE produits SET nom=?, nature=?, quantite=?, prix=?, seuil_min=?, date_ajout=?, observation=?
+            WHERE id=? AND quantite=?
+        """, row + (produit_id, expected_qte))
+        if cur.rowcount == 0:
+            return False
+        stock.journaliser_quantites(conn, [(produit_id, expected_qte, row[2])], _now(),
+                                    "Ajustement d'inventaire")
+        return True
+
+
+def delete_product(produit_id):
+    with database.transaction() as conn:
+        conn.execute("DELETE FROM produits WHERE id=?", (produit_id,))
+
+
+def affecter(produit_id, quantite, destinataire, observation="", date_mvt=None):
+    """SORTIE vers un destinataire ; renvoie (id du mouvement, stock restant)."""
+    if quantite <= 0:
+        raise ValueError("Quantité invalide.")
+    date_mvt = stock.horodatage(date_mvt or None)
+    with database.transaction() as conn:
+        return stock.enregistrer_mouvement(conn, produit_id, "SORTIE", quantite, date_mvt,
+                                           destinataire, observation.strip())
+
+
+def affecter_lot(lignes, destinataire, observation="", date_mvt=None):
+    """SORTIES groupées vers un destinataire, en une transaction (voir stock.enregistrer_sorties).
+
+    `lignes` : [(produit_id, quantité), ...] ; renvoie [(id du mouvement, produit_id, quantité,
+    stock restant), ...]. StocksInsuffisants : rien n'est enregistré.
+    """
+    date_mvt = stock.horodatage(date_mvt or None)
+    lignes = [(int(pid), int(q)) for pid, q in lignes]
+    with database.transaction() as conn:
+        return stock.enregistrer_sorties(conn, lignes, date_mvt, destinataire, observation.strip())
+
+
+# === HISTORIQUE ===
+
+def history_filters(filters):
+    return {k: v for k, v in (filters or {}).items() if k in HISTORY_FILTERS and v not in (None, "")}
+
+
+def history_page(filters, start_key=None, limit=200, ids=None):
+    query, params = queries.history_page_query(history_filters(filters), start_key, limit, ids)
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def history_exists(filters):
+    query, params = queries.history_export_query(**history_filters(filters))
+    with database.read() as conn:
+        return bool(conn.execute(f"SELECT EXISTS ({query})", params).fetchone()[0])
+
+
+# === GRAND LIVRE ===
+
+def stock_at(produit_id, date=None):
+    """Stock de l'article à `date` (AAAA-MM-JJ, toute la journée, ou AAAA-MM-JJ HH:MM:SS)."""
+    query, params = queries.stock_at_query(date, [produit_id])
+    with database.read() as conn:
+        row = conn.execute(query, params).fetchone()
+    if row is None:
+        raise NotFound(f"Article introuvable (id={produit_id}).")
+    return row[1]
+
+
+def ledger_drift(full=False):
+    """Articles dont la quantité diffère du grand livre : [(id, nom, quantité, grand livre), ...]."""
+    query, params = queries.ledger_drift_query(full)
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def take_snapshots():
+    with database.transaction() as conn:
+        return stock.prendre_instantanes(conn)
+
+
+# === MODIFICATIONS ===
+# Journal alimenté par triggers (database, migration 7). PRAGMA data_version évite
+# de relire le journal tant qu'aucun commit n'a eu lieu depuis le dernier appel.
+
+CHANGES_LIMIT = 1000
+_seen = {"version": None, "seq": 0}   # dernier état du journal observé
+_seen_lock = threading.Lock()
+
+
+def change_seq():
+    with database.read() as conn:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal_modifs").fetchone()[0]
+
+
+def changes_since(seq, limit=CHANGES_LIMIT):
+    """Modifications postérieures à `seq`, regroupées par objet.
+
+    {"seq": dernier numéro lu, "reset": bool, "produits": [ids insérés ou modifiés],
+     "produits_supprimes": [...], "mouvements": [ids insérés], "mouvements_supprimes": [...]}
+    `reset` vaut True si le retard dépasse `limit` ou la partie conservée du journal :
+    la vue doit alors tout relire.
+    """
+    result = {"seq": seq, "reset": False, "produits": [], "produits_supprimes": [],
+              "mouvements": [], "mouvements_supprimes": []}
+    version = database.data_version()
+    with _seen_lock:
+        if version == _seen["version"] and seq == _seen["seq"]:
+            return result
+    with database.read() as conn:
+        oldest, newest = conn.execute("SELECT MIN(seq), MAX(seq) FROM journal_modifs").fetchone()
+        rows = conn.execute("""SELECT seq, objet, operation, objet_id FROM journal_modifs
+                               WHERE seq > ? ORDER BY seq LIMIT ?""", (seq, limit + 1)).fetchall()
+    newest = newest or 0
+    with _seen_lock:
+        _seen.update(version=version, seq=newest)
+    if len(rows) > limit or (oldest is not None and seq < oldest - 1) or seq > newest:
+        result.update(seq=newest, reset=True)
+        return result
+    upserted = {"produit": set(), "mouvement": set()}
+    deleted = {"produit": set(), "mouvement": set()}
+    for _, objet, operation, objet_id in rows:
+        if operation == "D":
+            upserted[objet].discard(objet_id)
+            deleted[objet].add(objet_id)
+        else:
+            upserted[objet].add(objet_id)
+            deleted[objet].discard(objet_id)
+    result.update(seq=rows[-1][0] if rows else seq,
+                  produits=sorted(upserted["produit"]), produits_supprimes=sorted(deleted["produit"]),
+                  mouvements=sorted(upserted["mouvement"]), mouvements_supprimes=sorted(deleted["mouvement"]))
+    return result
+
+
+# === RAPPORTS ===
+
+def consumption(axe, debut=None, fin=None):
+    query, params = rapports.consumption_query(axe, debut, fin)
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def rebuild_aggregates():
+    with database.transaction() as conn:
+        rapports.rebuild_aggregates(conn)
+
+
+def _valuation_filters(filters):
+    date = (filters.get("date") or "").strip() or None
+    if date:
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Date invalide : {date} (AAAA-MM-JJ)")
+    axe = filters.get("axe") or "produit"
+    if axe not in rapports.VALUATION_AXES:
+        raise ValueError(f"Axe inconnu : {axe}")
+    return date, axe, filters.get("nature") or None
+
+
+def inventory_at(date=None, axe="produit", nature=None):
+    """Inventaire valorisé à une date (voir rapports.valuation_query)."""
+    query, params = rapports.valuation_query(*_valuation_filters({"date": date, "axe": axe, "nature": nature}))
+    with database.read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+# === EXPORTS ET IMPORTS ===
+
+EXPORT_KINDS = {"inventaire": ("xlsx", "pdf"), "historique": ("xlsx", "pdf"), "consommation": ("xlsx",),
+                "inventaire_date": ("xlsx", "pdf")}
+
+
+def export_source(kind, fmt, filters=None):
+    """(requête, paramètres, fonction d'export) d'un export nommé ; `fmt` : xlsx ou pdf."""
+    import export_utils
+    filters = filters or {}
+    if fmt not in EXPORT_KINDS.get(kind, ()):
+        raise ValueError(f"Export inconnu : {kind}.{fmt}")
+    if kind == "inventaire":
+        func = export_utils.export_excel if fmt == "xlsx" else export_utils.export_pdf
+        return queries.INVENTORY_EXPORT_QUERY, [], func
+    if kind == "historique":
+        query, params = queries.history_export_query(**history_filters(filters))
+        func = export_utils.export_history_excel if fmt == "xlsx" else export_utils.export_history_pdf
+        return query, params, func
+    if kind == "inventaire_date":
+        date, axe, nature = _valuation_filters(filters)
+        query, params = rapports.valuation_query(date, axe, nature)
+        func = export_utils.export_valuation_excel if fmt == "xlsx" else export_utils.export_valuation_pdf
+        return query, params, functools.partial(func, date=date, axe=axe)
+    axe = filters.get("axe")
+    query, params = rapports.consumption_query(axe, filters.get("debut"), filters.get("fin"))
+    headers = [rapports.AXES[axe], "Mois", "Entrées", "Sorties"]
+    return query, params, functools.partial(export_utils.export_excel_stream, headers=headers, title="Consommation")
+
+
+def export_estimate(kind, filters=None):
+    """(requête, paramètres) d'un COUNT(*) approchant le nombre de lignes d'un export nommé,
+    ou None si le total n'est pas connu à peu de frais (progression indéterminée)."""
+    filters = filters or {}
+    if kind == "inventaire":
+        return "SELECT COUNT(*) FROM produits", []
+    if kind == "historique":
+        return queries.history_count_query(**history_filters(filters))
+    if kind == "inventaire_date" and (filters.get("axe") or "produit") == "produit":
+        # Borne haute : les articles sans stock à la date ne sont pas exportés
+        if filters.get("nature"):
+            return "SELECT COUNT(*) FROM produits WHERE nature = ?", [filters["nature"]]
+        return "SELECT COUNT(*) FROM produits", []
+    return None
+
+
+def export(kind, fmt, filters, save_path):
+    """Export nommé écrit dans `save_path` ; renvoie le nombre de lignes."""
+    query, params, func = export_source(kind, fmt, filters)
+    with database.read() as conn:
+        return func(conn.execute(query, params), save_path)
+
+
+def import_file(kind, path):
+    import import_utils
+    if kind not in import_utils.IMPORTERS:
+        raise ValueError(f"Import inconnu : {kind}")
+    if not os.path.exists(path):
+        raise NotFound(path)
+    with diagnostics.action(diagnostics.current_action() or f"import {kind}"):
+        return import_utils.IMPORTERS[kind](path)
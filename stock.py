@@ -0,0 +1,274 @@
+# Écritures de stock : chaque mouvement met à jour produits.quantite et
+# enregistre le stock obtenu (stock_apres) dans la même transaction.
+# Une SORTIE est un décrément conditionnel (WHERE quantite >= ?) : le contrôle du
+# stock et l'écriture forment une seule instruction, sans fenêtre entre lecture
+# et écriture quand plusieurs postes travaillent sur la même base.
+#
+# mouvements est le grand livre du stock : toute variation de quantité y est inscrite,
+# y compris la création d'un article (INITIAL) et une quantité corrigée à la main
+# (AJUSTEMENT, quantité signée). produits.quantite n'en est que le solde courant ;
+# stock_snapshots (migration 8) en garde des soldes intermédiaires (voir prendre_instantanes).
+
+from datetime import datetime
+
+TYPES = ("ENTREE", "SORTIE", "INITIAL", "AJUSTEMENT")
+
+# Un instantané tous les SNAPSHOT_EVERY mouvements d'un article
+SNAPSHOT_EVERY = 100
+
+# Coût unitaire moyen pondéré (CUMP) : produits.cump, recalculé à chaque ENTREE valorisée ;
+# NULL tant qu'aucune entrée n'a été valorisée, le prix de l'article en tient lieu.
+# Chaque mouvement garde son prix unitaire et le CUMP obtenu (migration 10).
+CUMP = "COALESCE(cump, prix)"
+# Paramètres : prix, prix, quantité, prix, quantité. Stock nul ou négatif : le prix d'entrée
+CUMP_ENTREE = f"""CASE WHEN ? IS NULL THEN cump
+                      WHEN quantite <= 0 THEN ?
+                      ELSE (quantite * {CUMP} + ? * ?) / (quantite + ?) END"""
+
+
+# Format des dates de mouvement : l'ordre du grand livre est l'ordre de ces chaînes
+DATE_MVT = "%Y-%m-%d %H:%M:%S"
+
+
+def horodatage(date_mvt=None):
+    """Date de mouvement au format DATE_MVT ; une date seule (AAAA-MM-JJ) prend l'heure courante.
+
+    Sans l'heure, « 2025-03-01 » se classerait avant tous les mouvements du même jour.
+    """
+    now = datetime.now()
+    if date_mvt is None:
+        return now.strftime(DATE_MVT)
+    if isinstance(date_mvt, datetime):
+        return date_mvt.strftime(DATE_MVT)
+    text = str(date_mvt).strip()
+    try:
+        return datetime.strptime(text, DATE_MVT).strftime(DATE_MVT)
+    except ValueError:
+        pass
+    try:
+        day = datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Date invalide : {date_mvt!r} (AAAA-MM-JJ ou AAAA-MM-JJ HH:MM:SS).")
+    return day.replace(hour=now.hour, minute=now.minute, second=now.second).strftime(DATE_MVT)
+
+
+class StockInsuffisant(ValueError):
+    def __init__(self, produit_id, disponible, demande):
+        super().__init__(f"Stock insuffisant : {disponible} disponible(s), {demande} demandé(s).")
+        self.produit_id = produit_id
+        self.disponible = disponible
+        self.demande = demande
+
+
+def signed_quantity(type_mvt, quantite):
+    return -quantite if type_mvt == "SORTIE" else quantite
+
+
+def enregistrer_mouvement(conn, produit_id, type_mvt, quantite, date_mvt, service="", observation="",
+                          prix_unitaire=None):
+    """Applique un mouvement ENTREE/SORTIE ; à appeler dans database.transaction().
+
+    Une ENTREE au `prix_unitaire` donné met à jour le coût unitaire moyen pondéré
+    (produits.cump) ; sans prix, ou pour une SORTIE, le mouvement est valorisé au CUMP.
+    Un mouvement antidaté recalcule les mouvements postérieurs (voir rejouer_mouvements).
+    Renvoie (id du mouvement, stock de l'article après le mouvement). Lève StockInsuffisant
+    si une SORTIE dépasse le stock au moment de l'écriture, ou à sa date si elle est antidatée.
+    """
+    if type_mvt == "SORTIE":
+        row = conn.execute(f"""UPDATE produits SET quantite = quantite - ?
+                               WHERE id = ? AND quantite >= ? RETURNING quantite, {CUMP}""",
+                           (quantite, produit_id, quantite)).fetchone()
+    else:
+        # Les expressions du SET lisent toutes la ligne d'avant la mise à jour
+        row = conn.execute(f"""UPDATE produits SET quantite = quantite + ?, cump = {CUMP_ENTREE}
+                               WHERE id = ? RETURNING quantite, {CUMP}""",
+                           (quantite, prix_unitaire, prix_unitaire, quantite, prix_unitaire, quantite,
+                            produit_id)).fetchone()
+    if row is None:
+        current = conn.execute("SELECT quantite FROM produits WHERE id = ?", (produit_id,)).fetchone()
+        if current is None:
+            raise ValueError(f"Article introuvable (id={produit_id}).")
+        raise StockInsuffisant(produit_id, current[0], quantite)
+    stock_apres, cump = row
+    if type_mvt == "SORTIE" or prix_unitaire is None:
+        prix_unitaire = cump
+    cur = conn.execute("""
+        INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres,
+                                prix_unitaire, cump_apres)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (produit_id, type_mvt, quantite, date_mvt, service, observation, stock_apres, prix_unitaire, cump))
+    if antidate(conn, produit_id, date_mvt):
+        minimum = rejouer_mouvements(conn, produit_id, date_mvt, cur.lastrowid)
+        if type_mvt == "SORTIE" and minimum < 0:
+            raise StockInsuffisant(produit_id, quantite + minimum, quantite)
+    return cur.lastrowid, stock_apres
+
+
+def antidate(conn, produit_id, date_mvt):
+    """Vrai si l'article a déjà des mouvements postérieurs à `date_mvt`."""
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM mouvements WHERE produit_id = ? AND date_mvt > ?)",
+                        (produit_id, date_mvt)).fetchone()[0]
+
+
+def rejouer_mouvements(conn, produit_id, date_mvt, mvt_id=0):
+    """Recalcule stock_apres, cump_apres (et le prix des sorties) des mouvements de l'article
+    à partir de la clé (date_mvt, mvt_id), dans l'ordre des dates ; à appeler dans
+    database.transaction() après l'écriture d'un mouvement antidaté.
+
+    Les ENTREE gardent leur prix unitaire ; produits.cump reçoit le CUMP final s'il a déjà
+    été valorisé. Renvoie le stock le plus bas atteint sur la période rejouée.
+    """
+    prix, cump_article = conn.execute("SELECT prix, cump FROM produits WHERE id = ?", (produit_id,)).fetchone()
+    avant = conn.execute("""SELECT stock_apres, cump_apres FROM mouvements
+                            WHERE produit_id = ? AND (date_mvt, id) < (?, ?)
+                            ORDER BY date_mvt DESC, id DESC LIMIT 1""", (produit_id, date_mvt, mvt_id)).fetchone()
+    quantite, cump = avant if avant else (0, None)
+    cump = prix if cump is None else cump
+    minimum = quantite
+    updates = []
+    for mid, type_mvt, q, prix_unitaire, stock_apres, cump_apres in conn.execute("""
+            SELECT id, type, quantite, prix_unitaire, stock_apres, cump_apres FROM mouvements
+            WHERE produit_id = ? AND (date_mvt, id) >= (?, ?) ORDER BY date_mvt, id
+    """, (produit_id, date_mvt, mvt_id)).fetchall():
+        ancien = (stock_apres, cump_apres, prix_unitaire)
+        if type_mvt == "ENTREE":
+            cump = cump_apres_entree(quantite, cump, q, prix_unitaire)
+        elif prix_unitaire is not None:
+            prix_unitaire = cump   # sorties et ajustements : valorisés au CUMP de leur date
+        quantite += signed_quantity(type_mvt, q)
+        minimum = min(minimum, quantite)
+        if ancien != (quantite, cump, prix_unitaire):
+            updates.append((quantite, cump, prix_unitaire, mid))
+    conn.executemany("UPDATE mouvements SET stock_apres = ?, cump_apres = ?, prix_unitaire = ? WHERE id = ?",
+                     updates)
+    if cump_article is not None:
+        conn.execute("UPDATE produits SET cump = ? WHERE id = ? AND cump IS NOT ?", (cump, produit_id, cump))
+    return minimum
+
+
+def cump_apres_entree(stock, cump, quantite, prix_unitaire):
+    """CUMP après une entrée de `quantite` au `prix_unitaire` (même calcul que CUMP_ENTREE)."""
+    if prix_unitaire is None:
+        return cump
+    if stock <= 0:
+        return prix_unitaire
+    return (stock * cump + quantite * prix_unitaire) / (stock + quantite)
+
+
+class StocksInsuffisants(ValueError):
+    """Affectation groupée refusée : une StockInsuffisant par article en défaut."""
+
+    def __init__(self, manques):
+        super().__init__(f"Stock insuffisant pour {len(manques)} article(s).")
+        self.manques = manques
+
+
+def enregistrer_sorties(conn, lignes, date_mvt, service="", observation=""):
+    """SORTIES groupées vers un même destinataire ; à appeler dans database.transaction().
+
+    `lignes` : [(produit_id, quantité), ...]. Les stocks sont contrôlés en une seule
+    requête ; si un article manque, StocksInsuffisants est levée avant toute écriture
+    (pour une affectation antidatée, après recalcul : la transaction est alors annulée).
+    Les décréments sont ensuite écrits par lot (executemany), puis un mouvement par ligne.
+    Renvoie [(id du mouvement, produit_id, quantité, stock après), ...] dans l'ordre des lignes.
+    """
+    import queries
+    if not lignes:
+        return []
+    demandes = {}
+    for produit_id, quantite in lignes:
+        if quantite <= 0:
+            raise ValueError(f"Quantité invalide pour l'article {produit_id}.")
+        demandes[produit_id] = demandes.get(produit_id, 0) + quantite
+    clause, params = queries.ids_filter("id", demandes)
+    # BEGIN IMMEDIATE : aucun autre poste ne peut écrire entre ce contrôle et les décréments
+    stocks, cumps = {}, {}
+    for pid, qte, cump in conn.execute(f"SELECT id, quantite, {CUMP} FROM produits WHERE 1=1{clause}", params):
+        stocks[pid], cumps[pid] = qte, cump
+    introuvables = [pid for pid in demandes if pid not in stocks]
+    if introuvables:
+        raise ValueError(f"Article(s) introuvable(s) : {', '.join(map(str, introuvables))}.")
+    manques = [StockInsuffisant(pid, stocks[pid], q) for pid, q in demandes.items() if stocks[pid] < q]
+    if manques:
+        raise StocksInsuffisants(manques)
+
+    cur = conn.executemany("UPDATE produits SET quantite = quantite - ? WHERE id = ? AND quantite >= ?",
+                           [(q, pid, q) for pid, q in demandes.items()])
+    if cur.rowcount != len(demandes):
+        raise RuntimeError("Stock modifié pendant l'affectation groupée.")   # ne devrait pas arriver
+    restant = dict(stocks)
+    resultat, premiers = [], {}   # premiers : id du premier mouvement de chaque article
+    for produit_id, quantite in lignes:
+        restant[produit_id] -= quantite
+        # Identifiant lu à l'insertion : aucune hypothèse sur la suite des rowid
+        mvt_id = conn.execute("""
+            INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres,
+                                    prix_unitaire, cump_apres)
+            VALUES (?, 'SORTIE', ?, ?, ?, ?, ?, ?, ?) RETURNING id
+        """, (produit_id, quantite, date_mvt, service, observation, restant[produit_id],
+              cumps[produit_id], cumps[produit_id])).fetchone()[0]
+        premiers.setdefault(produit_id, mvt_id)
+        resultat.append((mvt_id, produit_id, quantite, restant[produit_id]))
+    # Affectation antidatée : mouvements postérieurs recalculés, stock contrôlé à sa date
+    manques = []
+    for pid, q in demandes.items():
+        if antidate(conn, pid, date_mvt):
+            minimum = rejouer_mouvements(conn, pid, date_mvt, premiers[pid])
+            if minimum < 0:
+                manques.append(StockInsuffisant(pid, q + minimum, q))
+    if manques:
+        raise StocksInsuffisants(manques)
+    return resultat
+
+
+def journaliser_quantites(conn, lignes, date_mvt, observation=""):
+    """Inscrit au grand livre des quantités saisies directement ; à appeler dans database.transaction().
+
+    `lignes` : [(produit_id, quantité avant, quantité après), ...], produits.quantite valant
+    déjà la quantité après. Avant None : création de l'article (mouvement INITIAL) ;
+    sinon mouvement AJUSTEMENT de l'écart. Les lignes sans écart sont ignorées.
+    """
+    mouvements = [(pid, "INITIAL" if avant is None else "AJUSTEMENT", apres - (avant or 0), apres)
+                  for pid, avant, apres in lignes if apres != (avant or 0)]
+    # Valorisé au CUMP de l'article (à la création : son prix)
+    conn.executemany(f"""
+        INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation, stock_apres,
+                                prix_unitaire, cump_apres)
+        SELECT id, ?, ?, ?, '', ?, ?, {CUMP}, {CUMP} FROM produits WHERE id = ?
+    """, [(type_mvt, q, date_mvt, observation, apres, pid) for pid, type_mvt, q, apres in mouvements])
+    return len(mouvements)
+
+
+def prendre_instantanes(conn, every=SNAPSHOT_EVERY):
+    """Complète stock_snapshots : un solde tous les `every` mouvements de chaque article.
+
+    Seuls les articles ayant reçu des mouvements depuis le passage précédent (compteur
+    'instantanes') sont examinés, et seuls leurs mouvements postérieurs au dernier
+    instantané sont rejoués. Un mouvement antidaté supprime les instantanés qu'il rend
+    faux (triggers de la migration 8). Renvoie le nombre d'instantanés créés.
+    """
+    import queries
+    depuis = conn.execute("SELECT valeur FROM compteurs WHERE nom = 'instantanes'").fetchone()
+    depuis = depuis[0] if depuis else 0
+    fin = conn.execute("SELECT COALESCE(MAX(id), 0) FROM mouvements").fetchone()[0]
+    cur = conn.execute(f"""
+        INSERT INTO stock_snapshots (produit_id, date_mvt, mvt_id, quantite)
+        WITH articles AS (
+            SELECT DISTINCT produit_id AS id FROM mouvements WHERE id > ? AND id <= ?),
+        queue AS (
+            SELECT m.produit_id, m.date_mvt, m.id,
+                   COALESCE(d.quantite, 0) + SUM({queries.MOVEMENT_EFFECT}) OVER w AS stock,
+                   ROW_NUMBER() OVER w AS n
+            FROM articles a
+            LEFT JOIN stock_snapshots d ON d.produit_id = a.id AND (d.date_mvt, d.mvt_id) = (
+                SELECT s.date_mvt, s.mvt_id FROM stock_snapshots s WHERE s.produit_id = a.id
+                ORDER BY s.date_mvt DESC, s.mvt_id DESC LIMIT 1)
+            JOIN mouvements m ON m.produit_id = a.id AND m.date_mvt >= COALESCE(d.date_mvt, '')
+                             AND (d.produit_id IS NULL OR m.date_mvt > d.date_mvt OR m.id > d.mvt_id)
+            WINDOW w AS (PARTITION BY m.produit_id ORDER BY m.date_mvt, m.id)
+        )
+        SELECT produit_id, date_mvt, id, stock FROM queue WHERE n % ? = 0
+    """, (depuis, fin, every))
+    created = cur.rowcount
+    conn.execute("INSERT OR REPLACE INTO compteurs (nom, valeur) VALUES ('instantanes', ?)", (fin,))
+    return created
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import services
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base neuve, migrée, dans le dossier temporaire du test."""
+    path = str(tmp_path / "magasin.db")
+    database.set_db_path(path)
+    services._seen.update(version=None, seq=0)   # journal des modifications vu sur une autre base
+    database.init_db()
+    yield path
+    database.get_manager().close()
+
+
+def ajouter_article(nom, quantite=0, prix=0.0, nature="Fournitures"):
+    return services.add_product({"nom": nom, "nature": nature, "quantite": quantite, "prix": prix,
+                                 "seuil_min": 0, "date_ajout": "2025-01-01", "observation": ""})
@@ -0,0 +1,60 @@
+import pytest
+
+import database
+import services
+import stock
+from conftest import ajouter_article
+
+
+def _etat():
+    with database.read() as conn:
+        return (conn.execute("SELECT id, quantite FROM produits ORDER BY id").fetchall(),
+                conn.execute("SELECT COUNT(*) FROM mouvements").fetchone()[0])
+
+
+def test_affectation_lot(db):
+    a = ajouter_article("Stylo", quantite=10)
+    b = ajouter_article("Crayon", quantite=4)
+    mouvements = services.affecter_lot([(a, 3), (b, 4), (a, 2)], "RH", "  dotation  ")
+    assert [m[1:] for m in mouvements] == [(a, 3, 7), (b, 4, 0), (a, 2, 5)]
+    with database.read() as conn:
+        lignes = conn.execute("""SELECT id, produit_id, quantite, stock_apres, service, observation
+                                 FROM mouvements WHERE type = 'SORTIE' ORDER BY id""").fetchall()
+    assert [(l[0], l[1], l[2], l[3]) for l in lignes] == mouvements
+    assert {(l[4], l[5]) for l in lignes} == {("RH", "dotation")}
+
+
+def test_identifiants_malgre_un_trou(db):
+    a = ajouter_article("Stylo", quantite=10)
+    with database.transaction() as conn:   # rowid non consécutifs : une ligne d'un autre type intercalée
+        conn.execute("""CREATE TEMP TRIGGER intercale AFTER INSERT ON mouvements WHEN new.type = 'SORTIE' BEGIN
+                            INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation)
+                            VALUES (new.produit_id, 'AJUSTEMENT', 0, new.date_mvt, '', 'trace');
+                        END""")
+    try:
+        mouvements = services.affecter_lot([(a, 1), (a, 2)], "RH")
+    finally:
+        with database.transaction() as conn:
+            conn.execute("DROP TRIGGER intercale")
+    with database.read() as conn:
+        sorties = conn.execute("SELECT id FROM mouvements WHERE type = 'SORTIE' ORDER BY id").fetchall()
+    assert [m[0] for m in mouvements] == [r[0] for r in sorties]
+
+
+def test_stock_insuffisant_annule_tout(db):
+    a = ajouter_article("Stylo", quantite=10)
+    b = ajouter_article("Crayon", quantite=1)
+    avant = _etat()
+    with pytest.raises(stock.StocksInsuffisants) as exc:
+        services.affecter_lot([(a, 3), (b, 2)], "RH")
+    assert [(m.produit_id, m.disponible, m.demande) for m in exc.value.manques] == [(b, 1, 2)]
+    assert _etat() == avant
+
+
+def test_lot_antidate_annule_apres_recalcul(db):
+    a = ajouter_article("Stylo", quantite=10)   # stock initial horodaté maintenant
+    avant = _etat()
+    with pytest.raises(stock.StocksInsuffisants) as exc:
+        services.affecter_lot([(a, 3)], "RH", date_mvt="2020-01-01 09:00:00")
+    assert exc.value.manques[0].disponible == 0
+    assert _etat() == avant
@@ -0,0 +1,57 @@
+import pytest
+
+import backends
+import catalogue
+import services
+from conftest import ajouter_article
+
+
+class BackendCompteur(backends.DirectBackend):
+    """DirectBackend qui compte les allers-retours vers la base."""
+
+    def __init__(self):
+        self.appels = 0
+
+    def changes_since(self, seq, limit=services.CHANGES_LIMIT):
+        self.appels += 1
+        return services.changes_since(seq, limit)
+
+    def search_products(self, *args, **kwargs):
+        self.appels += 1
+        return services.search_products(*args, **kwargs)
+
+
+def test_lectures_sans_acces_au_backend(db):
+    a = ajouter_article("Stylo", quantite=3)
+    ajouter_article("Agrafeuse")
+    backend = BackendCompteur()
+    cat = catalogue.Catalogue(backend)
+    cat.refresh()
+    appels = backend.appels
+
+    assert len(cat) == 2
+    assert cat.get(a).quantite == 3
+    assert cat.name(a) == "Stylo"
+    assert cat.names() == ["Agrafeuse", "Stylo"]
+    assert [p.nom for p in cat.sorted_by_name()] == ["Agrafeuse", "Stylo"]
+    assert backend.appels == appels
+
+
+def test_refresh_applique_les_modifications(db):
+    a = ajouter_article("Stylo", quantite=3)
+    b = ajouter_article("Agrafeuse")
+    cat = catalogue.Catalogue(BackendCompteur())
+    cat.refresh()
+
+    services.affecter(a, 1, "RH")
+    services.delete_product(b)
+    c = ajouter_article("Classeur")
+    # Rien ne change avant le prochain refresh
+    assert cat.get(a).quantite == 3 and cat.get(b) is not None and cat.get(c) is None
+
+    cat.refresh()
+    assert cat.get(a).quantite == 2
+    assert cat.get(b) is None
+    assert cat.names() == ["Classeur", "Stylo"]
+    with pytest.raises(services.NotFound):
+        cat.name(b)
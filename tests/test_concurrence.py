@@ -0,0 +1,68 @@
+import multiprocessing
+import random
+import sqlite3
+
+import database
+import services
+import stock
+from conftest import ajouter_article
+
+ARTICLES = 3
+STOCK_INITIAL = 60
+PROCESSUS = 4
+OPERATIONS = 40
+
+
+def _sorties(path, seed, resultats):
+    # Processus distinct : sa propre connexion d'écriture, comme un autre poste
+    database.set_db_path(path)
+    rng = random.Random(seed)
+    faites = refusees = 0
+    for i in range(OPERATIONS):
+        try:
+            with database.transaction() as conn:
+                stock.enregistrer_mouvement(conn, rng.randint(1, ARTICLES), "SORTIE", rng.randint(1, 4),
+                                            f"2025-03-01 10:{i // 60:02d}:{i % 60:02d}", f"poste {seed}")
+            faites += 1
+        except stock.StockInsuffisant:
+            refusees += 1
+    database.get_manager().close()
+    resultats.put((faites, refusees))
+
+
+def test_sorties_concurrentes(db):
+    for i in range(1, ARTICLES + 1):
+        ajouter_article(f"Article {i}", quantite=STOCK_INITIAL)
+    database.get_manager().close()
+
+    ctx = multiprocessing.get_context("spawn")
+    resultats = ctx.Queue()
+    procs = [ctx.Process(target=_sorties, args=(db, seed, resultats)) for seed in range(PROCESSUS)]
+    for p in procs:
+        p.start()
+    comptes = [resultats.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+
+    assert sum(f + r for f, r in comptes) == PROCESSUS * OPERATIONS
+    assert sum(r for _, r in comptes) > 0   # le stock a bien été épuisé pendant l'essai
+    conn = sqlite3.connect(db)
+    try:
+        for pid, quantite in conn.execute("SELECT id, quantite FROM produits"):
+            sorties, n, dernier = conn.execute("""
+                SELECT COALESCE(SUM(quantite), 0), COUNT(*),
+                       (SELECT stock_apres FROM mouvements WHERE produit_id = ? ORDER BY id DESC LIMIT 1)
+                FROM mouvements WHERE produit_id = ? AND type = 'SORTIE'
+            """, (pid, pid)).fetchone()
+            assert quantite >= 0
+            assert quantite == STOCK_INITIAL - sorties   # aucune sortie perdue ni comptée deux fois
+            assert dernier == quantite
+            # stock_apres décroît strictement, sans valeur négative
+            apres = [r[0] for r in conn.execute("""SELECT stock_apres FROM mouvements
+                                                   WHERE produit_id = ? AND type = 'SORTIE' ORDER BY id""", (pid,))]
+            assert len(apres) == n
+            assert all(a > b >= 0 for a, b in zip([STOCK_INITIAL] + apres, apres))
+    finally:
+        conn.close()
+    assert services.ledger_drift(full=True) == []
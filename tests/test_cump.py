@@ -0,0 +1,44 @@
+import pytest
+
+import database
+import stock
+from conftest import ajouter_article
+
+
+def _entree(pid, quantite, prix, date):
+    with database.transaction() as conn:
+        stock.enregistrer_mouvement(conn, pid, "ENTREE", quantite, date, prix_unitaire=prix)
+
+
+def _cump(pid):
+    with database.read() as conn:
+        return conn.execute(f"SELECT {stock.CUMP} FROM produits WHERE id = ?", (pid,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("seconde, attendu", [(10, 6.0), (20, 6.33)])
+def test_cump_entrees_successives(db, seconde, attendu):
+    pid = ajouter_article("Cartouche")
+    _entree(pid, 10, 5.0, "2025-02-01 09:00:00")
+    assert _cump(pid) == pytest.approx(5.0)
+    _entree(pid, seconde, 7.0, "2025-02-02 09:00:00")
+    assert round(_cump(pid), 2) == attendu
+    assert _cump(pid) == pytest.approx(stock.cump_apres_entree(10, 5.0, seconde, 7.0))
+
+
+def test_sortie_valorisee_au_cump(db):
+    pid = ajouter_article("Cartouche")
+    _entree(pid, 10, 5.0, "2025-02-01 09:00:00")
+    _entree(pid, 10, 7.0, "2025-02-02 09:00:00")
+    with database.transaction() as conn:
+        stock.enregistrer_mouvement(conn, pid, "SORTIE", 4, "2025-02-03 09:00:00", "RH")
+    with database.read() as conn:
+        prix, cump, apres = conn.execute("""SELECT prix_unitaire, cump_apres, stock_apres FROM mouvements
+                                            WHERE produit_id = ? ORDER BY id DESC LIMIT 1""", (pid,)).fetchone()
+    assert (prix, cump, apres) == (pytest.approx(6.0), pytest.approx(6.0), 16)
+    assert _cump(pid) == pytest.approx(6.0)   # une sortie ne modifie pas le CUMP
+
+
+def test_entree_sans_prix_garde_le_cump(db):
+    pid = ajouter_article("Cartouche", quantite=10, prix=5.0)
+    _entree(pid, 10, None, "2025-02-01 09:00:00")
+    assert _cump(pid) == pytest.approx(5.0)
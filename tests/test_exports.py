@@ -0,0 +1,66 @@
+import glob
+import os
+import tempfile
+
+import pytest
+
+import database
+import export_jobs
+import export_utils
+import services
+from conftest import ajouter_article
+
+
+def _job(kind, filters, path, estimate):
+    query, params, func = services.export_source(kind, "xlsx", filters)
+    job = export_jobs.ExportJob(kind, func, query, params, str(path), estimate)
+    progress = []
+    job.signals.progress.connect(lambda job, rows, pct: progress.append(pct))
+    return job, progress
+
+
+def test_estimation_de_l_historique(db):
+    a = ajouter_article("Stylo", quantite=10)
+    ajouter_article("Crayon", quantite=5)
+    for _ in range(3):
+        services.affecter(a, 1, "RH")
+    for filters in ({}, {"article_nom": "Stylo"}, {"produit_id": a, "type_mvt": "SORTIE"}, {"service": "DAF"}):
+        query, params = services.export_source("historique", "xlsx", filters)[:2]
+        with database.read() as conn:
+            attendu = len(conn.execute(query, params).fetchall())
+            assert conn.execute(*services.export_estimate("historique", filters)).fetchone()[0] == attendu
+    assert services.export_estimate("consommation", {"axe": "nature"}) is None
+
+
+def test_progression_avec_et_sans_estimation(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, "PROGRESS_STEP", 2)
+    for i in range(6):
+        ajouter_article(f"Article {i}", quantite=1)
+
+    job, progress = _job("inventaire", {}, tmp_path / "a.xlsx", services.export_estimate("inventaire"))
+    job.run()
+    assert job.rows_written == 6
+    assert progress == [33, 66, 99, 100]
+
+    job, progress = _job("inventaire", {}, tmp_path / "b.xlsx", None)
+    job.run()
+    assert progress == [-1, -1, -1, 100]
+
+
+def test_export_excel_interrompu(tmp_path):
+    def lignes():
+        for i in range(1000):
+            if i == 700:
+                raise RuntimeError("lecture interrompue")
+            yield [f"Article {i}", i]
+
+    temporaires = set(glob.glob(os.path.join(tempfile.gettempdir(), "openpyxl.*")))
+    path = str(tmp_path / "partiel.xlsx")
+    with pytest.raises(RuntimeError):
+        export_utils.export_excel_stream(lignes(), path, ["Article", "Qté"], "Test")
+    assert not os.path.exists(path)
+    # Fichier temporaire de la feuille supprimé
+    assert set(glob.glob(os.path.join(tempfile.gettempdir(), "openpyxl.*"))) == temporaires
+
+    assert export_utils.export_excel_stream(([i] for i in range(3)), path, ["N"], "Test") == 3
+    assert os.path.exists(path)
@@ -0,0 +1,105 @@
+import csv
+
+import pytest
+
+import database
+import import_utils
+import services
+import stock
+from conftest import ajouter_article
+
+
+def _mouvement(pid, type_mvt, quantite, date, prix=None):
+    with database.transaction() as conn:
+        return stock.enregistrer_mouvement(conn, pid, type_mvt, quantite, date, prix_unitaire=prix)
+
+
+def _grand_livre(pid):
+    """[(type, quantité, stock après, CUMP après), ...] dans l'ordre des dates."""
+    with database.read() as conn:
+        return conn.execute("""SELECT type, quantite, stock_apres, ROUND(cump_apres, 2) FROM mouvements
+                               WHERE produit_id = ? ORDER BY date_mvt, id""", (pid,)).fetchall()
+
+
+@pytest.fixture
+def article(db):
+    pid = ajouter_article("Classeur")   # INITIAL absent : stock nul à la création
+    _mouvement(pid, "ENTREE", 10, "2025-03-01 09:00:00", 5.0)
+    _mouvement(pid, "SORTIE", 4, "2025-03-10 09:00:00")
+    return pid
+
+
+def test_entree_antidatee_recalcule_la_suite(article):
+    _, restant = _mouvement(article, "ENTREE", 10, "2025-03-05 09:00:00", 8.0)
+    assert restant == 16
+    assert _grand_livre(article) == [("ENTREE", 10, 10, 5.0), ("ENTREE", 10, 20, 6.5), ("SORTIE", 4, 16, 6.5)]
+    assert services.stock_at(article, "2025-03-06") == 20
+    assert services.ledger_drift(full=True) == []
+    with database.read() as conn:
+        assert conn.execute("SELECT ROUND(cump, 2) FROM produits WHERE id = ?", (article,)).fetchone()[0] == 6.5
+
+
+def test_sortie_antidatee_sans_stock_a_sa_date(article):
+    # 6 en stock aujourd'hui, mais rien avant le 1er mars
+    with pytest.raises(stock.StockInsuffisant) as exc:
+        _mouvement(article, "SORTIE", 2, "2025-02-15 09:00:00")
+    assert exc.value.disponible == 0
+    assert _grand_livre(article) == [("ENTREE", 10, 10, 5.0), ("SORTIE", 4, 6, 5.0)]
+
+    _mouvement(article, "SORTIE", 6, "2025-03-05 09:00:00")
+    assert [r[2] for r in _grand_livre(article)] == [10, 4, 0]
+
+
+def test_import_de_mouvements_historiques(article, tmp_path):
+    path = tmp_path / "mouvements.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["id", "type", "quantite", "date_mvt", "prix"])
+        w.writerow([article, "ENTREE", 5, "2025-02-01", 3.0])     # antérieure à tout l'historique
+        w.writerow([article, "SORTIE", 20, "2025-02-02", ""])     # stock négatif à sa date : rejetée
+        w.writerow([article, "SORTIE", 1, "2025-03-20", ""])
+    report = import_utils.import_mouvements(str(path))
+    assert report.inserted == 2
+    assert [line for line, _ in report.rejected] == [3]
+    assert [r[2] for r in _grand_livre(article)] == [5, 15, 11, 10]
+    with database.read() as conn:   # date seule : heure courante ajoutée
+        assert conn.execute("SELECT COUNT(*) FROM mouvements WHERE length(date_mvt) != 19").fetchone()[0] == 0
+    assert services.ledger_drift(full=True) == []
+
+
+def test_horodatage():
+    assert stock.horodatage("2025-03-01 00:00:00") == "2025-03-01 00:00:00"   # minuit explicite conservé
+    date = stock.horodatage("2025-03-01")
+    assert len(date) == 19 and date.startswith("2025-03-01 ")
+    with pytest.raises(ValueError):
+        stock.horodatage("01/03/2025")
+
+
+def test_sortie_du_jour_datee_sans_heure(db):
+    pid = ajouter_article("Classeur", quantite=5)   # INITIAL horodaté maintenant
+    jour = stock.horodatage()[:10]
+    _, restant = services.affecter(pid, 5, "RH", date_mvt=jour)
+    assert restant == 0
+    assert [r[2] for r in _grand_livre(pid)] == [5, 0]
+
+
+def test_rejouer_mouvements_corrige_la_suite(article):
+    _mouvement(article, "ENTREE", 10, "2025-03-12 09:00:00", 8.0)
+    with database.transaction() as conn:
+        conn.execute("UPDATE mouvements SET stock_apres = -1, cump_apres = 0 WHERE produit_id = ?", (article,))
+        assert stock.rejouer_mouvements(conn, article, "2025-03-01 00:00:00") == 0
+    # 10@5, sortie de 4 au CUMP 5, puis 10@8 sur 6 en stock : (6*5 + 10*8) / 16
+    assert _grand_livre(article) == [("ENTREE", 10, 10, 5.0), ("SORTIE", 4, 6, 5.0), ("ENTREE", 10, 16, 6.88)]
+    with database.read() as conn:
+        prix_sortie = conn.execute("""SELECT prix_unitaire FROM mouvements
+                                      WHERE produit_id = ? AND type = 'SORTIE'""", (article,)).fetchone()[0]
+    assert prix_sortie == pytest.approx(5.0)
+
+
+def test_rejeu_revalorise_les_sorties_posterieures(article):
+    # Entrée antidatée avant la sortie : la sortie passe au nouveau CUMP
+    _mouvement(article, "ENTREE", 10, "2025-03-05 09:00:00", 9.0)
+    with database.read() as conn:
+        prix_sortie, cump_sortie = conn.execute("""SELECT prix_unitaire, cump_apres FROM mouvements
+                                                   WHERE produit_id = ? AND type = 'SORTIE'""", (article,)).fetchone()
+    assert prix_sortie == cump_sortie == pytest.approx(7.0)
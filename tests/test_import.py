@@ -0,0 +1,72 @@
+import csv
+
+import database
+import import_utils
+import services
+from conftest import ajouter_article
+
+
+def _csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(header)
+        w.writerows(rows)
+    return str(path)
+
+
+def _produit(pid):
+    with database.read() as conn:
+        return conn.execute("SELECT nom, nature, quantite, prix FROM produits WHERE id = ?", (pid,)).fetchone()
+
+
+def test_import_produits_mise_a_jour_partielle(db, tmp_path):
+    a = ajouter_article("Stylo", quantite=10, prix=1.0)
+    b = ajouter_article("Crayon", quantite=4, prix=0.5)
+    path = _csv(tmp_path / "tarif.csv", ["id", "prix"], [[a, "1,2"], [b, 0.6], [a, 1.5]])
+    report = import_utils.import_produits(path)
+    assert (report.inserted, report.updated, report.rejected) == (0, 2, [])   # Stylo compté une fois
+    assert _produit(a) == ("Stylo", "Fournitures", 10, 1.5)   # dernière ligne retenue, stock intact
+    assert _produit(b) == ("Crayon", "Fournitures", 4, 0.6)
+
+
+def test_import_produits_ajouts_et_quantites(db, tmp_path):
+    a = ajouter_article("Stylo", quantite=10)
+    path = _csv(tmp_path / "articles.csv", ["Article", "Nature", "Qté"],
+                [["Stylo", "Fournitures", 7], ["Gomme", "Fournitures", 3], ["", "Fournitures", 1],
+                 ["Stylo", "Fournitures", 8]])
+    report = import_utils.import_produits(path, batch_size=2)   # Stylo dans deux lots
+    assert (report.inserted, report.updated) == (1, 1)
+    assert [line for line, _ in report.rejected] == [4]
+    assert _produit(a)[2] == 8
+    assert services.ledger_drift(full=True) == []
+
+
+def test_import_produits_xlsx(db, tmp_path):
+    from openpyxl import Workbook
+    wb = Workbook()
+    wb.active.append(["Désignation", "Catégorie", "Prix unitaire"])
+    wb.active.append(["Agrafeuse", "Fournitures", 12.5])
+    path = str(tmp_path / "articles.xlsx")
+    wb.save(path)
+    report = import_utils.import_produits(path)
+    assert (report.inserted, report.rejected) == (1, [])
+    with database.read() as conn:
+        assert conn.execute("SELECT nom, prix FROM produits").fetchall() == [("Agrafeuse", 12.5)]
+
+
+def test_import_mouvements_dans_l_ordre_des_dates(db, tmp_path):
+    pid = ajouter_article("Classeur")
+    path = _csv(tmp_path / "mouvements.csv", ["article", "type", "quantite", "date", "destinataire"],
+                [["Classeur", "SORTIE", 3, "2025-03-10 09:00:00", "RH"],
+                 ["Classeur", "ENTREE", 5, "2025-03-01 09:00:00", ""],    # couvre la sortie qui la précède
+                 ["Classeur", "SORTIE", 5, "2025-03-10 09:00:00", "RH"],  # même date : après la ligne 2
+                 ["Inconnu", "ENTREE", 1, "2025-03-01 09:00:00", ""],
+                 ["Classeur", "RETOUR", 1, "2025-03-01 09:00:00", ""]])
+    report = import_utils.import_mouvements(path, batch_size=2)
+    assert report.inserted == 2
+    assert [line for line, _ in report.rejected] == [4, 5, 6]
+    assert report.rejected[0][1] == "stock insuffisant (2 disponible(s) à cette date)"
+    with database.read() as conn:
+        assert conn.execute("""SELECT type, quantite, stock_apres FROM mouvements WHERE produit_id = ?
+                               ORDER BY date_mvt, id""", (pid,)).fetchall() == [("ENTREE", 5, 5), ("SORTIE", 3, 2)]
+    assert services.ledger_drift(full=True) == []
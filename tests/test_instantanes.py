@@ -0,0 +1,64 @@
+import random
+
+import database
+import queries
+import services
+import stock
+from conftest import ajouter_article
+
+
+def _recompte(pid, jour):
+    """Stock à la fin de `jour`, en rejouant tous les mouvements (sans instantanés)."""
+    with database.read() as conn:
+        return conn.execute(f"""SELECT COALESCE(SUM({queries.MOVEMENT_EFFECT}), 0) FROM mouvements m
+                                WHERE m.produit_id = ? AND m.date_mvt <= ?""",
+                            (pid, queries.ledger_bound(jour))).fetchone()[0]
+
+
+def _historique(pid, n, rng):
+    for i in range(n):
+        type_mvt = "ENTREE" if rng.random() < 0.6 else "SORTIE"
+        try:
+            with database.transaction() as conn:
+                stock.enregistrer_mouvement(conn, pid, type_mvt, rng.randint(1, 5),
+                                            f"2025-01-{1 + i // 10:02d} {8 + i % 10:02d}:00:00")
+        except stock.StockInsuffisant:
+            pass
+
+
+def _instantanes(pid):
+    with database.read() as conn:
+        return conn.execute("SELECT COUNT(*) FROM stock_snapshots WHERE produit_id = ?", (pid,)).fetchone()[0]
+
+
+def test_stock_a_date_avec_instantanes(db):
+    pid = ajouter_article("Enveloppe")
+    _historique(pid, 200, random.Random(1))
+    with database.transaction() as conn:
+        assert stock.prendre_instantanes(conn, every=7) > 0
+        assert stock.prendre_instantanes(conn, every=7) == 0   # passe suivante : rien de nouveau
+    for jour in ("2024-12-31", "2025-01-01", "2025-01-07", "2025-01-13", "2025-01-20", None):
+        attendu = _recompte(pid, jour) if jour else services.stock_at(pid)
+        assert services.stock_at(pid, jour) == attendu
+    assert services.ledger_drift() == services.ledger_drift(full=True) == []
+
+
+def test_mouvement_antidate_invalide_les_instantanes_suivants(db):
+    pid = ajouter_article("Enveloppe")
+    _historique(pid, 100, random.Random(2))
+    with database.transaction() as conn:
+        stock.prendre_instantanes(conn, every=5)
+    avant = _instantanes(pid)
+    with database.transaction() as conn:
+        stock.enregistrer_mouvement(conn, pid, "ENTREE", 3, "2025-01-05 12:30:00")
+    assert 0 < _instantanes(pid) < avant
+    for jour in ("2025-01-04", "2025-01-05", "2025-01-08"):
+        assert services.stock_at(pid, jour) == _recompte(pid, jour)
+
+
+def test_reconcile_signale_un_ecart(db):
+    pid = ajouter_article("Enveloppe", quantite=10)
+    with database.transaction() as conn:   # écriture hors grand livre
+        conn.execute("UPDATE produits SET quantite = 12 WHERE id = ?", (pid,))
+    assert services.ledger_drift(full=True) == [(pid, "Enveloppe", 12, 10)]
+    assert services.ledger_drift() == [(pid, "Enveloppe", 12, 10)]
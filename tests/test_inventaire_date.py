@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+import database
+import queries
+import services
+import stock
+from conftest import ajouter_article
+
+DATES = ["2024-12-31", "2025-01-15", "2025-02-28", "2025-03-31", None]
+
+
+def _historique():
+    """Trois articles (deux natures), mouvements datés sur trois mois, dont des antidatés."""
+    rnd = random.Random(24)
+    ids = [ajouter_article("Stylo", nature="Fournitures"), ajouter_article("Toner", nature="Informatique"),
+           ajouter_article("Classeur", nature="Fournitures")]
+    for k in range(60):
+        pid = ids[k % 3]
+        date = f"2025-{1 + rnd.randrange(3):02d}-{1 + rnd.randrange(28):02d} {rnd.randrange(24):02d}:00:00"
+        try:
+            with database.transaction() as conn:
+                if rnd.random() < 0.6:
+                    stock.enregistrer_mouvement(conn, pid, "ENTREE", rnd.randint(1, 20), date,
+                                                prix_unitaire=rnd.choice([None, 2.0, 3.5, 5.0]))
+                else:
+                    stock.enregistrer_mouvement(conn, pid, "SORTIE", rnd.randint(1, 8), date)
+        except stock.StockInsuffisant:
+            pass   # sortie refusée : stock insuffisant à sa date
+        if k == 30:
+            with database.transaction() as conn:   # instantanés au milieu de l'historique
+                assert stock.prendre_instantanes(conn, every=3) > 0
+    return ids
+
+
+def _attendu(date):
+    """Rejeu complet des mouvements en Python : {nom: (nature, quantité, CUMP)} des stocks non nuls."""
+    borne = queries.ledger_bound(date)
+    with database.read() as conn:
+        produits = {pid: (nom, nature, cump) for pid, nom, nature, cump in
+                    conn.execute(f"SELECT id, nom, COALESCE(nature, ''), {stock.CUMP} FROM produits")}
+        mouvements = conn.execute("""SELECT produit_id, type, quantite, cump_apres FROM mouvements
+                                     WHERE date_mvt <= ? ORDER BY date_mvt, id""", (borne,)).fetchall()
+    quantites, cumps = {}, {}
+    for pid, type_mvt, quantite, cump in mouvements:
+        quantites[pid] = quantites.get(pid, 0) + (-quantite if type_mvt == "SORTIE" else quantite)
+        cumps[pid] = cump
+    return {produits[pid][0]: (produits[pid][1], q, cumps[pid] if date else produits[pid][2])
+            for pid, q in quantites.items() if q}
+
+
+@pytest.mark.parametrize("date", DATES)
+def test_inventaire_par_article(db, date):
+    _historique()
+    attendu = _attendu(date)
+    assert attendu or date == "2024-12-31"
+    lignes = services.inventory_at(date)
+    assert {nom: (nature, q) for nom, nature, q, _, _ in lignes} == {n: v[:2] for n, v in attendu.items()}
+    for nom, _, q, cump, valeur in lignes:
+        assert cump == pytest.approx(attendu[nom][2])
+        assert valeur == pytest.approx(q * cump)
+    assert [(l[1], l[0]) for l in lignes] == sorted((v[0], n) for n, v in attendu.items())   # nature, article
+
+
+def test_inventaire_par_nature_et_filtre(db):
+    _historique()
+    date = "2025-02-28"
+    par_article = services.inventory_at(date)
+    totaux = {}
+    for _, nature, q, _, valeur in par_article:
+        n, qte, val = totaux.get(nature, (0, 0, 0.0))
+        totaux[nature] = (n + 1, qte + q, val + valeur)
+    par_nature = services.inventory_at(date, axe="nature")
+    assert [r[0] for r in par_nature] == sorted(totaux)
+    for nature, n, q, valeur in par_nature:
+        assert (n, q) == totaux[nature][:2] and valeur == pytest.approx(totaux[nature][2])
+    filtre = services.inventory_at(date, nature="Fournitures")
+    assert filtre == [r for r in par_article if r[1] == "Fournitures"]
+
+
+def test_date_invalide(db):
+    with pytest.raises(ValueError):
+        services.inventory_at("31/12/2024")
+    with pytest.raises(ValueError):
+        services.inventory_at(axe="destinataire")
@@ -0,0 +1,61 @@
+import database
+import services
+from conftest import ajouter_article
+
+
+def test_modifications_regroupees(db):
+    seq = services.change_seq()
+    a = ajouter_article("Stylo", quantite=5)
+    b = ajouter_article("Crayon")
+    mvt_id, _ = services.affecter(a, 2, "RH")
+    services.delete_product(b)   # inséré puis supprimé : seulement dans les suppressions
+
+    changes = services.changes_since(seq)
+    assert not changes["reset"]
+    assert changes["seq"] == services.change_seq()
+    assert changes["produits"] == [a]
+    assert changes["produits_supprimes"] == [b]
+    assert mvt_id in changes["mouvements"]
+    assert changes["mouvements_supprimes"] == []
+
+    # Rien de nouveau : même numéro, aucune ligne (réponse sans requête, data_version inchangé)
+    for _ in range(2):
+        suite = services.changes_since(changes["seq"])
+        assert (suite["seq"], suite["reset"], suite["produits"], suite["mouvements"]) == \
+               (changes["seq"], False, [], [])
+
+
+def test_suppression_puis_reinsertion_du_meme_id(db):
+    a = ajouter_article("Stylo")
+    seq = services.change_seq()
+    with database.transaction() as conn:
+        conn.execute("DELETE FROM produits WHERE id = ?", (a,))
+        conn.execute("""INSERT INTO produits (id, nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+                        VALUES (?, 'Stylo bleu', '', 0, 0, 0, '2025-01-01', '')""", (a,))
+    changes = services.changes_since(seq)
+    assert (changes["produits"], changes["produits_supprimes"]) == ([a], [])
+
+
+def test_retard_excessif(db):
+    seq = services.change_seq()
+    for i in range(6):
+        ajouter_article(f"Article {i}")
+    changes = services.changes_since(seq, limit=5)
+    assert changes["reset"] and changes["seq"] == services.change_seq()
+    assert changes["produits"] == []
+    assert not services.changes_since(seq, limit=100)["reset"]
+
+
+def test_journal_purge_ou_remplace(db):
+    seq = services.change_seq()
+    for i in range(3):
+        ajouter_article(f"Article {i}")
+    newest = services.change_seq()
+    with database.transaction() as conn:   # entrées les plus anciennes purgées
+        conn.execute("DELETE FROM journal_modifs WHERE seq <= ?", (seq + 1,))
+    assert services.changes_since(seq)["reset"]
+    assert not services.changes_since(seq + 1)["reset"]   # la première entrée manquante était déjà lue
+
+    # Numéro plus récent que le journal (base restaurée) : rechargement
+    changes = services.changes_since(newest + 10)
+    assert changes["reset"] and changes["seq"] == newest
@@ -0,0 +1,100 @@
+import sqlite3
+
+import database
+import rapports
+import services
+import stock
+from conftest import ajouter_article
+
+# Schéma d'origine (user_version 0), avant toute migration
+BASELINE = [
+    """CREATE TABLE produits (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           nom TEXT NOT NULL,
+           nature TEXT,
+           quantite INTEGER NOT NULL DEFAULT 0,
+           prix REAL NOT NULL DEFAULT 0,
+           seuil_min INTEGER NOT NULL DEFAULT 0,
+           date_ajout TEXT NOT NULL,
+           observation TEXT
+       )""",
+    """CREATE TABLE mouvements (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           produit_id INTEGER NOT NULL,
+           type TEXT NOT NULL,
+           quantite INTEGER NOT NULL,
+           date_mvt TEXT NOT NULL,
+           service TEXT,
+           observation TEXT,
+           FOREIGN KEY (produit_id) REFERENCES produits(id)
+       )""",
+]
+
+
+def _baseline(path):
+    conn = sqlite3.connect(path)
+    for sql in BASELINE:
+        conn.execute(sql)
+    # Stocks saisis avant le journal des mouvements : l'historique ne les explique pas entièrement
+    conn.executemany("""INSERT INTO produits (nom, nature, quantite, prix, seuil_min, date_ajout, observation)
+                        VALUES (?, ?, ?, ?, 0, '2024-01-01', '')""",
+                     [("Ramette A4", "Papeterie", 40, 4.5), ("Stylo bleu", "Papeterie", 7, 0.3),
+                      ("Toner", "Informatique", 0, 80.0)])
+    conn.executemany("""INSERT INTO mouvements (produit_id, type, quantite, date_mvt, service, observation)
+                        VALUES (?, ?, ?, ?, ?, '')""",
+                     [(1, "ENTREE", 50, "2024-02-01 09:00:00", ""), (1, "SORTIE", 10, "2024-02-03 10:00:00", "RH"),
+                      (2, "SORTIE", 3, "2024-03-01 11:00:00", "Budget"), (3, "ENTREE", 2, "2024-03-02", ""),
+                      (3, "SORTIE", 2, "2024-03-05 14:00:00", "Informatique")])
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_migre_sans_ecart(tmp_path):
+    path = str(tmp_path / "magasin.db")
+    _baseline(path)
+    database.set_db_path(path)
+    services._seen.update(version=None, seq=0)
+    try:
+        database.init_db()
+        with database.read() as conn:
+            assert database.schema_version(conn) == database.MIGRATIONS[-1][0]
+            # Solde d'ouverture daté avant les mouvements existants : dernier mouvement par date
+            derniers = dict(conn.execute("""SELECT produit_id, stock_apres FROM mouvements m
+                                            WHERE id = (SELECT id FROM mouvements WHERE produit_id = m.produit_id
+                                                        ORDER BY date_mvt DESC, id DESC LIMIT 1)"""))
+            quantites = dict(conn.execute("SELECT id, quantite FROM produits"))
+        assert services.ledger_drift(full=True) == []
+        assert derniers == quantites
+        with database.read() as conn:
+            assert conn.execute("SELECT date_mvt FROM mouvements WHERE length(date_mvt) != 19").fetchall() == []
+        assert [services.stock_at(pid) for pid in sorted(quantites)] == [40, 7, 0]
+
+        # Le grand livre reste juste après de nouveaux mouvements
+        with database.transaction() as conn:
+            stock.enregistrer_mouvement(conn, 2, "ENTREE", 5, "2025-01-10 09:00:00")
+            stock.enregistrer_mouvement(conn, 1, "SORTIE", 15, "2025-01-10 10:00:00", "RH")
+        assert services.ledger_drift(full=True) == []
+        assert services.stock_at(1) == 25
+        assert services.stock_at(1, "2024-12-31") == 40
+    finally:
+        database.get_manager().close()
+
+
+def test_migration_idempotente(db):
+    with database.transaction() as conn:
+        version = database.schema_version(conn)
+        assert database.migrate(conn) == version
+
+
+def test_agregats_sans_soldes_ni_ajustements(db):
+    pid = ajouter_article("Gomme", quantite=10)   # INITIAL
+    services.update_product(pid, {"nom": "Gomme", "nature": "Fournitures", "quantite": 12, "prix": 0.0,
+                                  "seuil_min": 0, "date_ajout": "2025-01-01", "observation": ""}, 10)
+    with database.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM conso_service_mois").fetchone()[0] == 0
+    services.affecter(pid, 3, "RH")
+    with database.transaction() as conn:
+        par_trigger = conn.execute("SELECT * FROM conso_service_mois").fetchall()
+        rapports.rebuild_aggregates(conn)
+        assert conn.execute("SELECT * FROM conso_service_mois").fetchall() == par_trigger
+    assert [(service, e, s) for service, _, e, s in par_trigger] == [("RH", 0, 3)]
@@ -0,0 +1,48 @@
+import pytest
+
+import pdf_engine
+
+pypdf = pytest.importorskip("pypdf")
+
+HEADERS = ["Article", "Qté", "Observation"]
+
+
+def _lignes(n):
+    for i in range(n):
+        yield [f"Article {i}", i * 1000, "très longue observation " * 40 if i == 7 else ""]
+
+
+def _textes(path):
+    return [page.extract_text() for page in pypdf.PdfReader(path).pages]
+
+
+def test_largeurs_ramenees_a_la_page():
+    usable = pdf_engine._usable_width()
+    etroit = pdf_engine.column_widths([["a", 1]], ["Article", "Qté"])
+    assert sum(etroit) == pytest.approx(usable)
+    large = pdf_engine.column_widths([["x" * 400, 1, "y" * 50]], HEADERS)
+    assert sum(large) == pytest.approx(usable)
+    assert large[1] == min(large)   # la colonne étroite garde sa part
+
+
+def test_texte_tronque_a_la_colonne():
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    assert pdf_engine._clip(None, 50) == ""
+    assert pdf_engine._clip("Stylo", 50) == "Stylo"
+    court = pdf_engine._clip("Observation " * 20, 80)
+    assert court.endswith("…") and stringWidth(court, "Helvetica", 10) <= 80.5
+
+
+@pytest.mark.parametrize("workers, merger", [(1, True), (4, False), (2, True)])
+def test_rendu_par_parties(tmp_path, monkeypatch, workers, merger):
+    monkeypatch.setattr(pdf_engine, "PARALLEL_THRESHOLD", 100)
+    monkeypatch.setattr(pdf_engine, "PAGES_PER_PART", 2)
+    if not merger:
+        monkeypatch.setattr(pdf_engine, "_merger", lambda: None)
+    path = str(tmp_path / "export.pdf")
+    assert pdf_engine.render_table_pdf(_lignes(300), path, "Test", HEADERS, workers=workers) == 300
+    textes = _textes(path)
+    total = len(pdf_engine.paginate(300))
+    assert len(textes) == total
+    assert f"Page {total} / {total}" in textes[-1] and "Article 299" in textes[-1]
+    assert "très longue observation" in textes[0] and "…" in textes[0]
@@ -0,0 +1,50 @@
+import database
+import rapports
+import services
+import stock
+from conftest import ajouter_article
+
+
+def _agregats():
+    with database.read() as conn:
+        return {t: sorted(conn.execute(f"SELECT * FROM {t} WHERE entrees != 0 OR sorties != 0"))
+                for t in rapports.AGGREGATE_TABLES}
+
+
+def _modifier_nature(pid, nature):
+    with database.transaction() as conn:
+        conn.execute("UPDATE produits SET nature = ? WHERE id = ?", (nature, pid))
+
+
+def test_recalcul_identique_aux_triggers(db):
+    a = ajouter_article("Stylo", quantite=20, nature="Papeterie")
+    b = ajouter_article("Toner", quantite=5, nature="Informatique")
+    with database.transaction() as conn:
+        stock.enregistrer_mouvement(conn, a, "ENTREE", 10, "2025-05-02 09:00:00", prix_unitaire=1.0)
+    services.affecter(a, 4, "RH")
+    services.affecter(b, 2, "Budget")
+    _modifier_nature(a, "Fournitures")   # les mouvements déjà écrits gardent « Papeterie »
+    mvt_id, _ = services.affecter(a, 3, "RH")
+    with database.transaction() as conn:   # suppression d'un mouvement après le changement de nature
+        conn.execute("DELETE FROM mouvements WHERE id = (SELECT MIN(id) FROM mouvements WHERE type = 'SORTIE')")
+    services.delete_product(b)            # ses mouvements sont conservés (voir magasin_cli check)
+
+    par_triggers = _agregats()
+    with database.read() as conn:
+        natures = dict(conn.execute("SELECT id, nature FROM mouvements WHERE type = 'SORTIE'"))
+    assert natures[mvt_id] == "Fournitures"
+    assert "Informatique" in {n for n, *_ in par_triggers["conso_nature_mois"]}
+    assert not any(n == "Papeterie" and s for n, _, _, s in par_triggers["conso_nature_mois"])
+
+    services.rebuild_aggregates()
+    assert _agregats() == par_triggers
+
+
+def test_rapport_par_nature(db):
+    a = ajouter_article("Stylo", quantite=20, nature="Papeterie")
+    services.affecter(a, 4, "RH")
+    _modifier_nature(a, "Fournitures")
+    services.affecter(a, 1, "RH")
+    mois = stock.horodatage()[:7]
+    assert sorted(services.consumption("nature", mois, mois)) == [("Fournitures", mois, 0, 1),
+                                                                   ("Papeterie", mois, 0, 4)]
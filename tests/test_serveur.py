@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+import backends
+import serveur
+import stock
+from conftest import ajouter_article
+
+
+@pytest.fixture
+def client(db):
+    """Serveur d'inventaire sur un port libre de localhost, et son client HTTP."""
+    loop = asyncio.new_event_loop()
+    server = serveur.InventoryServer(port=0, workers=2, token="secret")
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    backend = backends.HttpBackend(f"127.0.0.1:{server.port}", token="secret", timeout=10)
+    yield backend
+    backend._connection().close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=10)
+    loop.run_until_complete(_arreter(server))
+    server.close()
+    loop.close()
+
+
+async def _arreter(server):
+    server.server.close()
+    pending = asyncio.all_tasks() - {asyncio.current_task()}   # connexions persistantes encore ouvertes
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await server.server.wait_closed()
+
+
+def test_aller_retour(client):
+    seq = client.change_seq()
+    pid = client.add_product({"nom": "Agrafeuse", "nature": "Fournitures", "quantite": 5, "prix": 12.0,
+                              "seuil_min": 1, "date_ajout": "2025-01-01", "observation": ""})
+    mvt_id, restant = client.affecter(pid, 2, "Secrétariat")
+    assert restant == 3
+    assert client.stock_at(pid) == 3
+    assert [r[0] for r in client.search_products(ids=[pid])] == ["Agrafeuse"]
+
+    with pytest.raises(stock.StockInsuffisant):
+        client.affecter(pid, 10, "Secrétariat")
+
+    changes = client.changes_since(seq)
+    assert not changes["reset"]
+    assert pid in changes["produits"]
+    assert mvt_id in changes["mouvements"]
+    assert client.changes_since(changes["seq"])["mouvements"] == []
+
+
+def test_jeton_exige(client):
+    for jeton in (None, "secre", "secrets", "sécret"):
+        intrus = backends.HttpBackend(client.url, token=jeton, timeout=10)
+        with pytest.raises(backends.ServerError, match="Jeton"):
+            intrus.change_seq()
+
+
+def test_article_inconnu(client):
+    with pytest.raises(LookupError):
+        client.stock_at(999)
@@ -0,0 +1,194 @@
+import functools
+import sqlite3
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+import database
+import diagnostics
+
+
+class QuerySignals(QObject):
+    result = pyqtSignal(int, object)   # (génération, lignes)
+    error = pyqtSignal(int, str)
+    finished = pyqtSignal(object)      # toujours émis, même après annulation
+
+
+class QueryRunnable(QRunnable):
+    """Exécute une requête de lecture sur une connexion du pool, hors du thread GUI."""
+
+    def __init__(self, generation, query, params, action=None):
+        super().__init__()
+        self.generation = generation
+        self.query = query
+        self.params = params
+        # Action de l'interface à laquelle la requête est attribuée (diagnostics)
+        self.action = diagnostics.current_action() or action
+        self.signals = QuerySignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.signals.finished.emit(self)
+
+    def _run(self):
+        if self._cancelled.is_set():
+            return
+        try:
+            with diagnostics.action(self.action):
+                rows = self._fetch()
+        except sqlite3.OperationalError as e:
+            if not self._cancelled.is_set():
+                self.signals.error.emit(self.generation, str(e))
+            return
+        except Exception as e:
+            self.signals.error.emit(self.generation, str(e))
+            return
+        if not self._cancelled.is_set():
+            self.signals.result.emit(self.generation, rows)
+
+    def _fetch(self):
+        with database.read() as conn:
+            # Le handler interrompt la requête SQLite dès qu'une recherche plus récente arrive
+            conn.set_progress_handler(self._cancelled.is_set, 1000)
+            try:
+                return conn.execute(self.query, self.params).fetchall()
+            finally:
+                conn.set_progress_handler(None, 0)
+
+
+class CallRunnable(QueryRunnable):
+    """Variante de QueryRunnable qui appelle une fonction (ex. requête au serveur d'inventaire).
+
+    L'appel en cours n'est pas interrompu : une annulation fait seulement ignorer son résultat.
+    """
+
+    def __init__(self, generation, func, action=None):
+        super().__init__(generation, None, None, action)
+        self.func = func
+
+    def _fetch(self):
+        return self.func()
+
+
+def runnable_for(generation, request, action=None):
+    """Runnable d'une requête de backend : couple (sql, params) ou appel sans argument."""
+    if callable(request):
+        return CallRunnable(generation, request, action)
+    query, params = request
+    return QueryRunnable(generation, query, params, action)
+
+
+class SearchController(QObject):
+    """Recherche temporisée (debounce) exécutée dans un QThreadPool.
+
+    Seul le résultat de la dernière requête soumise est émis : les requêtes
+    précédentes sont annulées et leurs résultats ignorés.
+    """
+    results = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    # query_builder() renvoie (sql, params) ou un appel sans argument (voir backends)
+    def __init__(self, query_builder, debounce_ms=250, parent=None, action="recherche"):
+        super().__init__(parent)
+        self.query_builder = query_builder
+        self.action = action
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self._generation = 0
+        self._current = None
+        self._active = set()   # garde les runnables en vie jusqu'à la fin de leur exécution
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self.run)
+
+    def pending(self):
+        """Vrai si une recherche est programmée ou en cours : son résultat remplacera la vue."""
+        return self._current is not None or self._timer.isActive()
+
+    def schedule(self, *args):
+        # Relance le minuteur à chaque frappe ; la requête part quand la saisie se calme
+        self._timer.start()
+
+    def run(self):
+        self._timer.stop()
+        if self._current is not None:
+            self._current.cancel()
+        self._generation += 1
+        runnable = runnable_for(self._generation, self.query_builder(), self.action)
+        runnable.signals.result.connect(self._on_result)
+        runnable.signals.error.connect(self._on_error)
+        runnable.signals.finished.connect(self._active.discard)
+        self._active.add(runnable)
+        self._current = runnable
+        self.pool.start(runnable)
+
+    def _on_result(self, generation, rows):
+        if generation != self._generation:
+            return   # résultat obsolète
+        self._current = None
+        self.results.emit(rows)
+
+    def _on_error(self, generation, message):
+        if generation == self._generation:
+            self._current = None
+            self.failed.emit(message)
+
+
+class ChangeFeed(QObject):
+    """Scrute le journal des modifications (services.changes_since) et diffuse les changements.
+
+    Une seule instance par fenêtre principale ; les vues ouvertes (inventaire, historiques,
+    rapports) s'abonnent à `changed` et n'appliquent que les lignes concernées.
+    `poll()` force une lecture immédiate, par exemple juste après une écriture.
+    """
+    changed = pyqtSignal(object)   # dict de services.changes_since
+
+    def __init__(self, backend, interval_ms=1000, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.seq = None
+        self._running = None
+        self._again = False
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        if self.seq is None:
+            self.seq = self.backend.change_seq()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def poll(self):
+        if self.seq is None:
+            return
+        if self._running is not None:
+            self._again = True   # une lecture est en cours : une autre suivra
+            return
+        runnable = CallRunnable(self.seq, functools.partial(self.backend.changes_since, self.seq), "modifications")
+        runnable.signals.result.connect(self._on_result)
+        runnable.signals.finished.connect(self._on_finished)
+        self._running = runnable
+        self.pool.start(runnable)
+
+    def _on_result(self, seq, changes):
+        self.seq = changes["seq"]
+        if changes["reset"] or any(changes[k] for k in ("produits", "produits_supprimes",
+                                                         "mouvements", "mouvements_supprimes")):
+            self.changed.emit(changes)
+
+    def _on_finished(self, runnable):
+        self._running = None
+        if self._again:
+            self._again = False
+            self.poll()